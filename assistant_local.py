@@ -0,0 +1,68 @@
+import os
+from web_search import WebSearcher
+from intent_rules import extract_entities
+from assistant_openai import AssistantResponse
+import intent_model
+import request_log
+import calibration
+
+class LocalModelPersonalAssistant:
+    """Assistant backed by the local hashed n-gram intent model
+
+    Sits between the rule-based fallback and the LLM backends: the intent
+    and its probability come from the trained model, entities come from the
+    rule-based extractors for that intent.
+    """
+
+    def __init__(self, model_path=None, web_searcher=None):
+        self.model_path = model_path or intent_model.DEFAULT_MODEL_PATH
+        self.web_searcher = web_searcher or WebSearcher()
+
+    @staticmethod
+    def is_available():
+        if os.path.exists(intent_model.DEFAULT_MODEL_PATH):
+            return True, "Local model ready"
+        return False, "No trained model (run: python intent_model.py train data.jsonl)"
+
+    def process_input(self, user_input, existing_entities=None, session_id=None, deadline=None):
+        with request_log.collect_timings() as timings:
+            response = self._process_input(user_input, existing_entities, deadline)
+        response.metadata["timings"] = timings
+        return calibration.apply(response, "local")
+
+    def _process_input(self, user_input, existing_entities=None, deadline=None):
+        # A missing model is a configuration error, not an unsure answer: raise it so callers fall back to the rules
+        model = intent_model.get_model(self.model_path)
+        if model is None:
+            raise ValueError(f"Model file not found: {self.model_path}")
+
+        try:
+            with request_log.stage("classify"):
+                intent, confidence = model.predict(user_input)
+                entities = extract_entities(user_input, intent)
+
+            # Keep answers collected so far over freshly extracted values
+            if existing_entities:
+                entities.update({k: v for k, v in existing_entities.items() if v})
+
+            if intent == "other":
+                with request_log.stage("search"):
+                    search_results = self.web_searcher.get_search_summary(user_input, deadline=deadline)
+                entities["web_search_performed"] = True
+                entities["search_query"] = user_input
+                entities["ai_response"] = f"Based on web search results:\n\n{search_results}"
+
+            return AssistantResponse(
+                intent_category=intent,
+                entities=entities,
+                confidence_score=confidence,
+                follow_up_questions=[]
+            )
+
+        except Exception:
+            return AssistantResponse(
+                intent_category="other",
+                entities={},
+                confidence_score=0.0,
+                follow_up_questions=["Could you rephrase that?"]
+            )
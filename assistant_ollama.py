@@ -1,18 +1,46 @@
 import json
+import os
 import re
+import time
+import requests
 from web_search import WebSearcher
+import semantic_cache
+import model_router
+import prompt_builder
+import request_log
+import calibration
+import intent_schema
+import segmentation
+import search_prefetch
+from single_flight import SingleFlight
+import query_normalizer
+from deadline import MIN_GENERATION_BUDGET, stage_timeout
+
+# Coalesces identical in-flight requests across all sessions in this process
+_flight = SingleFlight()
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# How long Ollama keeps a model loaded after a request; warmup.py preloads with the same value
+OLLAMA_KEEP_ALIVE = os.getenv("NLPARSE_OLLAMA_KEEP_ALIVE", "30m")
 
 class OllamaPersonalAssistant:
-    def __init__(self, model="llama3.2:3b"):
+    def __init__(self, model="llama3.2:3b", classify_cache=None, response_cache=None, router=None,
+                 session=None, web_searcher=None):
         self.model = model
-        self.url = "http://localhost:11434"
-        self.web_searcher = WebSearcher()
+        # Sends simple requests to a smaller model (enabled via NLPARSE_OLLAMA_SMALL_MODEL)
+        self.router = router or model_router.from_env(model)
+        self.url = OLLAMA_URL
+        # Keep-alive connections to Ollama across calls
+        self.session = session or requests.Session()
+        self.web_searcher = web_searcher or WebSearcher()
+        # Semantic caches for paraphrased requests (enabled via NLPARSE_SEMANTIC_CACHE)
+        self.classify_cache = classify_cache or semantic_cache.from_env("classify")
+        self.response_cache = response_cache or semantic_cache.from_env("response")
 
     @staticmethod
     def is_available():
         try:
-            import requests
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
+            response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
             if response.status_code == 200:
                 models = response.json().get("models", [])
                 if any("llama3.2" in m["name"] for m in models):
@@ -21,57 +49,31 @@ class OllamaPersonalAssistant:
         except:
             return False, "Ollama not running"
 
-    def process_input(self, user_input, existing_entities=None):
+    def process_input(self, user_input, existing_entities=None, session_id=None, deadline=None):
+        with prompt_builder.collect() as prompts, request_log.collect_timings() as timings:
+            response = self._process_input(user_input, existing_entities, deadline)
+        response.metadata.update(prompts=prompts, timings=timings, prompt_version=prompt_builder.PROMPT_VERSION)
+        return calibration.apply(response, "ollama")
+
+    def _process_input(self, user_input, existing_entities=None, deadline=None):
+        # Likely "other" requests start their web search now, off the critical path
+        prefetch = None if existing_entities else search_prefetch.start(self.web_searcher, user_input, deadline)
         try:
-            result = self._classify(user_input, existing_entities)
+            with request_log.stage("classify"):
+                result = self._classify(user_input, existing_entities, deadline)
             
-            followups = []
-            intent = result["intent_category"]
             entities = result["entities"]
             
             # Merge with existing
             if existing_entities:
                 entities.update(existing_entities)
             
-            # Handle "other" intent with web search
-            if intent == "other":
-                # Perform web search for the query
-                search_results = self.web_searcher.get_search_summary(user_input)
-                
-                # Use AI to generate a helpful response based on web search
-                web_response = self._generate_web_search_response(user_input, search_results)
-                
-                # Update entities with web search information
-                entities["web_search_performed"] = True
-                entities["search_query"] = user_input
-                entities["ai_response"] = web_response
-                
-                # Return with high confidence since we have web results
-                from assistant_openai import AssistantResponse
-                return AssistantResponse(
-                    intent_category=intent,
-                    entities=entities,
-                    confidence_score=0.85,  # High confidence with web results
-                    follow_up_questions=[]
-                )
-            
-            # Check for missing info
-            if intent == "dining":
-                if not entities.get("cuisine"):
-                    followups.append("What type of cuisine?")
-                elif not entities.get("party_size"):
-                    followups.append("How many people?")
-            
-            # Use the same response class structure as OpenAI assistant
-            from assistant_openai import AssistantResponse
-            return AssistantResponse(
-                intent_category=intent,
-                entities=entities,
-                confidence_score=result["confidence_score"],
-                follow_up_questions=followups
-            )
+            return self._respond(user_input, result["intent_category"], entities, result["confidence_score"], deadline,
+                                 prefetch)
             
         except Exception:
+            if prefetch:
+                prefetch.drop()
             from assistant_openai import AssistantResponse
             return AssistantResponse(
                 intent_category="other",
@@ -80,91 +82,194 @@ class OllamaPersonalAssistant:
                 follow_up_questions=["Could you rephrase that?"]
             )
 
-    def _classify(self, user_input, existing_entities=None):
-        # Build context if we have existing entities
-        context = ""
-        if existing_entities and any(v for v in existing_entities.values() if v):
-            context = f"\nPrevious context: {json.dumps(existing_entities)}"
-            context += "\n(Increase confidence based on accumulated information)"
+    def _respond(self, user_input, intent, entities, confidence_score, deadline=None, prefetch=None):
+        # Use the same response class structure as OpenAI assistant
+        from assistant_openai import AssistantResponse
+        
+        # Handle "other" intent with web search
+        if intent == "other":
+            web_response = self._cached_web_search_response(user_input, deadline, prefetch)
+            
+            # Update entities with web search information
+            entities["web_search_performed"] = True
+            entities["search_query"] = user_input
+            entities["ai_response"] = web_response
             
-        prompt = f"""Classify this request and extract entities:
+            # Return with high confidence since we have web results
+            return AssistantResponse(
+                intent_category=intent,
+                entities=entities,
+                confidence_score=0.85,  # High confidence with web results
+                follow_up_questions=[]
+            )
+        
+        if prefetch:
+            prefetch.drop()
+        
+        # Ask for the first missing required field
+        followups, _ = intent_schema.follow_ups(intent, entities or {}, limit=1)
+        
+        return AssistantResponse(
+            intent_category=intent,
+            entities=entities,
+            confidence_score=confidence_score,
+            follow_up_questions=followups
+        )
+
+    def process_frames(self, user_input, session_id=None, deadline=None):
+        """Classify every request in a compound input with one call to the large model
+
+        Raises if the call fails or returns no usable frames, so the caller
+        can fall back to classifying the clauses separately.
+        """
+        with prompt_builder.collect() as prompts, request_log.collect_timings() as timings:
+            with request_log.stage("classify"):
+                prompt = prompt_builder.build("classify_frames", user_input)
+                result = self._classify_on(self.router.routes["large"], prompt, deadline)
+                if result is None:
+                    raise ValueError("Ollama multi-request classification failed")
+                frames = segmentation.parse_frames(json.dumps(result))
+            # Frames are independent (one may need a web search), so they are answered in parallel
+            responses = segmentation.classify_clauses(frames, lambda frame: self._respond(
+                frame["text"] or user_input, frame["intent_category"], frame["entities"],
+                frame["confidence_score"], deadline))
+        for frame, response in zip(frames, responses):
+            response.metadata.update(segment=frame["text"] or user_input, prompts=prompts, timings=timings,
+                                     prompt_version=prompt_builder.PROMPT_VERSION)
+            calibration.apply(response, "ollama")
+        return responses
 
-Categories: dining, travel, gifting, cab_booking, other
+    def _classify(self, user_input, existing_entities=None, deadline=None):
+        # Paraphrase cache only applies to context-free requests
+        has_context = existing_entities and any(v for v in existing_entities.values() if v)
+        if not self.classify_cache or has_context:
+            return self._coalesced_classify(user_input, existing_entities, deadline)
 
-Request: "{user_input}"{context}
+        hit = self.classify_cache.get(user_input, deadline)
+        if hit and not self.classify_cache.should_audit():
+            return semantic_cache.cached_classification(hit, user_input)
 
-Calculate confidence_score (0.0-1.0) based on:
-1. Intent clarity (0.2-0.5): How clearly the request matches a category
-2. Entity completeness (0.0-0.4): How many required entities are found
-   - dining: cuisine, party_size, date, time
-   - travel: destination, departure_date, number_of_travelers
-   - gifting: recipient, occasion, budget
-   - cab_booking: pickup_location, destination, date, time
-3. Quality bonus (0.0-0.1): Well-formatted data, specific details
+        result = self._coalesced_classify(user_input, existing_entities, deadline)
+        if hit:
+            self.classify_cache.audit(hit, result, same=semantic_cache.same_intent)
+        elif result.get("confidence_score"):
+            self.classify_cache.put(user_input, {
+                "intent_category": result.get("intent_category"),
+                "entities": result.get("entities") or {},
+                "confidence_score": result.get("confidence_score")
+            }, deadline)
+        return result
 
-Examples:
-- "Book Italian restaurant" = 0.4
-- "Book Italian restaurant for 4 tomorrow 8pm" = 0.9
-- "I need something" = 0.1
+    def _coalesced_classify(self, user_input, existing_entities=None, deadline=None):
+        context_key = json.dumps(existing_entities or {}, sort_keys=True, default=str)
+        # The route is chosen once: it is part of the single-flight key and the call uses it
+        route = self.router.choose(user_input)
+        key = ("classify", route.model, query_normalizer.normalize(user_input), context_key)
+        return _flight.do(key, self._classify_llm, user_input, route, existing_entities, deadline)
 
-Return JSON with intent_category, entities dict, confidence_score."""
+    def _classify_llm(self, user_input, route, existing_entities=None, deadline=None):
+        prompt = prompt_builder.build("ollama_classify", user_input, existing_entities)
         
+        result = self._classify_on(route, prompt, deadline)
+        if self.router.should_escalate(route, result):
+            self.router.escalated(route)
+            result = self._classify_on(self.router.routes["large"], prompt, deadline)
+
+        return result or {
+            "intent_category": "other",
+            "entities": {},
+            "confidence_score": 0.0
+        }
+
+    def _classify_on(self, route, prompt, deadline=None):
+        """Run the classification prompt on one route's model; None if it fails"""
+        start = time.monotonic()
+        result = None
         try:
-            import requests
-            response = requests.post(
+            if deadline is not None:
+                deadline.check("classification")
+            response = self.session.post(
                 f"{self.url}/api/generate",
                 json={
-                    "model": self.model,
+                    "model": route.model,
                     "prompt": prompt,
                     "stream": False,
-                    "format": "json"
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
+                    "format": "json",
+                    "options": route.options
                 },
-                timeout=30
+                timeout=stage_timeout(deadline, route.timeout)
             )
             
-            if response.status_code == 200:
+            if response.status_code == 404:
+                # Model not pulled
+                self.router.disable(route.name)
+            elif response.status_code == 200:
                 result_text = response.json().get("response", "")
                 json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
                 if json_match:
-                    return json.loads(json_match.group())
-            
-            # Fallback
-            return {
-                "intent_category": "other",
-                "entities": {},
-                "confidence_score": 0.3
-            }
-            
-        except:
-            return {
-                "intent_category": "other", 
-                "entities": {},
-                "confidence_score": 0.0
-            } 
+                    result = json.loads(json_match.group())
+        except Exception:
+            pass
 
-    def _generate_web_search_response(self, query: str, search_results: str) -> str:
-        """Generate a helpful response based on web search results"""
-        prompt = f"""Based on web search results, provide a helpful response.
+        self.router.record(route, time.monotonic() - start, result)
+        return result
+
+    def _cached_web_search_response(self, query: str, deadline=None, prefetch=None) -> str:
+        """Search and generate an answer, reusing the answer for paraphrased queries"""
+        hit = self.response_cache.get(query, deadline) if self.response_cache else None
+        if hit and not self.response_cache.should_audit():
+            if prefetch:
+                prefetch.drop()
+            return hit.value
+
+        search_results, web_response = _flight.do(
+            ("web", self.router.choose(query, task="answer").model, query_normalizer.normalize(query)),
+            self._search_and_answer, query, deadline, prefetch
+        )
+        if prefetch:
+            # Another request with the same query did the search
+            prefetch.drop()
 
-User Query: {query}
+        if hit:
+            self.response_cache.audit(hit, web_response, same=semantic_cache.similar_text)
+        elif self.response_cache and web_response != self._web_search_fallback(query, search_results):
+            self.response_cache.put(query, web_response, deadline)
+        return web_response
 
-Web Search Results:
-{search_results}
+    def _search_and_answer(self, query: str, deadline=None, prefetch=None):
+        # Perform web search for the query, unless it was prefetched during classification
+        with request_log.stage("search"):
+            search_results = prefetch.take(deadline) if prefetch else None
+            if search_results is None:
+                search_results = self.web_searcher.get_search_summary(query, deadline=deadline)
 
-Provide a clear, informative answer that synthesizes the search results. Include specific steps if found. Be helpful and conversational."""
+        # Use AI to generate a helpful response based on web search
+        with request_log.stage("generate"):
+            return search_results, self._generate_web_search_response(query, search_results, deadline)
 
+    def _generate_web_search_response(self, query: str, search_results: str, deadline=None) -> str:
+        """Generate a helpful response based on web search results"""
+        # Too little time left to generate; hand back the raw search results instead
+        if deadline is not None and deadline.remaining() < MIN_GENERATION_BUDGET:
+            return self._web_search_fallback(query, search_results)
+
+        prompt = prompt_builder.build("ollama_web_answer", query, search_results=search_results)
+
+        route = self.router.choose(query, task="answer")
         try:
-            import requests
-            response = requests.post(
+            response = self.session.post(
                 f"{self.url}/api/generate",
                 json={
-                    "model": self.model,
+                    "model": route.model,
                     "prompt": prompt,
                     "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
                     "temperature": 0.7,
-                    "max_tokens": 500
+                    "max_tokens": 500,
+                    "options": route.options
                 },
-                timeout=30
+                timeout=stage_timeout(deadline, route.timeout)
             )
             
             if response.status_code == 200:
@@ -173,4 +278,7 @@ Provide a clear, informative answer that synthesizes the search results. Include
             pass
         
         # Fallback response if AI fails
-        return f"I found some information about '{query}' from web search:\n\n{search_results}\n\nPlease review the search results above for relevant information." 
\ No newline at end of file
+        return self._web_search_fallback(query, search_results)
+
+    def _web_search_fallback(self, query: str, search_results: str) -> str:
+        return f"I found some information about '{query}' from web search:\n\n{search_results}\n\nPlease review the search results above for relevant information."
@@ -1,27 +1,62 @@
 import os
 import json
 import re
+import time
 from web_search import WebSearcher
+import semantic_cache
+from single_flight import SingleFlight
+import query_normalizer
+from deadline import MIN_GENERATION_BUDGET
+import rate_limiter
+import prompt_builder
+import request_log
+import calibration
+import intent_schema
+import segmentation
+import search_prefetch
+
+# Coalesces identical in-flight requests across all sessions in this process
+_flight = SingleFlight()
+
+# OpenAI limits apply per API key, so every session in the process shares one limiter
+_limiter = rate_limiter.RateLimiter(
+    requests_per_minute=float(os.getenv("OPENAI_RPM", "3500")),
+    tokens_per_minute=float(os.getenv("OPENAI_TPM", "90000"))
+)
+spend = rate_limiter.SpendTracker(
+    max_session_tokens=int(os.getenv("OPENAI_SESSION_TOKEN_BUDGET")) if os.getenv("OPENAI_SESSION_TOKEN_BUDGET") else None
+)
+QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "30"))
 
 class AssistantResponse:
-    def __init__(self, intent_category, entities, confidence_score, follow_up_questions=None):
+    def __init__(self, intent_category, entities, confidence_score, follow_up_questions=None, metadata=None):
         self.intent_category = intent_category
         self.entities = entities  
         self.confidence_score = confidence_score
         self.follow_up_questions = follow_up_questions or []
+        # Per-call diagnostics (e.g. prompt sizes); not part of the classification
+        self.metadata = metadata or {}
 
 class OpenAIPersonalAssistant:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, classify_cache=None, response_cache=None, client=None, web_searcher=None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("Need OpenAI API key")
         
-        try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=self.api_key)
-            self.web_searcher = WebSearcher()
-        except ImportError:
-            raise ValueError("OpenAI package not installed")
+        self.web_searcher = web_searcher or WebSearcher()
+        if client is not None:
+            self.client = client
+        else:
+            try:
+                from openai import OpenAI
+                # Retries are handled by rate_limiter.call_with_retry
+                self.client = OpenAI(api_key=self.api_key, max_retries=0)
+            except ImportError:
+                raise ValueError("OpenAI package not installed")
+        
+        # Semantic caches for paraphrased requests (enabled via NLPARSE_SEMANTIC_CACHE)
+        self.classify_cache = classify_cache or semantic_cache.from_env("classify")
+        self.response_cache = response_cache or semantic_cache.from_env("response")
 
     @staticmethod
     def is_available():
@@ -30,63 +65,30 @@ class OpenAIPersonalAssistant:
             return True, "OpenAI ready"
         return False, "No API key"
 
-    def process_input(self, user_input, existing_entities=None):
+    def process_input(self, user_input, existing_entities=None, session_id=None, deadline=None):
+        # Bill every OpenAI call made for this input to the caller's session
+        token = rate_limiter.current_session.set(session_id)
         try:
-            result = self._classify(user_input, existing_entities)
-            
-            followups = []
-            intent = result["intent_category"]
-            entities = result["entities"]
-            
-            # Handle "other" intent with web search
-            if intent == "other":
-                # Perform web search for the query
-                search_results = self.web_searcher.get_search_summary(user_input)
-                
-                # Use AI to generate a helpful response based on web search
-                web_response = self._generate_web_search_response(user_input, search_results)
-                
-                # Update entities with web search information
-                entities = entities or {}
-                entities["web_search_performed"] = True
-                entities["search_query"] = user_input
-                entities["ai_response"] = web_response
-                
-                # Return with high confidence since we have web results
-                return AssistantResponse(
-                    intent_category=intent,
-                    entities=entities,
-                    confidence_score=0.85,  # High confidence with web results
-                    follow_up_questions=[]
-                )
-            
-            # Check for missing info
-            if intent == "dining":
-                if not entities.get("cuisine"):
-                    followups.append("What type of cuisine?")
-                elif not entities.get("party_size"):
-                    followups.append("How many people?")
-                elif not entities.get("date"):
-                    followups.append("What date?")
-                elif not entities.get("time"):
-                    followups.append("What time?")
-            
-            elif intent == "travel":
-                if not entities.get("destination"):
-                    followups.append("Where to?")
-                elif not entities.get("departure_date"):
-                    followups.append("When?")
-                elif not entities.get("number_of_travelers"):
-                    followups.append("How many travelers?")
+            with prompt_builder.collect() as prompts, request_log.collect_timings() as timings:
+                response = self._process_input(user_input, existing_entities, deadline)
+            response.metadata.update(prompts=prompts, timings=timings, prompt_version=prompt_builder.PROMPT_VERSION)
+            return calibration.apply(response, "openai")
+        finally:
+            rate_limiter.current_session.reset(token)
+
+    def _process_input(self, user_input, existing_entities=None, deadline=None):
+        # Likely "other" requests start their web search now, off the critical path
+        prefetch = None if existing_entities else search_prefetch.start(self.web_searcher, user_input, deadline)
+        try:
+            with request_log.stage("classify"):
+                result = self._classify(user_input, existing_entities, deadline)
             
-            return AssistantResponse(
-                intent_category=result["intent_category"],
-                entities=result["entities"],
-                confidence_score=result["confidence_score"],
-                follow_up_questions=followups
-            )
+            return self._respond(user_input, result["intent_category"], result["entities"],
+                                 result["confidence_score"], deadline, prefetch)
             
         except Exception:
+            if prefetch:
+                prefetch.drop()
             return AssistantResponse(
                 intent_category="other",
                 entities={},
@@ -94,50 +96,93 @@ class OpenAIPersonalAssistant:
                 follow_up_questions=["Could you rephrase that?"]
             )
 
-    def _classify(self, user_input, existing_entities=None):
-        # Build context if we have existing entities
-        context = ""
-        if existing_entities and any(v for v in existing_entities.values() if v):
-            context = f"\nPrevious context: {json.dumps(existing_entities)}"
-            context += "\n(Increase confidence based on accumulated information)"
+    def _respond(self, user_input, intent, entities, confidence_score, deadline=None, prefetch=None):
+        # Handle "other" intent with web search
+        if intent == "other":
+            web_response = self._cached_web_search_response(user_input, deadline, prefetch)
+            
+            # Update entities with web search information
+            entities = entities or {}
+            entities["web_search_performed"] = True
+            entities["search_query"] = user_input
+            entities["ai_response"] = web_response
+            
+            # Return with high confidence since we have web results
+            return AssistantResponse(
+                intent_category=intent,
+                entities=entities,
+                confidence_score=0.85,  # High confidence with web results
+                follow_up_questions=[]
+            )
+        
+        if prefetch:
+            prefetch.drop()
         
-        prompt = f"""Classify this request into one of these categories:
-- dining (restaurants, food)
-- travel (trips, hotels)  
-- gifting (gifts, presents)
-- cab_booking (rides, taxis)
-- other (everything else)
-
-Extract relevant entities like dates, times, numbers, locations.
-
-Request: "{user_input}"{context}
-
-Calculate confidence_score (0.0-1.0) based on:
-1. Intent clarity (0.2-0.5): How clearly the request matches a category
-   - Multiple matching keywords = higher score
-   - Ambiguous request = lower score
-2. Entity completeness (0.0-0.4): How many required entities are found
-   - dining: cuisine, party_size, date, time
-   - travel: destination, departure_date, number_of_travelers  
-   - gifting: recipient, occasion, budget
-   - cab_booking: pickup_location, destination, date, time
-3. Quality bonus (0.0-0.1): Well-formatted dates/times, specific details
-
-Example scores:
-- "Book Italian restaurant" = 0.4 (clear intent, missing details)
-- "Book Italian restaurant for 4 tomorrow 8pm" = 0.9 (clear + complete)
-- "I need something" = 0.1 (vague intent, no entities)
-
-Return JSON with intent_category, entities dict, and confidence_score."""
+        # Ask for the first missing required field
+        followups, _ = intent_schema.follow_ups(intent, entities or {}, limit=1)
         
+        return AssistantResponse(
+            intent_category=intent,
+            entities=entities,
+            confidence_score=confidence_score,
+            follow_up_questions=followups
+        )
+
+    def process_frames(self, user_input, session_id=None, deadline=None):
+        """Classify every request in a compound input with one LLM call; one response per request
+
+        Raises if the call fails or returns no usable frames, so the caller
+        can fall back to classifying the clauses separately.
+        """
+        token = rate_limiter.current_session.set(session_id)
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1
-            )
-            
-            result_text = response.choices[0].message.content.strip()
+            with prompt_builder.collect() as prompts, request_log.collect_timings() as timings:
+                with request_log.stage("classify"):
+                    prompt = prompt_builder.build("classify_frames", user_input)
+                    frames = segmentation.parse_frames(self._chat(prompt, temperature=0.1, deadline=deadline))
+                # Frames are independent (one may need a web search), so they are answered in parallel
+                responses = segmentation.classify_clauses(frames, lambda frame: self._respond(
+                    frame["text"] or user_input, frame["intent_category"], frame["entities"],
+                    frame["confidence_score"], deadline))
+            for frame, response in zip(frames, responses):
+                response.metadata.update(segment=frame["text"] or user_input, prompts=prompts, timings=timings,
+                                         prompt_version=prompt_builder.PROMPT_VERSION)
+                calibration.apply(response, "openai")
+            return responses
+        finally:
+            rate_limiter.current_session.reset(token)
+
+    def _classify(self, user_input, existing_entities=None, deadline=None):
+        # Paraphrase cache only applies to context-free requests
+        has_context = existing_entities and any(v for v in existing_entities.values() if v)
+        if not self.classify_cache or has_context:
+            return self._coalesced_classify(user_input, existing_entities, deadline)
+
+        hit = self.classify_cache.get(user_input, deadline)
+        if hit and not self.classify_cache.should_audit():
+            return semantic_cache.cached_classification(hit, user_input)
+
+        result = self._coalesced_classify(user_input, existing_entities, deadline)
+        if hit:
+            self.classify_cache.audit(hit, result, same=semantic_cache.same_intent)
+        elif result.get("confidence_score"):
+            self.classify_cache.put(user_input, {
+                "intent_category": result.get("intent_category"),
+                "entities": result.get("entities") or {},
+                "confidence_score": result.get("confidence_score")
+            }, deadline)
+        return result
+
+    def _coalesced_classify(self, user_input, existing_entities=None, deadline=None):
+        context_key = json.dumps(existing_entities or {}, sort_keys=True, default=str)
+        key = ("classify", query_normalizer.normalize(user_input), context_key)
+        return _flight.do(key, self._classify_llm, user_input, existing_entities, deadline)
+
+    def _classify_llm(self, user_input, existing_entities=None, deadline=None):
+        prompt = prompt_builder.build("openai_classify", user_input, existing_entities)
+        
+        try:
+            result_text = self._chat(prompt, temperature=0.1, deadline=deadline)
             
             # Parse JSON from response
             json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
@@ -154,41 +199,90 @@ Return JSON with intent_category, entities dict, and confidence_score."""
                 
             return result
             
-        except:
+        except Exception as e:
+            print(f"OpenAI classification failed: {e}")
             return {
                 "intent_category": "other",
                 "entities": existing_entities or {},
                 "confidence_score": 0.0
             } 
 
-    def _generate_web_search_response(self, query: str, search_results: str) -> str:
-        """Generate a helpful response based on web search results"""
-        prompt = f"""Based on the following web search results, provide a helpful and informative response to the user's query.
+    def _cached_web_search_response(self, query: str, deadline=None, prefetch=None) -> str:
+        """Search and generate an answer, reusing the answer for paraphrased queries"""
+        hit = self.response_cache.get(query, deadline) if self.response_cache else None
+        if hit and not self.response_cache.should_audit():
+            if prefetch:
+                prefetch.drop()
+            return hit.value
 
-User Query: {query}
+        search_results, web_response = _flight.do(
+            ("web", query_normalizer.normalize(query)), self._search_and_answer, query, deadline, prefetch
+        )
+        if prefetch:
+            # Another request with the same query did the search
+            prefetch.drop()
 
-Web Search Results:
-{search_results}
+        if hit:
+            self.response_cache.audit(hit, web_response, same=semantic_cache.similar_text)
+        elif self.response_cache and web_response != self._web_search_fallback(query, search_results):
+            self.response_cache.put(query, web_response, deadline)
+        return web_response
 
-Instructions:
-1. Synthesize the information from the search results
-2. Provide a clear, concise, and helpful answer
-3. If the search results contain specific steps or procedures, include them
-4. Mention the sources when providing specific information
-5. Be conversational and helpful
-6. If the search results don't fully answer the question, acknowledge this
+    def _search_and_answer(self, query: str, deadline=None, prefetch=None):
+        # Perform web search for the query, unless it was prefetched during classification
+        with request_log.stage("search"):
+            search_results = prefetch.take(deadline) if prefetch else None
+            if search_results is None:
+                search_results = self.web_searcher.get_search_summary(query, deadline=deadline)
 
-Response:"""
+        # Use AI to generate a helpful response based on web search
+        with request_log.stage("generate"):
+            return search_results, self._generate_web_search_response(query, search_results, deadline)
+
+    def _generate_web_search_response(self, query: str, search_results: str, deadline=None) -> str:
+        """Generate a helpful response based on web search results"""
+        # Too little time left to generate; hand back the raw search results instead
+        if deadline is not None and deadline.remaining() < MIN_GENERATION_BUDGET:
+            return self._web_search_fallback(query, search_results)
+
+        prompt = prompt_builder.build("openai_web_answer", query, search_results=search_results)
 
         try:
-            response = self.client.chat.completions.create(
+            return self._chat(prompt, temperature=0.7, max_tokens=500, deadline=deadline)
+        except Exception as e:
+            print(f"OpenAI web search response failed: {e}")
+            # Fallback response if AI fails
+            return self._web_search_fallback(query, search_results)
+
+    def _chat(self, prompt: str, temperature: float, max_tokens: int = None, deadline=None) -> str:
+        """Send one chat completion through the shared rate limiter"""
+        params = {"max_tokens": max_tokens} if max_tokens else {}
+        queue_deadline = time.monotonic() + QUEUE_TIMEOUT
+        if deadline is not None:
+            deadline.check("OpenAI call")
+            # Time spent queueing and the HTTP call itself both come out of the request budget
+            queue_deadline = min(queue_deadline, deadline.expires_at)
+
+        def create():
+            if deadline is not None:
+                params["timeout"] = deadline.remaining()
+            return self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=500
+                temperature=temperature,
+                **params
             )
-            
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            # Fallback response if AI fails
-            return f"I found some information about '{query}' from web search:\n\n{search_results}\n\nPlease review the search results above for relevant information." 
\ No newline at end of file
+
+        # Reserve the prompt plus the expected completion up front
+        estimated_tokens = rate_limiter.estimate_tokens(prompt) + (max_tokens or 300)
+        response = rate_limiter.call_with_retry(
+            create,
+            limiter=_limiter,
+            estimated_tokens=estimated_tokens,
+            spend=spend,
+            deadline=queue_deadline
+        )
+        return response.choices[0].message.content.strip()
+
+    def _web_search_fallback(self, query: str, search_results: str) -> str:
+        return f"I found some information about '{query}' from web search:\n\n{search_results}\n\nPlease review the search results above for relevant information."
@@ -0,0 +1,88 @@
+import os
+import threading
+from typing import Any, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from web_search import WebSearcher
+
+# Connections kept open per host in each shared HTTP session; size for the number of concurrent requests
+POOL_SIZE = int(os.getenv("NLPARSE_HTTP_POOL_SIZE", "32"))
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_assistants: Dict[str, Any] = {}
+_searcher = None
+
+
+def http_session(name: str) -> requests.Session:
+    """Process-wide keep-alive session for one kind of upstream ("ollama", "search", ...)
+
+    requests.Session is safe to share for plain requests; its urllib3 pool
+    hands each concurrent request its own connection.
+    """
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[name] = session
+        return session
+
+
+def web_searcher() -> WebSearcher:
+    """The process-wide WebSearcher, on the shared "search" session"""
+    global _searcher
+    if _searcher is None:
+        searcher = WebSearcher(session=http_session("search"))
+        with _lock:
+            if _searcher is None:
+                _searcher = searcher
+    return _searcher
+
+
+def _create(provider: str):
+    if provider == "openai":
+        from assistant_openai import OpenAIPersonalAssistant
+        return OpenAIPersonalAssistant(web_searcher=web_searcher())
+    if provider == "ollama":
+        from assistant_ollama import OllamaPersonalAssistant
+        return OllamaPersonalAssistant(session=http_session("ollama"), web_searcher=web_searcher())
+    if provider == "local":
+        from assistant_local import LocalModelPersonalAssistant
+        return LocalModelPersonalAssistant(web_searcher=web_searcher())
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def get_assistant(provider: str):
+    """Shared assistant for provider, created on first use; raises if it can't be created
+
+    Assistants keep no per-conversation state (entities, follow-ups and the
+    session id are passed in on every call), so every session can use the
+    same instance and its clients, caches and connection pools.
+    """
+    assistant = _assistants.get(provider)
+    if assistant is not None:
+        return assistant
+    # Built outside the lock; if two sessions race, the first one registered wins
+    assistant = _create(provider)
+    with _lock:
+        return _assistants.setdefault(provider, assistant)
+
+
+def release(provider: str = None):
+    """Forget the shared assistant for provider (all of them if None), e.g. after a config change"""
+    with _lock:
+        if provider is None:
+            _assistants.clear()
+        else:
+            _assistants.pop(provider, None)
+
+
+def stats() -> Dict[str, Any]:
+    """Live shared instances, to check that sessions aren't each building their own"""
+    with _lock:
+        return {"assistants": sorted(_assistants), "http_sessions": sorted(_sessions)}
@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List
+
+# Set in each worker by _init_worker
+_worker_classify = None
+_worker_web_search = False
+
+
+def _init_worker(web_search: bool):
+    """Load the rule classifier once per worker process"""
+    global _worker_classify, _worker_web_search
+    from intent_rules import fallback_intent_classifier
+    _worker_classify = fallback_intent_classifier
+    _worker_web_search = web_search
+    # Touch every compiled pattern once so the first real chunk is not slower
+    _worker_classify("warm up booking for 2 tomorrow 8pm from home to airport", web_search=False)
+
+
+def _classify_chunk(chunk: List[str]) -> List[Dict[str, Any]]:
+    return [_worker_classify(text, web_search=_worker_web_search) for text in chunk]
+
+
+def _crashed_result(error: str) -> Dict[str, Any]:
+    return {
+        "intent_category": "other",
+        "entities": {},
+        "confidence_score": 0.0,
+        "error": error
+    }
+
+
+class BatchClassifier:
+    """Process-pool batch mode for the rule-based classifier
+
+    Inputs are split into chunks of chunk_size and spread over workers
+    processes. Results are yielded in input order as soon as the chunk at
+    the head of the queue finishes. If a worker dies, the pool is rebuilt and
+    the unfinished chunks are rerun one at a time, so a crash is charged only
+    to the chunk that caused it; a chunk that keeps crashing after max_retries
+    retries yields error results instead of stopping the batch.
+    """
+
+    def __init__(self, workers: int = None, chunk_size: int = 256, max_retries: int = 2, web_search: bool = False):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.max_retries = max_retries
+        self.web_search = web_search
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.web_search,)
+            )
+        return self._pool
+
+    def _reset_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _chunks(self, inputs: Iterable[str]) -> Iterator[List[str]]:
+        chunk = []
+        for text in inputs:
+            chunk.append(text)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def classify_iter(self, inputs: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Yield one classification result per input, in input order"""
+        chunks = self._chunks(inputs)
+        # Keep every worker busy with one chunk queued behind it, without reading the whole input
+        max_in_flight = self.workers * 2
+        # Each entry is [chunk, future, crashes]; future is None while a chunk waits to rerun alone
+        in_flight = deque()
+        exhausted = False
+        # Set after a crash until every chunk that was unfinished has rerun on its own
+        isolating = False
+
+        while True:
+            while not isolating and not exhausted and len(in_flight) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                in_flight.append([chunk, self._submit(chunk), 0])
+
+            if not in_flight:
+                return
+
+            entry = in_flight[0]
+            if entry[1] is None and entry[2] <= self.max_retries:
+                entry[1] = self._submit(entry[0])
+            try:
+                results = entry[1].result() if entry[1] is not None else None
+            except BrokenProcessPool:
+                self._reset_pool()
+                if isolating:
+                    # It ran alone, so it is the one that crashed
+                    entry[2] += 1
+                    entry[1] = None
+                else:
+                    # Any unfinished chunk may have killed the worker; hold them all back and rerun them one by one
+                    isolating = True
+                    for pending in in_flight:
+                        future = pending[1]
+                        if not (future.done() and not future.cancelled() and future.exception() is None):
+                            pending[1] = None
+                continue
+            except Exception as e:
+                results = [_crashed_result(str(e)) for _ in entry[0]]
+
+            if results is None:
+                print(f"Batch chunk failed after {self.max_retries} retries, emitting error results")
+                results = [_crashed_result("worker crashed") for _ in entry[0]]
+
+            in_flight.popleft()
+            isolating = any(pending[1] is None for pending in in_flight)
+            yield from results
+
+    def _submit(self, chunk: List[str]):
+        try:
+            return self._get_pool().submit(_classify_chunk, chunk)
+        except BrokenProcessPool:
+            self._reset_pool()
+            return self._get_pool().submit(_classify_chunk, chunk)
+
+    def classify(self, inputs: Iterable[str]) -> List[Dict[str, Any]]:
+        return list(self.classify_iter(inputs))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_inputs(stream) -> Iterator[str]:
+    """Accept plain text lines or JSON lines with a "text" field"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                yield json.loads(line)["text"]
+                continue
+            except (ValueError, KeyError):
+                pass
+        yield line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify requests in bulk with the rule-based classifier")
+    parser.add_argument("input", nargs="?", help="Input file, one request per line (default: stdin)")
+    parser.add_argument("-o", "--output", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Requests per work item")
+    parser.add_argument("--web-search", action="store_true", help="Run web search for 'other' requests")
+    args = parser.parse_args()
+
+    source = open(args.input, encoding="utf-8") if args.input else sys.stdin
+    sink = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    with source, BatchClassifier(args.workers, args.chunk_size, web_search=args.web_search) as classifier:
+        for result in classifier.classify_iter(_read_inputs(source)):
+            sink.write(json.dumps(result) + "\n")
+
+    if sink is not sys.stdout:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
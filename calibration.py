@@ -0,0 +1,264 @@
+import argparse
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Calibrated confidence is looked up in a table of BINS + 1 points (steps of 0.01)
+BINS = 100
+
+# Fitted per (backend, intent) with at least this many examples; fewer fall back to the backend-wide fit
+MIN_ISOTONIC = int(os.getenv("NLPARSE_CALIBRATION_MIN_ISOTONIC", "50"))
+MIN_PLATT = int(os.getenv("NLPARSE_CALIBRATION_MIN_PLATT", "10"))
+
+DEFAULT_CALIBRATION_PATH = os.getenv("NLPARSE_CALIBRATION")
+
+# The file is checked for changes at most this often; calibration runs on every request, a stat needn't
+CHECK_SECONDS = float(os.getenv("NLPARSE_CALIBRATION_CHECK_SECONDS", "5"))
+
+# Calibrated confidence at which a backend's answer is taken without asking a slower backend
+AUTO_ACCEPT = float(os.getenv("NLPARSE_AUTO_ACCEPT", "0.9"))
+
+Pair = Tuple[float, bool]
+
+
+def fit_isotonic(pairs: List[Pair]) -> List[float]:
+    """Pool-adjacent-violators fit of P(correct) against confidence, tabulated at each bin"""
+    blocks = []  # [sum correct, count, lowest confidence]
+    for confidence, correct in sorted(pairs):
+        blocks.append([float(correct), 1, confidence])
+        while len(blocks) > 1 and blocks[-2][0] / blocks[-2][1] >= blocks[-1][0] / blocks[-1][1]:
+            total, count, _ = blocks.pop()
+            blocks[-1][0] += total
+            blocks[-1][1] += count
+    # Add-one smoothing so a few lucky examples can't map a bin to exactly 1.0; the running max keeps it monotone
+    starts, values = [], []
+    for total, count, start in blocks:
+        starts.append(start)
+        values.append(max((total + 1) / (count + 2), values[-1] if values else 0.0))
+    return [round(values[max(0, bisect.bisect_right(starts, i / BINS) - 1)], 4) for i in range(BINS + 1)]
+
+
+def _logit(p: float) -> float:
+    p = min(max(p, 1e-4), 1 - 1e-4)
+    return math.log(p / (1 - p))
+
+
+def fit_platt(pairs: List[Pair], iterations: int = 50) -> List[float]:
+    """Logistic fit of P(correct) on logit(confidence) (Newton's method), tabulated at each bin"""
+    # Platt's smoothed targets keep the fit finite when every example is right (or wrong)
+    positives = sum(1 for _, correct in pairs if correct)
+    high, low = (positives + 1) / (positives + 2), 1 / (len(pairs) - positives + 2)
+    xs = [_logit(confidence) for confidence, _ in pairs]
+    ys = [high if correct else low for _, correct in pairs]
+
+    a, b = 1.0, 0.0
+    for _ in range(iterations):
+        g_a = g_b = h_aa = h_ab = h_bb = 0.0
+        for x, y in zip(xs, ys):
+            p = 1 / (1 + math.exp(-(a * x + b)))
+            w = p * (1 - p)
+            g_a += (p - y) * x
+            g_b += p - y
+            h_aa += w * x * x
+            h_ab += w * x
+            h_bb += w
+        det = h_aa * h_bb - h_ab * h_ab
+        if abs(det) < 1e-12:
+            break
+        step_a = (h_bb * g_a - h_ab * g_b) / det
+        step_b = (h_aa * g_b - h_ab * g_a) / det
+        a, b = a - step_a, b - step_b
+        if abs(step_a) + abs(step_b) < 1e-8:
+            break
+    return [round(1 / (1 + math.exp(-(a * _logit(i / BINS) + b))), 4) for i in range(BINS + 1)]
+
+
+class Calibrator:
+    """Lookup tables mapping raw confidence to P(correct), per "backend/intent" and "backend/*"
+
+    calibrate() is one dict lookup and one list index per request.
+    """
+
+    def __init__(self, tables: Dict[str, List[float]], info: Dict[str, Dict[str, Any]] = None):
+        self.tables = tables
+        self.info = info or {}
+        self.backends = frozenset(key.split("/", 1)[0] for key in tables)
+        self.mtime = None
+
+    def calibrate(self, backend: str, intent: str, confidence: float) -> float:
+        table = self.tables.get(f"{backend}/{intent}") or self.tables.get(f"{backend}/*")
+        if table is None or confidence is None:
+            return confidence
+        return table[min(max(int(round(float(confidence) * BINS)), 0), BINS)]
+
+    def has(self, backend: str) -> bool:
+        return backend in self.backends
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "bins": BINS, "tables": self.tables, "info": self.info}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Calibrator":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("bins") != BINS:
+            raise ValueError(f"Calibration file has {data.get('bins')} bins, expected {BINS}")
+        calibrator = cls(data["tables"], data.get("info"))
+        calibrator.mtime = os.path.getmtime(path)
+        return calibrator
+
+
+def fit(outcomes: Iterable[Dict[str, Any]], min_isotonic: int = MIN_ISOTONIC, min_platt: int = MIN_PLATT) -> Calibrator:
+    """Fit tables from outcomes with "backend", predicted "intent", raw "confidence" and "correct" """
+    groups: Dict[str, List[Pair]] = defaultdict(list)
+    for outcome in outcomes:
+        pair = (min(max(float(outcome["confidence"]), 0.0), 1.0), bool(outcome["correct"]))
+        groups[f"{outcome['backend']}/{outcome['intent']}"].append(pair)
+        groups[f"{outcome['backend']}/*"].append(pair)
+
+    tables, info = {}, {}
+    for key, pairs in sorted(groups.items()):
+        if len(pairs) >= min_isotonic:
+            tables[key], method = fit_isotonic(pairs), "isotonic"
+        elif len(pairs) >= min_platt:
+            tables[key], method = fit_platt(pairs), "platt"
+        else:
+            continue
+        info[key] = {"method": method, "examples": len(pairs),
+                     "accuracy": round(sum(correct for _, correct in pairs) / len(pairs), 4)}
+    return Calibrator(tables, info)
+
+
+def read_outcomes(path: str) -> List[Dict[str, Any]]:
+    """Labeled outcomes from an evaluate.py --json report, or JSONL records with a gold "label"
+
+    JSONL records are request-log style: "backend", "result" (or top-level
+    intent_category/confidence_score), "raw_confidence" when calibration was
+    already applied, and the gold intent in "label".
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    try:
+        report = json.loads(text)
+    except json.JSONDecodeError:
+        report = None
+    outcomes = []
+    if isinstance(report, dict) and "outcomes" in report:
+        for backend, rows in report["outcomes"].items():
+            for row in rows:
+                if row.get("intent") and not row.get("error"):
+                    outcomes.append({
+                        "backend": backend,
+                        "intent": row["intent"],
+                        "confidence": row.get("raw_confidence", row["confidence"]),
+                        "correct": row["intent"] == row["gold_intent"],
+                    })
+        return outcomes
+
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        result = record.get("result") or record
+        label = record.get("label")
+        intent = result.get("intent_category")
+        confidence = record.get("raw_confidence", result.get("confidence_score"))
+        if label and intent and confidence is not None and record.get("backend"):
+            outcomes.append({"backend": record["backend"], "intent": intent,
+                             "confidence": confidence, "correct": intent == label})
+    return outcomes
+
+
+_calibrators: Dict[str, Calibrator] = {}
+_checked: Dict[str, float] = {}  # path -> time.monotonic() of its last check
+_calibrators_lock = threading.Lock()
+
+
+def get_calibrator(path: Optional[str] = DEFAULT_CALIBRATION_PATH) -> Optional[Calibrator]:
+    """Shared calibrator for path, reloaded when the file changes; None if there is none"""
+    if not path:
+        return None
+    now = time.monotonic()
+    checked = _checked.get(path)
+    if checked is not None and now - checked < CHECK_SECONDS:
+        return _calibrators.get(path)
+    with _calibrators_lock:
+        _checked[path] = now
+        if not os.path.exists(path):
+            _calibrators.pop(path, None)
+            return None
+        mtime = os.path.getmtime(path)
+        calibrator = _calibrators.get(path)
+        if calibrator is None or calibrator.mtime != mtime:
+            try:
+                calibrator = _calibrators[path] = Calibrator.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load calibration from {path}: {e}")
+                _calibrators.pop(path, None)
+                return None
+        return calibrator
+
+
+def calibrate(backend: str, intent: str, confidence: float) -> float:
+    """Calibrated confidence, or the raw one when there is no calibration for backend"""
+    calibrator = get_calibrator()
+    return calibrator.calibrate(backend, intent, confidence) if calibrator else confidence
+
+
+def apply(response, backend: str):
+    """Replace response.confidence_score with its calibrated value; the raw score goes to metadata"""
+    calibrator = get_calibrator()
+    if calibrator is None or not calibrator.has(backend):
+        return response
+    response.metadata["raw_confidence"] = response.confidence_score
+    response.confidence_score = calibrator.calibrate(backend, response.intent_category, response.confidence_score)
+    return response
+
+
+def auto_accept(backend: str, intent: str, confidence: float) -> bool:
+    """True if backend's answer is reliable enough to skip a slower backend (needs a fitted calibration)"""
+    calibrator = get_calibrator()
+    if calibrator is None or not calibrator.has(backend):
+        return False
+    return calibrator.calibrate(backend, intent, confidence) >= AUTO_ACCEPT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit or inspect confidence calibration")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit_parser = subparsers.add_parser("fit", help="Fit from labeled outcomes")
+    fit_parser.add_argument("inputs", nargs="+", help="evaluate.py --json reports or labeled JSONL")
+    fit_parser.add_argument("-o", "--output", default=DEFAULT_CALIBRATION_PATH or "calibration.json")
+    fit_parser.add_argument("--min-isotonic", type=int, default=MIN_ISOTONIC)
+    fit_parser.add_argument("--min-platt", type=int, default=MIN_PLATT)
+
+    show_parser = subparsers.add_parser("show", help="Print a calibration file's tables")
+    show_parser.add_argument("path", nargs="?", default=DEFAULT_CALIBRATION_PATH or "calibration.json")
+
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        outcomes = [outcome for path in args.inputs for outcome in read_outcomes(path)]
+        calibrator = fit(outcomes, args.min_isotonic, args.min_platt)
+        calibrator.save(args.output)
+        print(f"Fitted {len(calibrator.tables)} tables from {len(outcomes)} outcomes -> {args.output}")
+        for key, details in calibrator.info.items():
+            print(f"  {key}: {details['method']} on {details['examples']} examples (accuracy {details['accuracy']:.2f})")
+    else:
+        calibrator = Calibrator.load(args.path)
+        for key, table in sorted(calibrator.tables.items()):
+            points = ", ".join(f"{i / 10:.1f}->{table[i * BINS // 10]:.2f}" for i in range(11))
+            print(f"{key} ({calibrator.info.get(key, {}).get('method', '?')}): {points}")
+
+
+if __name__ == "__main__":
+    main()
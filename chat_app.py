@@ -2,9 +2,19 @@ import streamlit as st
 import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
-import re
+import os
 import time
-from web_search import WebSearcher
+import uuid
+from intent_rules import fallback_intent_classifier
+from deadline import Deadline
+import request_log
+import intent_schema
+import speculative
+import segmentation
+import slot_filling
+import calibration
+import warmup
+import assistant_pool
 
 # Import both assistant types
 try:
@@ -19,219 +29,11 @@ try:
 except:
     ollama_available = False
 
-def fallback_intent_classifier(user_input: str) -> Dict[str, Any]:
-    """Fallback rule-based classifier when AI models fail"""
-    user_input_lower = user_input.lower()
-    
-    # Define keywords for each intent
-    intent_keywords = {
-        "dining": ["restaurant", "dinner", "lunch", "breakfast", "table", "booking", "reservation", "eat", "food", "cuisine", "menu", "dinning"],
-        "travel": ["trip", "travel", "flight", "hotel", "vacation", "visit", "destination", "booking", "tickets"],
-        "gifting": ["gift", "present", "birthday", "anniversary", "occasion", "buy", "shopping"],
-        "cab_booking": ["cab", "taxi", "uber", "lyft", "ride", "pickup", "drop", "airport", "transport"],
-        "other": []
-    }
-    
-    # Score each intent based on keyword matches
-    scores = {}
-    for intent, keywords in intent_keywords.items():
-        score = sum(1 for keyword in keywords if keyword in user_input_lower)
-        if score > 0:
-            scores[intent] = score
-    
-    # Determine best intent
-    if scores:
-        best_intent = max(scores, key=scores.get)
-    else:
-        best_intent = "other"
-    
-    # Extract basic entities using regex patterns
-    entities = {}
-    
-    # Extract numbers (for party size, budget, etc.)
-    numbers = re.findall(r'\b\d+\b', user_input)
-    
-    # Improved time patterns
-    time_patterns = re.findall(r'\b\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM)\b', user_input)
-    
-    # Improved date patterns
-    date_patterns = []
-    date_formats = [
-        r'\b\d{1,2}(?:st|nd|rd|th)?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)\s*,?\s*\d{4}\b',
-        r'\b(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(?:st|nd|rd|th)?\s*,?\s*\d{4}\b',
-        r'\b\d{1,2}(?:st|nd|rd|th)?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)\b',
-        r'\b(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(?:st|nd|rd|th)?\b',
-        r'\b\d{1,2}/\d{1,2}/\d{4}\b',
-        r'\b\d{1,2}/\d{1,2}\b',
-        r'\b\d{4}-\d{1,2}-\d{1,2}\b',
-        r'\btoday\b',
-        r'\btomorrow\b',
-        r'\bnext\s+(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
-        r'\bthis\s+(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b'
-    ]
-    
-    for pattern in date_formats:
-        matches = re.findall(pattern, user_input_lower)
-        date_patterns.extend(matches)
-    
-    # Extract budget patterns
-    budget_patterns = re.findall(r'\b(?:budget|cost|price|spend|around|under|max|maximum)\s*(?:of|is|at)?\s*\$?(\d+)\b', user_input_lower)
-    
-    # Extract party size patterns
-    party_size_patterns = re.findall(r'\b(?:for|party\s+of|table\s+for)\s*(\d+)\s*(?:people?|person|pax|guests?)?\b|\b(\d+)\s*(?:person|people|pax|guests?)\b', user_input_lower)
-    party_size = None
-    if party_size_patterns:
-        for pattern_groups in party_size_patterns:
-            for group in pattern_groups:
-                if group and group.isdigit():
-                    party_size = group
-                    break
-            if party_size:
-                break
-    
-    if not party_size and numbers:
-        for num in numbers:
-            if 1 <= int(num) <= 20:
-                party_size = num
-                break
-    
-    if best_intent == "dining":
-        entities = {
-            "cuisine": None,
-            "party_size": party_size,
-            "date": date_patterns[0] if date_patterns else None,
-            "time": time_patterns[0] if time_patterns else None,
-            "budget": budget_patterns[0] if budget_patterns else None,
-            "location": None,
-            "dietary_restrictions": None
-        }
-        
-        # Extract cuisine types
-        cuisines = ["italian", "chinese", "indian", "mexican", "french", "japanese", "thai", "american", "mediterranean", "korean", "vietnamese", "greek", "spanish", "turkish", "lebanese", "moroccan"]
-        for cuisine in cuisines:
-            if cuisine in user_input_lower:
-                entities["cuisine"] = cuisine.title()
-                break
-    
-    elif best_intent == "travel":
-        entities = {
-            "destination": None,
-            "departure_date": date_patterns[0] if date_patterns else None,
-            "return_date": None,
-            "number_of_travelers": party_size,
-            "budget": budget_patterns[0] if budget_patterns else None,
-            "accommodation_type": None,
-            "transportation": None
-        }
-        
-        destinations = re.findall(r'\bto\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\b', user_input)
-        if destinations:
-            entities["destination"] = destinations[0]
-    
-    elif best_intent == "gifting":
-        entities = {
-            "recipient": None,
-            "occasion": None,
-            "budget": budget_patterns[0] if budget_patterns else (numbers[0] if numbers else None),
-            "gift_type": None,
-            "relationship": None,
-            "interests": None
-        }
-        
-        occasions = ["birthday", "anniversary", "wedding", "graduation", "christmas", "valentine", "mother's day", "father's day"]
-        for occasion in occasions:
-            if occasion in user_input_lower:
-                entities["occasion"] = occasion.title()
-                break
-        
-        relationships = ["mom", "mother", "dad", "father", "sister", "brother", "friend", "wife", "husband", "girlfriend", "boyfriend"]
-        for rel in relationships:
-            if rel in user_input_lower:
-                entities["recipient"] = rel.title()
-                entities["relationship"] = rel
-                break
-    
-    elif best_intent == "cab_booking":
-        entities = {
-            "pickup_location": None,
-            "destination": None,
-            "date": date_patterns[0] if date_patterns else None,
-            "time": time_patterns[0] if time_patterns else None,
-            "vehicle_type": None,
-            "number_of_passengers": party_size
-        }
-        
-        from_matches = re.findall(r'\bfrom\s+([^,]+?)(?:\s+to|\s+at|$)', user_input_lower)
-        to_matches = re.findall(r'\bto\s+([^,]+?)(?:\s+at|$)', user_input_lower)
-        
-        if from_matches:
-            entities["pickup_location"] = from_matches[0].strip()
-        if to_matches:
-            entities["destination"] = to_matches[0].strip()
-    
-    else:
-        # For "other" category
-        entities = {
-            "query": user_input,
-            "topic": None,
-            "keywords": None,
-            "specific_request": user_input
-        }
-        
-        topic_patterns = [
-            r'how to\s+(.+?)(?:\?|$)',
-            r'what is\s+(.+?)(?:\?|$)',
-            r'where is\s+(.+?)(?:\?|$)',
-            r'when is\s+(.+?)(?:\?|$)',
-            r'update\s+(.+?)(?:\s+in|\s+on|$)',
-            r'(.+?)\s+(?:procedure|process|steps|method)',
-        ]
-        
-        for pattern in topic_patterns:
-            matches = re.findall(pattern, user_input_lower)
-            if matches:
-                entities["topic"] = matches[0].strip()
-                entities["keywords"] = matches[0].strip()
-                break
-        
-        if not entities["topic"]:
-            import string
-            words = user_input.translate(str.maketrans('', '', string.punctuation)).split()
-            key_words = [word for word in words if len(word) > 3 and word.lower() not in ['this', 'that', 'with', 'have', 'will', 'from', 'they', 'been', 'said', 'each', 'which', 'their']]
-            if key_words:
-                entities["keywords"] = " ".join(key_words[:5])
-    
-    # Don't clean up entities - keep None values so follow-up questions can be generated
-    # Only remove empty strings, but keep None values for required field detection
-    entities = {k: v for k, v in entities.items() if v != ""}
-    
-    # For "other" intent, perform web search
-    if best_intent == "other":
-        try:
-            web_searcher = WebSearcher()
-            search_summary = web_searcher.get_search_summary(user_input)
-            
-            # Create a simple response based on search results
-            if "No search results found" not in search_summary:
-                entities["web_search_performed"] = True
-                entities["search_query"] = user_input
-                entities["ai_response"] = f"Based on web search results:\n\n{search_summary}"
-                confidence = 0.75  # Higher confidence with web results
-            else:
-                confidence = 0.3
-        except Exception as e:
-            print(f"Web search failed in fallback classifier: {e}")
-            confidence = 0.3
-    elif scores:
-        confidence = min(scores[best_intent] * 0.15 + 0.3, 0.9)
-    else:
-        confidence = 0.3
-    
-    return {
-        "intent_category": best_intent,
-        "entities": entities,
-        "confidence_score": confidence
-    }
+try:
+    from assistant_local import LocalModelPersonalAssistant
+    local_available = True
+except:
+    local_available = False
 
 def detect_available_provider():
     """Detect which AI provider is available"""
@@ -245,6 +47,11 @@ def detect_available_provider():
         if is_available:
             return "ollama", message
     
+    if local_available:
+        is_available, message = LocalModelPersonalAssistant.is_available()
+        if is_available:
+            return "local", message
+    
     if openai_available:
         _, message = OpenAIPersonalAssistant.is_available()
         return "openai", message
@@ -254,60 +61,18 @@ def detect_available_provider():
     else:
         return None, "No AI providers available"
 
+@st.cache_resource(show_spinner="Warming up (loading models, priming caches)...")
+def warm_start(provider: Optional[str]) -> Dict[str, Any]:
+    """Warm-up for provider, run once per server process and shared by every session"""
+    report = warmup.warm_up(provider)
+    if provider:
+        # Sessions share the provider's assistant, so its connections only need opening once
+        warmup.open_connections(assistant_pool.get_assistant(provider))
+    return report
+
 def generate_follow_up_questions(intent_category: str, entities: Dict[str, Any]) -> List[str]:
     """Generate follow-up questions for missing information"""
-    required_fields = {
-        "dining": ["cuisine", "party_size", "date", "time"],
-        "travel": ["destination", "departure_date", "number_of_travelers"],
-        "gifting": ["recipient", "occasion", "budget"],
-        "cab_booking": ["pickup_location", "destination", "date", "time"],
-        "other": []
-    }
-    
-    if intent_category not in required_fields:
-        return []
-    
-    missing = []
-    for field in required_fields[intent_category]:
-        if field not in entities or not entities[field]:
-            missing.append(field)
-    
-    questions = []
-    field_names = []
-    for field in missing[:4]:  # Limit to 4 questions max
-        if field == "party_size" or field == "number_of_travelers":
-            questions.append("How many people will be joining?")
-            field_names.append(field)
-        elif field == "date" or field == "departure_date":
-            questions.append("What date are you planning for?")
-            field_names.append(field)
-        elif field == "time":
-            questions.append("What time would you prefer?")
-            field_names.append(field)
-        elif field == "cuisine":
-            questions.append("What type of cuisine are you looking for?")
-            field_names.append(field)
-        elif field == "destination":
-            if intent_category == "cab_booking":
-                questions.append("Where would you like to go?")
-            else:
-                questions.append("Where would you like to travel to?")
-            field_names.append(field)
-        elif field == "pickup_location":
-            questions.append("Where should we pick you up?")
-            field_names.append(field)
-        elif field == "recipient":
-            questions.append("Who is this gift for?")
-            field_names.append(field)
-        elif field == "occasion":
-            questions.append("What's the occasion?")
-            field_names.append(field)
-        elif field == "budget":
-            questions.append("What's your budget range?")
-            field_names.append(field)
-        else:
-            questions.append(f"Could you provide details about {field.replace('_', ' ')}?")
-            field_names.append(field)
+    questions, field_names = intent_schema.follow_ups(intent_category, entities)
     
     # Store the field mapping in session state
     if 'followup_field_mapping' in st.session_state:
@@ -418,6 +183,11 @@ def main():
             color: white;
         }
         
+        .local-badge {
+            background: linear-gradient(135deg, #5c6bc0 0%, #3949ab 100%);
+            color: white;
+        }
+        
         .status-indicator {
             display: inline-block;
             width: 12px;
@@ -512,6 +282,21 @@ def main():
         st.session_state.available_providers = {}
     if 'selected_provider' not in st.session_state:
         st.session_state.selected_provider = None
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if 'speculative_mode' not in st.session_state:
+        st.session_state.speculative_mode = os.getenv("NLPARSE_SPECULATIVE", "").lower() in ("1", "true", "yes")
+    if 'pending_llm_future' not in st.session_state:
+        st.session_state.pending_llm_future = None
+    if 'input_rerun_pending' not in st.session_state:
+        st.session_state.input_rerun_pending = False
+    # st.rerun() stops the script before Streamlit resets button triggers, so the run it starts still sees
+    # the button as pressed. Only that one replay is skipped; a deliberate resend of the same text goes through
+    replayed_input = st.session_state.input_rerun_pending
+    st.session_state.input_rerun_pending = False
+    if 'queued_frames' not in st.session_state:
+        # Remaining requests of a compound input, handled once the current one is complete
+        st.session_state.queued_frames = []
 
     # Helper functions for the UI
     def check_all_providers():
@@ -562,6 +347,28 @@ def main():
                 'message': 'Ollama module not installed'
             }
         
+        # Check local intent model
+        if local_available:
+            try:
+                is_available, message = LocalModelPersonalAssistant.is_available()
+                providers['local'] = {
+                    'available': is_available,
+                    'name': 'Local Intent Model',
+                    'message': message
+                }
+            except:
+                providers['local'] = {
+                    'available': False,
+                    'name': 'Local Intent Model',
+                    'message': 'Local model not available'
+                }
+        else:
+            providers['local'] = {
+                'available': False,
+                'name': 'Local Intent Model',
+                'message': 'NumPy not installed'
+            }
+        
         return providers
     
     def initialize_assistant(force_provider=None):
@@ -581,7 +388,7 @@ def main():
         
         if provider_to_use == "openai" and st.session_state.available_providers.get('openai', {}).get('available'):
             try:
-                st.session_state.assistant = OpenAIPersonalAssistant()
+                st.session_state.assistant = assistant_pool.get_assistant("openai")
                 st.session_state.provider = "openai"
                 return True, "OpenAI GPT-3.5"
             except Exception as e:
@@ -589,12 +396,20 @@ def main():
         
         elif provider_to_use == "ollama" and st.session_state.available_providers.get('ollama', {}).get('available'):
             try:
-                st.session_state.assistant = OllamaPersonalAssistant()
+                st.session_state.assistant = assistant_pool.get_assistant("ollama")
                 st.session_state.provider = "ollama"
                 return True, "Ollama Llama 3.2"
             except Exception as e:
                 return False, str(e)
         
+        elif provider_to_use == "local" and st.session_state.available_providers.get('local', {}).get('available'):
+            try:
+                st.session_state.assistant = assistant_pool.get_assistant("local")
+                st.session_state.provider = "local"
+                return True, "Local Intent Model"
+            except Exception as e:
+                return False, str(e)
+        
         # Fallback: try to find any available provider
         if not provider_to_use:
             for provider, info in st.session_state.available_providers.items():
@@ -620,12 +435,137 @@ def main():
         }
         st.session_state.chat_history.append(message)
 
-    def process_user_input(user_input: str):
-        # Prevent duplicate processing
-        if user_input == st.session_state.last_processed_input and st.session_state.conversation_state == "processing":
+    def reconcile_late_llm_result():
+        """Merge a speculative LLM result that arrived after the rule result was used"""
+        future = st.session_state.pending_llm_future
+        if future is None or not future.done():
+            return
+        st.session_state.pending_llm_future = None
+        
+        try:
+            late_response = future.result()
+        except Exception:
             return
         
+        # Only enrich the request the user is working on; a different intent is discarded
+        if (late_response.intent_category != st.session_state.current_intent or
+                not isinstance(late_response.entities, dict)):
+            return
+        
+        filled = speculative.reconcile_entities(st.session_state.current_entities, late_response.entities)
+        if not filled:
+            return
+        st.session_state.current_confidence = max(st.session_state.current_confidence, late_response.confidence_score or 0.0)
+        
+        # Drop follow-up questions the AI has answered, except the one already on screen
+        if st.session_state.conversation_state == "waiting_followup":
+            asked = st.session_state.current_followup_index + 1
+            keep = list(range(asked)) + [
+                i for i in range(asked, len(st.session_state.followup_field_mapping))
+                if st.session_state.followup_field_mapping[i] not in filled
+            ]
+            st.session_state.pending_followups = [st.session_state.pending_followups[i] for i in keep]
+            st.session_state.followup_field_mapping = [st.session_state.followup_field_mapping[i] for i in keep]
+        
+        add_chat_message("system", f"AI result arrived: filled {', '.join(f.replace('_', ' ') for f in filled)}")
+
+    def present_response(response, processing_mode: str, **extra_metadata):
+        """Make response the current request: store its entities and ask its first follow-up or answer it"""
+        # Update state with initial classification
+        st.session_state.current_entities = response.entities.copy() if response.entities else {}
+        st.session_state.current_intent = response.intent_category or ""
+        st.session_state.current_confidence = response.confidence_score or 0.0
+    
+        # Generate follow-up questions for structured intents
+        if response.intent_category in intent_schema.STRUCTURED_INTENTS:
+            follow_up_questions = generate_follow_up_questions(
+                response.intent_category,
+                st.session_state.current_entities
+            )
+            st.session_state.pending_followups = follow_up_questions
+        
+            if follow_up_questions:
+                st.session_state.conversation_state = "waiting_followup"
+                st.session_state.current_followup_index = 0
+            
+                # Ask first question
+                chat_response = follow_up_questions[0]
+            else:
+                st.session_state.conversation_state = "complete"
+                intent_text = response.intent_category.replace("_", " ").title()
+                chat_response = f"Perfect! I've identified this as a {intent_text.lower()} request and have all the details needed."
+        else:
+            # For "other" intent
+            st.session_state.conversation_state = "complete"
+            st.session_state.pending_followups = []
+        
+            if response.intent_category == "other":
+                # Check if web search was performed and we have an AI response
+                if (hasattr(response, 'entities') and 
+                    response.entities and 
+                    response.entities.get('web_search_performed') and 
+                    response.entities.get('ai_response')):
+                
+                    # Use the AI-generated response from web search
+                    chat_response = response.entities['ai_response']
+                else:
+                    # Fallback message if no web search response
+                    chat_response = "I understand this is a general inquiry. Let me help you with that."
+            else:
+                intent_text = response.intent_category.replace("_", " ").title()
+                chat_response = f"Perfect! I've identified this as a {intent_text.lower()} request and have all the details needed."
+    
+        add_chat_message("assistant", chat_response, {
+            "intent": response.intent_category,
+            "confidence": response.confidence_score,
+            "entities": st.session_state.current_entities,
+            "followups": st.session_state.pending_followups,
+            "processing_mode": processing_mode,
+            **extra_metadata
+        })
+
+    def start_queued_frames():
+        """Move on to the next request of a compound input once the current one is complete"""
+        while st.session_state.queued_frames and st.session_state.conversation_state == "complete":
+            response = st.session_state.queued_frames.pop(0)
+            st.session_state.original_request = response.metadata.get("segment", "")
+            st.session_state.current_followup_index = 0
+            st.session_state.followup_field_mapping = []
+            present_response(response, response.metadata.get("processing_mode", "ai"),
+                             segment=st.session_state.original_request)
+
+    def present_frames(user_input: str, frames: List[Any], request_start: float):
+        """Start on the first request of a compound input and queue the rest"""
+        if len(frames) > 1:
+            add_chat_message("system", "Found {} requests: {}".format(
+                len(frames), "; ".join(
+                    f"{response.intent_category.replace('_', ' ')} ({response.metadata.get('segment', '')})"
+                    for response in frames
+                )
+            ))
+        first = frames[0]
+        st.session_state.queued_frames = list(frames[1:])
+        st.session_state.original_request = first.metadata.get("segment") or user_input
+        present_response(first, first.metadata.get("processing_mode", "ai"), segment=st.session_state.original_request)
+        start_queued_frames()
+
+        log = request_log.get_log()
+        if log:
+            total = round(time.perf_counter() - request_start, 4)
+            for response in frames:
+                ai = response.metadata.get("processing_mode") == "ai"
+                log.log(request_log.make_record(
+                    "request", response.metadata.get("segment") or user_input,
+                    st.session_state.provider if ai else "rules", response,
+                    {"total": total},
+                    session_id=st.session_state.session_id,
+                    processing_mode=response.metadata.get("processing_mode"),
+                    segment_of=user_input
+                ))
+
+    def process_user_input(user_input: str):
         st.session_state.last_processed_input = user_input
+        request_start = time.perf_counter()
         
         # Determine if this is a follow-up answer or new request
         is_followup = bool(st.session_state.pending_followups and st.session_state.original_request)
@@ -637,6 +577,12 @@ def main():
             st.session_state.pending_followups = []
             st.session_state.followup_field_mapping = []
             st.session_state.original_request = user_input
+            st.session_state.queued_frames = []
+        
+        if is_followup:
+            reconcile_late_llm_result()
+        else:
+            st.session_state.pending_llm_future = None
         
         add_chat_message("user", user_input)
         
@@ -647,27 +593,50 @@ def main():
             if current_field_index < len(st.session_state.followup_field_mapping):
                 current_field = st.session_state.followup_field_mapping[current_field_index]
                 
-                # Directly map the answer to the correct field
-                st.session_state.current_entities[current_field] = user_input.strip()
+                # Parse the answer locally; it may also answer questions that are still to come
+                later_fields = st.session_state.followup_field_mapping[current_field_index + 1:]
+                filled, reask = slot_filling.fill_slots(
+                    st.session_state.current_intent, user_input, current_field, later_fields,
+                    st.session_state.current_entities
+                )
+                st.session_state.current_entities.update(filled)
+                st.session_state.current_confidence = slot_filling.completeness_confidence(
+                    st.session_state.current_intent, st.session_state.current_entities, st.session_state.current_confidence
+                )
+                
+                # Drop the questions this answer has already covered
+                keep = list(range(current_field_index + 1)) + [
+                    i for i in range(current_field_index + 1, len(st.session_state.followup_field_mapping))
+                    if st.session_state.followup_field_mapping[i] not in filled
+                ]
+                st.session_state.pending_followups = [st.session_state.pending_followups[i] for i in keep]
+                st.session_state.followup_field_mapping = [st.session_state.followup_field_mapping[i] for i in keep]
                 
-                # For follow-ups, re-query the AI with full context for updated confidence
-                if st.session_state.assistant:
-                    try:
-                        # Build complete context
-                        full_context = st.session_state.original_request + ". "
-                        for field, value in st.session_state.current_entities.items():
-                            if value:
-                                full_context += f"{field.replace('_', ' ')}: {value}. "
-                        
-                        # Get updated assessment from AI
-                        response = st.session_state.assistant.process_input(
-                            full_context,
-                            st.session_state.current_entities
-                        )
-                        st.session_state.current_confidence = response.confidence_score
-                    except:
-                        # Keep existing confidence if AI fails
-                        pass
+                log = request_log.get_log()
+                if log:
+                    log.log(request_log.make_record(
+                        "followup", user_input, "slots",
+                        type('Response', (), {
+                            'intent_category': st.session_state.current_intent,
+                            'entities': st.session_state.current_entities,
+                            'confidence_score': st.session_state.current_confidence
+                        })(),
+                        {"total": round(time.perf_counter() - request_start, 4)},
+                        session_id=st.session_state.session_id, field=current_field,
+                        filled=sorted(filled), reask=bool(reask)
+                    ))
+                
+                if reask:
+                    # Ask the same question again; nothing is sent to the model
+                    st.session_state.conversation_state = "waiting_followup"
+                    add_chat_message("assistant", reask, {
+                        "intent": st.session_state.current_intent,
+                        "confidence": st.session_state.current_confidence,
+                        "entities": st.session_state.current_entities,
+                        "followups": st.session_state.pending_followups,
+                        "processing_mode": "followup"
+                    })
+                    return
                 
                 # Advance to next question
                 st.session_state.current_followup_index += 1
@@ -688,6 +657,7 @@ def main():
                         "followups": [],
                         "processing_mode": "followup"
                     })
+                    start_queued_frames()
                 else:
                     # Ask next question
                     st.session_state.conversation_state = "waiting_followup"
@@ -706,53 +676,85 @@ def main():
         # Process new request or initial classification
         ai_processing_failed = False
         fallback_reason = ""
+        speculative_rule_result = None
+        # One end-to-end budget shared by classification, web search, answer generation and the fallback
+        request_deadline = Deadline()
+        
+        # Compound inputs ("book a cab ... and find a gift ...") become one frame per request
+        clauses = segmentation.split_clauses(user_input)
+        if len(clauses) > 1:
+            frames = segmentation.classify_frames(
+                user_input, clauses, st.session_state.assistant,
+                session_id=st.session_state.session_id, deadline=request_deadline
+            )
+            present_frames(user_input, frames, request_start)
+            return
+        
+        # Rules-first cascade: skip the LLM round-trip when calibration says the rules are reliable here.
+        # Only runs with a rules calibration; the rule result is then reused by the speculative path and fallback
+        calibrator = calibration.get_calibrator()
+        if calibrator is not None and calibrator.has("rules"):
+            speculative_rule_result = fallback_intent_classifier(user_input, web_search=False)
+        rule_result = speculative_rule_result
+        if rule_result and rule_result["intent_category"] != "other" and calibration.auto_accept(
+                "rules", rule_result["intent_category"], rule_result["confidence_score"]):
+            response = type('Response', (), {
+                'intent_category': rule_result["intent_category"],
+                'entities': rule_result["entities"],
+                'confidence_score': calibration.calibrate(
+                    "rules", rule_result["intent_category"], rule_result["confidence_score"]),
+                'follow_up_questions': [],
+                'metadata': {"raw_confidence": rule_result["confidence_score"]}
+            })()
+            present_response(response, "cascade")
+            log = request_log.get_log()
+            if log:
+                log.log(request_log.make_record(
+                    "request", user_input, "rules", response,
+                    {"total": round(time.perf_counter() - request_start, 4)},
+                    session_id=st.session_state.session_id, processing_mode="cascade"
+                ))
+            return
         
         try:
             if st.session_state.assistant:
-                response = st.session_state.assistant.process_input(
-                    user_input, 
-                    st.session_state.current_entities
-                )
+                if st.session_state.speculative_mode:
+                    # Run the rule classifier alongside the LLM; use it if the LLM misses its latency budget
+                    provisional = st.empty()
+                    outcome = speculative.classify_speculatively(
+                        st.session_state.assistant,
+                        user_input,
+                        st.session_state.current_entities,
+                        session_id=st.session_state.session_id,
+                        deadline=request_deadline,
+                        rule_result=speculative_rule_result,
+                        on_provisional=lambda result: provisional.info(
+                            f"Provisional: {result['intent_category'].replace('_', ' ')} request (waiting for AI)"
+                        )
+                    )
+                    provisional.empty()
+                    speculative_rule_result = outcome.rule_result
+                    
+                    if outcome.error is not None:
+                        raise outcome.error
+                    if outcome.ai_response is None:
+                        # Keep the LLM call running and merge its entities when it lands
+                        st.session_state.pending_llm_future = outcome.pending
+                        raise TimeoutError("timeout: AI exceeded latency budget")
+                    response = outcome.ai_response
+                else:
+                    response = st.session_state.assistant.process_input(
+                        user_input, 
+                        st.session_state.current_entities,
+                        session_id=st.session_state.session_id,
+                        deadline=request_deadline
+                    )
                 
-                # Enhanced AI failure detection
-                if (not response.intent_category or 
-                    response.confidence_score == 0.0 or 
-                    (response.intent_category == "other" and not response.entities)):
+                # Empty or malformed AI results fall back to the rules (same test as ndjson_server)
+                invalid_reason = intent_schema.ai_failed(response)
+                if invalid_reason:
                     ai_processing_failed = True
-                    fallback_reason = "AI returned empty result"
-                else:
-                    # Validate AI response has proper entity structure for non-other intents
-                    if response.intent_category in ["dining", "travel", "gifting", "cab_booking"]:
-                        # Check if AI response has malformed or missing entities
-                        if not response.entities or not isinstance(response.entities, dict):
-                            ai_processing_failed = True
-                            fallback_reason = "AI returned malformed entities"
-                        else:
-                            # Check for suspicious entity structures (like {"entity_type": "request"})
-                            if len(response.entities) == 1 and "entity_type" in response.entities:
-                                ai_processing_failed = True
-                                fallback_reason = "AI returned generic entity structure"
-                            # Check if AI has reasonable entities for the intent
-                            elif response.intent_category == "cab_booking":
-                                expected_fields = ["pickup_location", "destination", "date", "time"]
-                                if not any(field in response.entities for field in expected_fields):
-                                    ai_processing_failed = True
-                                    fallback_reason = "AI missing expected entities for cab booking"
-                            elif response.intent_category == "dining":
-                                expected_fields = ["cuisine", "party_size", "date", "time"]
-                                if not any(field in response.entities for field in expected_fields):
-                                    ai_processing_failed = True
-                                    fallback_reason = "AI missing expected entities for dining"
-                            elif response.intent_category == "travel":
-                                expected_fields = ["destination", "departure_date", "number_of_travelers"]
-                                if not any(field in response.entities for field in expected_fields):
-                                    ai_processing_failed = True
-                                    fallback_reason = "AI missing expected entities for travel"
-                            elif response.intent_category == "gifting":
-                                expected_fields = ["recipient", "occasion", "budget"]
-                                if not any(field in response.entities for field in expected_fields):
-                                    ai_processing_failed = True
-                                    fallback_reason = "AI missing expected entities for gifting"
+                    fallback_reason = invalid_reason
             else:
                 ai_processing_failed = True
                 fallback_reason = "No AI assistant available"
@@ -761,7 +763,7 @@ def main():
             ai_processing_failed = True
             error_msg = str(e).lower()
             
-            if "timeout" in error_msg or "read timed out" in error_msg:
+            if "timeout" in error_msg or "read timed out" in error_msg or "deadline" in error_msg:
                 fallback_reason = "timeout"
             elif "certificate" in error_msg or "ssl" in error_msg:
                 fallback_reason = "network"
@@ -777,66 +779,36 @@ def main():
             if fallback_reason not in ["timeout", "network"]:
                 st.info(f"Using rule-based processing ({fallback_reason})")
             
-            classification_result = fallback_intent_classifier(user_input)
+            # Reuse the speculative rule result; "other" still needs the web search it skipped
+            fallback_start = time.perf_counter()
+            if speculative_rule_result and speculative_rule_result["intent_category"] != "other":
+                classification_result = speculative_rule_result
+            else:
+                classification_result = fallback_intent_classifier(user_input, deadline=request_deadline)
+            fallback_time = round(time.perf_counter() - fallback_start, 4)
             
             response = type('Response', (), {
                 'intent_category': classification_result["intent_category"],
                 'entities': classification_result["entities"],
-                'confidence_score': classification_result["confidence_score"],
-                'follow_up_questions': []
+                'confidence_score': calibration.calibrate(
+                    "rules", classification_result["intent_category"], classification_result["confidence_score"]),
+                'follow_up_questions': [],
+                'metadata': {"raw_confidence": classification_result["confidence_score"]}
             })()
         
-        # Update state with initial classification
-        st.session_state.current_entities = response.entities.copy() if response.entities else {}
-        st.session_state.current_intent = response.intent_category or ""
-        st.session_state.current_confidence = response.confidence_score or 0.0
-        
-        # Generate follow-up questions for structured intents
-        if response.intent_category in ["dining", "travel", "gifting", "cab_booking"]:
-            follow_up_questions = generate_follow_up_questions(
-                response.intent_category,
-                st.session_state.current_entities
-            )
-            st.session_state.pending_followups = follow_up_questions
-            
-            if follow_up_questions:
-                st.session_state.conversation_state = "waiting_followup"
-                st.session_state.current_followup_index = 0
-                
-                # Ask first question
-                chat_response = follow_up_questions[0]
-            else:
-                st.session_state.conversation_state = "complete"
-                intent_text = response.intent_category.replace("_", " ").title()
-                chat_response = f"Perfect! I've identified this as a {intent_text.lower()} request and have all the details needed."
-        else:
-            # For "other" intent
-            st.session_state.conversation_state = "complete"
-            st.session_state.pending_followups = []
-            
-            if response.intent_category == "other":
-                # Check if web search was performed and we have an AI response
-                if (hasattr(response, 'entities') and 
-                    response.entities and 
-                    response.entities.get('web_search_performed') and 
-                    response.entities.get('ai_response')):
-                    
-                    # Use the AI-generated response from web search
-                    chat_response = response.entities['ai_response']
-                else:
-                    # Fallback message if no web search response
-                    chat_response = "I understand this is a general inquiry. Let me help you with that."
-            else:
-                intent_text = response.intent_category.replace("_", " ").title()
-                chat_response = f"Perfect! I've identified this as a {intent_text.lower()} request and have all the details needed."
-        
-        add_chat_message("assistant", chat_response, {
-            "intent": response.intent_category,
-            "confidence": response.confidence_score,
-            "entities": st.session_state.current_entities,
-            "followups": st.session_state.pending_followups,
-            "processing_mode": "fallback" if ai_processing_failed else "ai"
-        })
+        present_response(response, "fallback" if ai_processing_failed else "ai")
+        
+        log = request_log.get_log()
+        if log:
+            timings = {"total": round(time.perf_counter() - request_start, 4)}
+            if ai_processing_failed:
+                timings["fallback"] = fallback_time
+            log.log(request_log.make_record(
+                "request", user_input, "rules" if ai_processing_failed else st.session_state.provider, response, timings,
+                session_id=st.session_state.session_id,
+                processing_mode="fallback" if ai_processing_failed else "ai",
+                fallback_reason=fallback_reason or None
+            ))
 
     def start_new_request():
         st.session_state.current_entities = {}
@@ -849,6 +821,8 @@ def main():
         st.session_state.last_processed_input = ""
         st.session_state.original_request = ""
         st.session_state.new_request_triggered = True  # Set flag to prevent re-execution
+        st.session_state.pending_llm_future = None
+        st.session_state.queued_frames = []
         add_chat_message("system", "New conversation started")
 
     def clear_chat():
@@ -865,6 +839,8 @@ def main():
         st.session_state.last_processed_input = ""
         st.session_state.original_request = ""
         st.session_state.new_request_triggered = False
+        st.session_state.pending_llm_future = None
+        st.session_state.queued_frames = []
         # Note: We don't reset provider settings or assistant
 
     # Main header
@@ -889,6 +865,12 @@ def main():
 
     # Initialize assistant
     assistant_ready, provider_info = initialize_assistant()
+    
+    # Load models and prime caches before reporting ready; only the first session of the process waits
+    warm_report = warm_start(st.session_state.provider if assistant_ready else None)
+    
+    # Pick up a speculative AI result that finished since the last rerun
+    reconcile_late_llm_result()
 
     # Provider status and switcher
     col1, col2 = st.columns([3, 1])
@@ -896,7 +878,7 @@ def main():
     with col1:
         # Provider switcher
         st.markdown("**AI Provider:**")
-        provider_cols = st.columns(2)
+        provider_cols = st.columns(3)
         
         with provider_cols[0]:
             openai_info = st.session_state.available_providers.get('openai', {})
@@ -930,6 +912,22 @@ def main():
                     st.session_state.assistant = None  # Force re-initialization
                     st.rerun()
         
+        with provider_cols[2]:
+            local_info = st.session_state.available_providers.get('local', {})
+            local_disabled = not local_info.get('available', False)
+            
+            if st.button(
+                "⚡ Local Model",
+                disabled=local_disabled,
+                type="primary" if st.session_state.selected_provider == "local" else "secondary",
+                key="select_local",
+                help=local_info.get('message', 'Local model not available')
+            ):
+                if st.session_state.selected_provider != "local":
+                    st.session_state.selected_provider = "local"
+                    st.session_state.assistant = None  # Force re-initialization
+                    st.rerun()
+        
         # Provider status
         if assistant_ready:
             provider_class = f"{st.session_state.provider}-badge" if st.session_state.provider else "ollama-badge"
@@ -938,6 +936,7 @@ def main():
                 <span class="status-indicator status-online"></span>
                 <span class="provider-badge {provider_class}">{provider_info}</span>
                 <span>AI Engine Ready!</span>
+                <small>Warmed up in {warm_report['seconds']:.1f}s{' (' + ', '.join(warm_report['errors']) + ' failed)' if warm_report['errors'] else ''}</small>
             </div>
             """, unsafe_allow_html=True)
         else:
@@ -1042,7 +1041,8 @@ def main():
                         show_examples = False
             
             # Process input
-            if send_button and user_input.strip():
+            if send_button and user_input.strip() and not replayed_input:
+                st.session_state.input_rerun_pending = True
                 st.session_state.conversation_state = "processing"
                 process_user_input(user_input.strip())
                 st.rerun()
@@ -1059,7 +1059,8 @@ def main():
                 ]
                 
                 for example in examples:
-                    if st.button(f"{example}", key=f"ex_{hash(example)}"):
+                    if st.button(f"{example}", key=f"ex_{hash(example)}") and not replayed_input:
+                        st.session_state.input_rerun_pending = True
                         st.session_state.conversation_state = "processing"
                         process_user_input(example)
                         st.rerun()
@@ -1164,35 +1165,32 @@ def main():
         """)
         
         st.markdown("---")
-        st.subheader("Supported Categories")
+        st.checkbox(
+            "Speculative mode",
+            key="speculative_mode",
+            help="Run the rule-based classifier alongside the AI and use it if the AI takes longer than "
+                 f"{speculative.DEFAULT_LLM_BUDGET:.0f}s; the AI result is merged in when it arrives"
+        )
+        
+        with st.expander("Diagnostics"):
+            # Assistants and HTTP sessions are shared by every session of this process
+            pool_stats = assistant_pool.stats()
+            st.write("**Shared assistants:**", ", ".join(pool_stats["assistants"]) or "none")
+            st.write("**HTTP sessions:**", ", ".join(pool_stats["http_sessions"]) or "none")
+            if st.button("Reload AI backends", key="reload_backends",
+                         help="Rebuild the shared assistants, e.g. after changing an API key or pulling a model"):
+                assistant_pool.release()
+                st.session_state.assistant = None
+                st.session_state.available_providers = {}
+                st.rerun()
         
-        categories_info = {
-            "dining": {
-                "required": ["cuisine", "party_size", "date", "time"],
-                "optional": ["location", "budget", "dietary_restrictions"]
-            },
-            "travel": {
-                "required": ["destination", "departure_date", "number_of_travelers"],
-                "optional": ["return_date", "budget", "accommodation_type"]
-            },
-            "gifting": {
-                "required": ["recipient", "occasion", "budget"],
-                "optional": ["gift_type", "relationship", "interests"]
-            },
-            "cab_booking": {
-                "required": ["pickup_location", "destination", "date", "time"],
-                "optional": ["vehicle_type", "number_of_passengers"]
-            },
-            "other": {
-                "required": [],
-                "optional": ["topic", "keywords", "specific_request"]
-            }
-        }
+        st.markdown("---")
+        st.subheader("Supported Categories")
         
-        for category, details in categories_info.items():
+        for category, schema in intent_schema.SCHEMAS.items():
             with st.expander(f"{category.title()}"):
-                st.write("**Required:**", ", ".join(details.get("required", [])))
-                st.write("**Optional:**", ", ".join(details.get("optional", [])))
+                st.write("**Required:**", ", ".join(schema.required))
+                st.write("**Optional:**", ", ".join(schema.optional))
 
     # Footer
     st.markdown("---")
@@ -0,0 +1,44 @@
+import os
+import time
+from typing import Optional
+
+# End-to-end budget for one user request (seconds)
+DEFAULT_REQUEST_BUDGET = float(os.getenv("NLPARSE_REQUEST_BUDGET", "25"))
+
+# Below this many seconds, answer generation is skipped and raw search results are returned
+MIN_GENERATION_BUDGET = float(os.getenv("NLPARSE_MIN_GENERATION_BUDGET", "2"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage is reached with no time left in the request budget"""
+
+
+class Deadline:
+    """Absolute point in time by which a request must finish
+
+    Created once per request and passed down through classification, web
+    search and answer generation. Each stage asks for a timeout that is its
+    own cap clipped to what is left, instead of using a fixed timeout.
+    """
+
+    def __init__(self, seconds: float = DEFAULT_REQUEST_BUDGET):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float, share: float = 1.0) -> float:
+        """Timeout for a stage: at most cap, and at most share of the remaining budget"""
+        return min(cap, self.remaining() * share)
+
+    def check(self, stage: str):
+        if self.expired():
+            raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
+
+
+def stage_timeout(deadline: Optional[Deadline], cap: float, share: float = 1.0) -> float:
+    """Timeout for a stage when a deadline may or may not have been passed in"""
+    return cap if deadline is None else deadline.timeout(cap, share)
@@ -0,0 +1,304 @@
+import argparse
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from intent_schema import SCHEMAS
+from replay import make_backend, percentile
+
+# USD per 1K tokens; defaults are gpt-3.5-turbo list prices
+OPENAI_PROMPT_PRICE = float(os.getenv("NLPARSE_OPENAI_PROMPT_PRICE", "0.0005"))
+OPENAI_COMPLETION_PRICE = float(os.getenv("NLPARSE_OPENAI_COMPLETION_PRICE", "0.0015"))
+
+CALIBRATION_BINS = 10
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    """Labeled JSONL: "text" (or "input"/"user_input"), "intent", and optionally gold "entities"
+
+    Gold entities, when given, are taken as complete for that intent's
+    schema fields: a schema field missing from them should stay empty.
+    """
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            result = record.get("result") or {}
+            text = record.get("text") or record.get("input") or record.get("user_input")
+            intent = record.get("intent") or record.get("intent_category") or result.get("intent_category")
+            if not text or intent not in SCHEMAS:
+                continue
+            entities = record.get("entities")
+            examples.append({"text": text, "intent": intent, "entities": entities if isinstance(entities, dict) else None})
+    return examples
+
+
+def normalize_value(value: Any) -> str:
+    text = " ".join(str(value).lower().replace("$", "").split()).strip(" .")
+    return text[:-2] if text.endswith(".0") else text
+
+
+def entity_counts(intent: str, gold: Dict[str, Any], predicted: Dict[str, Any]) -> Dict[str, List[int]]:
+    """Per-field [true positives, false positives, false negatives] over the gold intent's schema fields"""
+    counts = {}
+    for name in SCHEMAS[intent].by_name:
+        gold_value = gold.get(name)
+        predicted_value = predicted.get(name) if isinstance(predicted, dict) else None
+        has_gold = gold_value not in (None, "")
+        has_predicted = predicted_value not in (None, "")
+        if not has_gold and not has_predicted:
+            continue
+        match = has_gold and has_predicted and normalize_value(gold_value) == normalize_value(predicted_value)
+        counts[name] = [int(match), int(has_predicted and not match), int(has_gold and not match)]
+    return counts
+
+
+def f1(tp: int, fp: int, fn: int) -> float:
+    return 2 * tp / (2 * tp + fp + fn) if tp else 0.0
+
+
+def expected_calibration_error(confidences: List[float], correct: List[bool], bins: int = CALIBRATION_BINS) -> float:
+    """Gap between confidence and accuracy, averaged over equal-width confidence bins"""
+    grouped = defaultdict(list)
+    for confidence, is_correct in zip(confidences, correct):
+        grouped[min(int(confidence * bins), bins - 1)].append((confidence, is_correct))
+    total = len(confidences)
+    return sum(
+        len(rows) / total * abs(sum(c for c, _ in rows) / len(rows) - sum(ok for _, ok in rows) / len(rows))
+        for rows in grouped.values()
+    ) if total else 0.0
+
+
+def run_backend(name: str, examples: List[Dict[str, Any]], warmup: int = 0) -> List[Dict[str, Any]]:
+    """Classify every example one at a time (so latencies don't interfere) and record the outcome"""
+    backend = make_backend(name)
+    spend = None
+    if name == "openai":
+        from assistant_openai import spend
+
+    for example in examples[:warmup]:
+        try:
+            backend(example["text"])
+        except Exception:
+            pass
+
+    outcomes = []
+    for i, example in enumerate(examples):
+        session_id = f"eval-{name}-{i}-{time.time_ns()}"
+        start = time.perf_counter()
+        try:
+            result, error = backend(example["text"], session_id), None
+        except Exception as e:
+            result, error = None, str(e)
+        latency_ms = (time.perf_counter() - start) * 1000
+        cost = 0.0
+        if spend is not None:
+            usage = spend.session(session_id)
+            cost = (usage["prompt_tokens"] * OPENAI_PROMPT_PRICE + usage["completion_tokens"] * OPENAI_COMPLETION_PRICE) / 1000
+        outcomes.append({
+            "text": example["text"],
+            "gold_intent": example["intent"],
+            "intent": result["intent_category"] if result else None,
+            "confidence": float((result or {}).get("confidence_score") or 0.0),
+            "raw_confidence": float((result or {}).get("raw_confidence") or 0.0),
+            "gold_entities": example["entities"],
+            "entities": (result or {}).get("entities") or {},
+            "latency_ms": latency_ms,
+            "cost": cost,
+            "error": error,
+        })
+    return outcomes
+
+
+def summarize(name: str, outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Errors count as wrong answers, but not towards calibration: they carry no prediction
+    correct = [o["intent"] == o["gold_intent"] for o in outcomes]
+    confidences = [o["confidence"] for o in outcomes]
+    answered = [o for o in outcomes if not o["error"]]
+    latencies = [o["latency_ms"] for o in outcomes]
+
+    field_counts = defaultdict(lambda: [0, 0, 0])
+    for o in outcomes:
+        if o["gold_entities"] is None:
+            continue
+        # Entities only count when the intent is right; a wrong intent's fields are not comparable
+        predicted = o["entities"] if o["intent"] == o["gold_intent"] else {}
+        for field, counts in entity_counts(o["gold_intent"], o["gold_entities"], predicted).items():
+            for i, value in enumerate(counts):
+                field_counts[field][i] += value
+    totals = [sum(counts[i] for counts in field_counts.values()) for i in range(3)]
+
+    thresholds = {}
+    for threshold in THRESHOLDS:
+        kept = [ok for ok, confidence in zip(correct, confidences) if confidence >= threshold]
+        thresholds[str(threshold)] = {
+            "coverage": len(kept) / len(outcomes) if outcomes else 0.0,
+            "accuracy": sum(kept) / len(kept) if kept else 0.0,
+        }
+
+    total_cost = sum(o["cost"] for o in outcomes)
+    accuracy = sum(correct) / len(outcomes) if outcomes else 0.0
+    latency_p50 = percentile(latencies, 50)
+    return {
+        "backend": name,
+        "examples": len(outcomes),
+        "errors": sum(1 for o in outcomes if o["error"]),
+        "accuracy": accuracy,
+        "entity_f1": f1(*totals) if any(totals) else None,
+        "field_f1": {field: f1(*counts) for field, counts in sorted(field_counts.items())},
+        "ece": expected_calibration_error([o["confidence"] for o in answered],
+                                          [o["intent"] == o["gold_intent"] for o in answered]),
+        "latency_p50_ms": latency_p50,
+        "latency_p90_ms": percentile(latencies, 90),
+        "latency_p99_ms": percentile(latencies, 99),
+        "accuracy_per_ms": accuracy / latency_p50 if latency_p50 else None,
+        "cost_usd": total_cost,
+        "cost_per_1k_usd": total_cost / len(outcomes) * 1000 if outcomes else 0.0,
+        "thresholds": thresholds,
+    }
+
+
+def pareto_front(summaries: List[Dict[str, Any]]) -> List[str]:
+    """Backends no other backend beats on both accuracy and p50 latency"""
+    return [
+        s["backend"] for s in summaries
+        if not any(o is not s and o["accuracy"] >= s["accuracy"] and o["latency_p50_ms"] <= s["latency_p50_ms"]
+                   and (o["accuracy"] > s["accuracy"] or o["latency_p50_ms"] < s["latency_p50_ms"])
+                   for o in summaries)
+    ]
+
+
+def markdown_report(summaries: List[Dict[str, Any]], skipped: Dict[str, str] = None) -> str:
+    front = set(pareto_front(summaries))
+
+    def number(value, fmt):
+        return "-" if value is None else format(value, fmt)
+
+    lines = [
+        "| Backend | Accuracy | Entity F1 | ECE | p50 ms | p90 ms | p99 ms | Cost / 1K | Errors | Pareto |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for s in summaries:
+        lines.append(
+            f"| {s['backend']} | {s['accuracy']:.3f} | {number(s['entity_f1'], '.3f')} | {s['ece']:.3f} "
+            f"| {s['latency_p50_ms']:.2f} | {s['latency_p90_ms']:.2f} | {s['latency_p99_ms']:.2f} "
+            f"| ${s['cost_per_1k_usd']:.4f} | {s['errors']} | {'yes' if s['backend'] in front else ''} |"
+        )
+
+    lines += ["", "Accuracy / coverage when only answers at or above a confidence threshold are kept:", "",
+              "| Backend | " + " | ".join(f">= {t}" for t in THRESHOLDS) + " |",
+              "|---|" + "---|" * len(THRESHOLDS)]
+    for s in summaries:
+        cells = [f"{s['thresholds'][str(t)]['accuracy']:.2f} / {s['thresholds'][str(t)]['coverage']:.0%}" for t in THRESHOLDS]
+        lines.append(f"| {s['backend']} | " + " | ".join(cells) + " |")
+
+    fields = sorted({field for s in summaries for field in s["field_f1"]})
+    if fields:
+        lines += ["", "Entity F1 per field:", "", "| Field | " + " | ".join(s["backend"] for s in summaries) + " |",
+                  "|---|" + "---|" * len(summaries)]
+        for field in fields:
+            cells = [number(s["field_f1"].get(field), ".2f") for s in summaries]
+            lines.append(f"| {field} | " + " | ".join(cells) + " |")
+
+    if skipped:
+        lines += ["", "Skipped (not available):", ""] + [f"- {name}: {reason}" for name, reason in skipped.items()]
+    return "\n".join(lines) + "\n"
+
+
+def pareto_svg(summaries: List[Dict[str, Any]], width: int = 640, height: int = 400) -> str:
+    """Accuracy against p50 latency (log scale), with the Pareto front joined up"""
+    left, right, top, bottom = 60, 20, 20, 50
+    latencies = [max(s["latency_p50_ms"], 0.01) for s in summaries]
+    low = math.floor(math.log10(min(latencies)))
+    high = max(math.ceil(math.log10(max(latencies))), low + 1)
+
+    def x(latency):
+        return left + (math.log10(max(latency, 0.01)) - low) / (high - low) * (width - left - right)
+
+    def y(accuracy):
+        return top + (1 - accuracy) * (height - top - bottom)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" font-size="12">',
+        f'<rect width="{width}" height="{height}" fill="white"/>',
+        f'<line x1="{left}" y1="{y(0)}" x2="{width - right}" y2="{y(0)}" stroke="black"/>',
+        f'<line x1="{left}" y1="{top}" x2="{left}" y2="{y(0)}" stroke="black"/>',
+        f'<text x="{(left + width - right) / 2}" y="{height - 10}" text-anchor="middle">p50 latency (ms, log scale)</text>',
+        f'<text x="15" y="{(top + y(0)) / 2}" text-anchor="middle" transform="rotate(-90 15 {(top + y(0)) / 2})">intent accuracy</text>',
+    ]
+    for exponent in range(low, high + 1):
+        tick = x(10 ** exponent)
+        parts.append(f'<line x1="{tick:.1f}" y1="{y(0)}" x2="{tick:.1f}" y2="{y(0) + 5}" stroke="black"/>')
+        parts.append(f'<text x="{tick:.1f}" y="{y(0) + 18}" text-anchor="middle">{10 ** exponent:g}</text>')
+    for step in range(0, 11, 2):
+        accuracy = step / 10
+        parts.append(f'<line x1="{left - 5}" y1="{y(accuracy):.1f}" x2="{width - right}" y2="{y(accuracy):.1f}" stroke="#eee"/>')
+        parts.append(f'<text x="{left - 8}" y="{y(accuracy) + 4:.1f}" text-anchor="end">{accuracy:.1f}</text>')
+
+    front = set(pareto_front(summaries))
+    points = sorted((s for s in summaries if s["backend"] in front), key=lambda s: s["latency_p50_ms"])
+    if len(points) > 1:
+        path = " ".join(f"{x(s['latency_p50_ms']):.1f},{y(s['accuracy']):.1f}" for s in points)
+        parts.append(f'<polyline points="{path}" fill="none" stroke="#1976d2" stroke-dasharray="4 3"/>')
+    for s in summaries:
+        color = "#1976d2" if s["backend"] in front else "#999"
+        cx, cy = x(s["latency_p50_ms"]), y(s["accuracy"])
+        parts.append(f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="5" fill="{color}"/>')
+        parts.append(f'<text x="{cx + 8:.1f}" y="{cy - 8:.1f}">{s["backend"]} ({s["accuracy"]:.2f})</text>')
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare backends on a labeled dataset: accuracy, entity F1, calibration, latency and cost")
+    parser.add_argument("data", help="Labeled JSONL (text, intent, optional entities)")
+    parser.add_argument("--backends", default="rules", help="Comma-separated: rules, local, ollama, openai")
+    parser.add_argument("--limit", type=int, default=None, help="Use at most this many examples")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests per backend before measuring")
+    parser.add_argument("-o", "--output", default=None, help="Write the markdown report here")
+    parser.add_argument("--svg", default=None, help="Write the Pareto chart (SVG) here")
+    parser.add_argument("--json", default=None, help="Write summaries and per-example outcomes as JSON")
+    args = parser.parse_args()
+
+    examples = load_dataset(args.data)
+    examples = examples[:args.limit] if args.limit else examples
+    if not examples:
+        print("No labeled examples found")
+        return
+
+    summaries, all_outcomes, skipped = [], {}, {}
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"Evaluating {name} on {len(examples)} examples...")
+        try:
+            outcomes = run_backend(name, examples, warmup=args.warmup)
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            skipped[name] = str(e)
+            continue
+        all_outcomes[name] = outcomes
+        summaries.append(summarize(name, outcomes))
+
+    if not summaries:
+        return
+    report = markdown_report(summaries, skipped)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    if args.svg:
+        with open(args.svg, "w", encoding="utf-8") as f:
+            f.write(pareto_svg(summaries))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summaries": summaries, "skipped": skipped, "outcomes": all_outcomes}, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
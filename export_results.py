@@ -0,0 +1,255 @@
+import argparse
+import csv
+import glob
+import gzip
+import json
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import intent_schema
+from request_log import read_records
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+
+STAGES = ("classify", "search", "generate", "fallback", "total")
+ENTITY_FIELDS = tuple(dict.fromkeys(spec.name for schema in intent_schema.SCHEMAS.values() for spec in schema.fields))
+ENTITY_COLUMNS = frozenset(ENTITY_FIELDS)
+COLUMNS = (
+    ["timestamp", "date", "session_id", "source", "kind", "backend", "prompt_version", "input",
+     "intent", "confidence", "processing_mode", "fallback_reason"]
+    + [f"timing_{stage}" for stage in STAGES]
+    + [f"entity_{field}" for field in ENTITY_FIELDS]
+    + ["entities_other"]
+)
+FLOAT_COLUMNS = frozenset(["confidence"] + [f"timing_{stage}" for stage in STAGES])
+
+
+def _float(value: Any) -> Optional[float]:
+    """A number for the float64 columns; chat exports and old logs may hold strings or junk"""
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def flatten(record: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """One flat row per classification result; schema fields become entity_* columns"""
+    result = record.get("result") or {}
+    entities = result.get("entities") or {}
+    timings = record.get("timings") or {}
+    timestamp = record.get("timestamp") or ""
+    row = {
+        "timestamp": timestamp,
+        "date": timestamp[:10] or "unknown",
+        "session_id": record.get("session_id"),
+        "source": source,
+        "kind": record.get("kind"),
+        "backend": record.get("backend"),
+        "prompt_version": record.get("prompt_version"),
+        "input": record.get("input"),
+        "intent": result.get("intent_category") or "unknown",
+        "confidence": _float(result.get("confidence_score")),
+        "processing_mode": record.get("processing_mode"),
+        "fallback_reason": record.get("fallback_reason"),
+    }
+    for stage in STAGES:
+        row[f"timing_{stage}"] = _float(timings.get(stage))
+    for field in ENTITY_FIELDS:
+        value = entities.get(field)
+        row[f"entity_{field}"] = None if value is None else str(value)
+    other = {k: v for k, v in entities.items() if k not in ENTITY_COLUMNS}
+    row["entities_other"] = json.dumps(other, default=str) if other else None
+    return row
+
+
+def iter_log_rows(path: str) -> Iterator[Dict[str, Any]]:
+    for record in read_records(path):
+        if record.get("result"):
+            yield flatten(record, "request_log")
+
+
+def iter_export_rows(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Rows from the app's "Download Chat" JSON files (one row per assistant reply with a result)"""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            export = json.load(f)
+        exported_at = export.get("exported_at") or ""
+        for message in export.get("chat_history", []):
+            metadata = message.get("metadata") or {}
+            if message.get("role") != "assistant" or not metadata.get("intent"):
+                continue
+            # Chat messages only carry the time of day
+            time_of_day = message.get("timestamp")
+            yield flatten({
+                "timestamp": f"{exported_at[:10]}T{time_of_day}" if exported_at and time_of_day else exported_at,
+                "kind": "followup" if metadata.get("processing_mode") == "followup" else "request",
+                "processing_mode": metadata.get("processing_mode"),
+                "result": {
+                    "intent_category": metadata.get("intent"),
+                    "entities": metadata.get("entities"),
+                    "confidence_score": metadata.get("confidence"),
+                },
+            }, os.path.basename(path))
+
+
+class PartitionedWriter:
+    """Buffer rows per partition and write them out in batches
+
+    A partition is written once it has batch_size rows buffered, and at
+    most max_buffered rows (default 4 * batch_size) are buffered across all
+    partitions: beyond that the largest buffer is written early, so memory
+    stays bounded however many partitions the data has. Partitions are
+    Hive-style directories (date=2024-05-31/intent=dining/). At most
+    max_open files are open at once; the least recently written one is
+    closed beyond that, and its partition gets a new part file if more
+    rows come for it.
+    """
+
+    def __init__(self, output_dir: str, fmt: str = "parquet", partition_by: Tuple[str, ...] = (),
+                 batch_size: int = 10000, max_open: int = 64, max_buffered: Optional[int] = None):
+        if fmt in ("parquet", "arrow") and not pyarrow_available:
+            print("pyarrow not installed; writing gzip CSV instead")
+            fmt = "csv"
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.partition_by = partition_by
+        self.batch_size = batch_size
+        self.max_open = max(1, max_open)
+        self.max_buffered = max(1, max_buffered or 4 * batch_size)
+        self.rows_written = 0
+        self._buffers: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._buffered = 0
+        # (writer, file handle or None) per partition, least recently written first
+        self._writers: "OrderedDict[tuple, Tuple[Any, Any]]" = OrderedDict()
+        if pyarrow_available:
+            self._schema = pa.schema([
+                (column, pa.float64() if column in FLOAT_COLUMNS else pa.string()) for column in COLUMNS
+            ])
+
+    def write(self, row: Dict[str, Any]):
+        key = tuple(str(row.get(column) or "unknown") for column in self.partition_by)
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(row)
+        self._buffered += 1
+        if len(buffer) >= self.batch_size:
+            self._flush(key)
+        elif self._buffered >= self.max_buffered:
+            self._flush(max(self._buffers, key=lambda k: len(self._buffers[k])))
+
+    def _path(self, key: tuple) -> str:
+        directory = os.path.join(self.output_dir, *(f"{column}={value}" for column, value in zip(self.partition_by, key)))
+        os.makedirs(directory, exist_ok=True)
+        extension = {"parquet": "parquet", "arrow": "arrow", "csv": "csv.gz"}[self.fmt]
+        return os.path.join(directory, f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.{extension}")
+
+    def _flush(self, key: tuple):
+        rows = self._buffers.pop(key, [])
+        if not rows:
+            return
+        self._buffered -= len(rows)
+        writer = self._open(key)
+        if self.fmt == "csv":
+            writer.writerows(rows)
+        else:
+            writer.write_table(pa.Table.from_pylist(rows, schema=self._schema))
+        self.rows_written += len(rows)
+
+    def _open(self, key: tuple):
+        """The partition's current writer, opening a new part file (and closing the oldest) if needed"""
+        if key in self._writers:
+            self._writers.move_to_end(key)
+            return self._writers[key][0]
+        while len(self._writers) >= self.max_open:
+            self._close_writer(*self._writers.popitem(last=False)[1])
+        path = self._path(key)
+        handle = None
+        if self.fmt == "csv":
+            handle = gzip.open(path, "wt", encoding="utf-8", newline="")
+            writer = csv.DictWriter(handle, fieldnames=COLUMNS)
+            writer.writeheader()
+        elif self.fmt == "parquet":
+            writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+        else:
+            handle = pa.OSFile(path, "wb")
+            writer = pa.ipc.new_file(handle, self._schema)
+        self._writers[key] = (writer, handle)
+        return writer
+
+    def _close_writer(self, writer, handle):
+        if self.fmt != "csv":
+            writer.close()
+        if handle is not None:
+            handle.close()
+
+    def close(self):
+        for key in list(self._buffers):
+            self._flush(key)
+        while self._writers:
+            self._close_writer(*self._writers.popitem(last=False)[1])
+
+
+def export(rows: Iterable[Dict[str, Any]], output_dir: str, fmt: str = "parquet",
+           partition_by: Tuple[str, ...] = (), batch_size: int = 10000,
+           since: Optional[str] = None, max_open: int = 64, max_buffered: Optional[int] = None) -> int:
+    """Write rows to output_dir; since (YYYY-MM-DD) skips older rows. Returns the row count"""
+    writer = PartitionedWriter(output_dir, fmt, partition_by, batch_size, max_open, max_buffered)
+    try:
+        for row in rows:
+            if since and row["date"] < since:
+                continue
+            writer.write(row)
+    finally:
+        writer.close()
+    return writer.rows_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export classification results to Parquet, Arrow or gzip CSV")
+    parser.add_argument("--log", default=os.getenv("NLPARSE_REQUEST_LOG"), help="Request log (rotated files included)")
+    parser.add_argument("--sessions", nargs="*", default=[], help="Chat export JSON files or glob patterns")
+    parser.add_argument("-o", "--output", default="exports")
+    parser.add_argument("--format", choices=["parquet", "arrow", "csv"], default="parquet")
+    parser.add_argument("--partition-by", default="date,intent",
+                        help="Comma-separated columns to partition by (empty for none)")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--max-open-files", type=int, default=64,
+                        help="Part files kept open at once; more partitions roll over to new part files")
+    parser.add_argument("--max-buffered-rows", type=int, default=None,
+                        help="Rows buffered across all partitions before the largest is written (default: 4 x batch size)")
+    parser.add_argument("--since", default=None, help="Only rows on or after this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    sources = []
+    if args.log:
+        sources.append(iter_log_rows(args.log))
+    session_files = [path for pattern in args.sessions for path in sorted(glob.glob(pattern))]
+    if session_files:
+        sources.append(iter_export_rows(session_files))
+    if not sources:
+        parser.error("nothing to export: pass --log (or set NLPARSE_REQUEST_LOG) and/or --sessions")
+
+    partition_by = tuple(column for column in args.partition_by.split(",") if column)
+    unknown = [column for column in partition_by if column not in COLUMNS]
+    if unknown:
+        parser.error(f"unknown partition columns: {', '.join(unknown)}")
+
+    def all_rows():
+        for source in sources:
+            yield from source
+
+    count = export(all_rows(), args.output, args.format, partition_by, args.batch_size, args.since,
+                   args.max_open_files, args.max_buffered_rows)
+    print(f"Exported {count} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+import requests
+
+# Path prefix -> upstream base URL; clients point at http://host:port/<prefix>
+UPSTREAMS = {
+    "ollama": os.getenv("NLPARSE_FIXTURE_OLLAMA_UPSTREAM", "http://localhost:11434"),
+    "openai": os.getenv("NLPARSE_FIXTURE_OPENAI_UPSTREAM", "https://api.openai.com"),
+    "ddg": os.getenv("NLPARSE_FIXTURE_DDG_UPSTREAM", "https://api.duckduckgo.com"),
+}
+
+# Never written to fixtures, and not forwarded as-is
+SKIPPED_HEADERS = frozenset(["host", "content-length", "connection", "accept-encoding"])
+
+
+def fixture_key(method: str, path: str, body: bytes) -> str:
+    """Stable key for a request: method, path, sorted query and canonical JSON body"""
+    parsed = urllib.parse.urlsplit(path)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)))
+    try:
+        canonical_body = json.dumps(json.loads(body), sort_keys=True) if body else ""
+    except ValueError:
+        canonical_body = body.decode("utf-8", errors="replace")
+    raw = "\n".join([method.upper(), parsed.path, query, canonical_body])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class FixtureStore:
+    """One JSON file per recorded exchange, named by fixture_key"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Dict[str, Any]] = {}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._cache[key] = fixture
+        return fixture
+
+    def put(self, key: str, fixture: Dict[str, Any]):
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, indent=2)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._cache[key] = fixture
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """HTTP server that records exchanges through to the upstreams, or replays them
+
+    In "replay" mode each response is delayed by a fixed latency (plus
+    uniform jitter) or, with latency=None, by the latency measured when the
+    fixture was recorded times latency_scale.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, store: FixtureStore, mode: str = "replay", latency: Optional[float] = None,
+                 latency_scale: float = 1.0, jitter: float = 0.0):
+        super().__init__(address, FixtureHandler)
+        self.store = store
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.upstream = requests.Session()
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "recorded": 0, "upstream_errors": 0}
+
+    def count(self, name: str):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def delay_for(self, fixture: Dict[str, Any]) -> float:
+        base = fixture.get("latency", 0.0) * self.latency_scale if self.latency is None else self.latency
+        return max(0.0, base + random.uniform(-self.jitter, self.jitter))
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server: FixtureServer
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        self.server.count("requests")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        prefix, _, rest = self.path.lstrip("/").partition("/")
+        if prefix not in UPSTREAMS:
+            return self._send(404, {"Content-Type": "application/json"}, json.dumps({"error": f"unknown prefix '{prefix}'"}).encode())
+        key = fixture_key(self.command, self.path, body)
+
+        if self.server.mode == "record":
+            fixture = self._record(prefix, rest, body)
+            if fixture is None:
+                return self._send(502, {"Content-Type": "application/json"}, b'{"error": "upstream failed"}')
+            self.server.store.put(key, fixture)
+            self.server.count("recorded")
+        else:
+            fixture = self.server.store.get(key)
+            if fixture is None:
+                self.server.count("misses")
+                return self._send(404, {"Content-Type": "application/json"},
+                                  json.dumps({"error": "no fixture", "path": self.path}).encode())
+            self.server.count("hits")
+            time.sleep(self.server.delay_for(fixture))
+
+        self._send(fixture["status"], fixture["headers"], fixture["body"].encode("utf-8"))
+
+    def _record(self, prefix: str, rest: str, body: bytes) -> Optional[Dict[str, Any]]:
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in SKIPPED_HEADERS}
+        start = time.perf_counter()
+        try:
+            response = self.server.upstream.request(
+                self.command, f"{UPSTREAMS[prefix].rstrip('/')}/{rest}", headers=headers, data=body or None, timeout=120
+            )
+        except requests.RequestException as e:
+            print(f"Upstream request failed: {e}")
+            self.server.count("upstream_errors")
+            return None
+        return {
+            # Request headers are not stored, so API keys never end up in fixtures
+            "request": {"method": self.command, "path": self.path, "body": body.decode("utf-8", errors="replace")},
+            "status": response.status_code,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "application/json")},
+            "body": response.text,
+            "latency": round(time.perf_counter() - start, 4)
+        }
+
+    def _send(self, status: int, headers: Dict[str, str], body: bytes):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def client_env(host: str, port: int) -> Dict[str, str]:
+    """Environment variables that point the assistants and WebSearcher at a fixture server"""
+    base = f"http://{host}:{port}"
+    return {
+        "OLLAMA_URL": f"{base}/ollama",
+        "OPENAI_BASE_URL": f"{base}/openai/v1",
+        "NLPARSE_DDG_URL": f"{base}/ddg/",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay HTTP fixtures for Ollama, OpenAI and DuckDuckGo")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--store", default="fixtures", help="Fixture directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=None,
+                        help="Fixed response delay in seconds (default: the recorded latency)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for recorded latencies")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform jitter added to each delay (seconds)")
+    args = parser.parse_args()
+
+    server = FixtureServer((args.host, args.port), FixtureStore(args.store), mode=args.mode,
+                           latency=args.latency, latency_scale=args.latency_scale, jitter=args.jitter)
+    print(f"{args.mode.title()}ing fixtures in {args.store} on {args.host}:{args.port}. Point clients at it with:")
+    for name, value in client_env(args.host, args.port).items():
+        print(f"  export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+INTENTS = ["dining", "travel", "gifting", "cab_booking", "other"]
+DEFAULT_MODEL_PATH = os.getenv("NLPARSE_INTENT_MODEL", os.path.join("models", "intent_model.npz"))
+
+TOKEN_RE = re.compile(r"[a-z0-9$']+")
+
+
+def extract_features(text: str, n_features: int) -> np.ndarray:
+    """Hash word unigrams, word bigrams and character trigrams into feature indices
+
+    Character trigrams keep misspellings like "dinning" close to "dining".
+    Index 0 is reserved as an always-on bias feature so no row is empty.
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    grams = [f"w:{token}" for token in tokens]
+    grams += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"<{token}>"
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+
+    buckets = n_features - 1
+    indices = {0}
+    for gram in grams:
+        indices.add(1 + zlib.crc32(gram.encode("utf-8")) % buckets)
+    return np.fromiter(indices, dtype=np.int64, count=len(indices))
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentModel:
+    """Multinomial logistic regression over hashed n-gram features
+
+    Rows are binary feature sets scaled to unit L2 norm, so a prediction is
+    one gather-and-sum over the weight matrix. Probabilities are calibrated
+    with a single softmax temperature fitted on a held-out split.
+    """
+
+    def __init__(self, weights: np.ndarray, temperature: float = 1.0, intents: List[str] = None):
+        self.weights = weights.astype(np.float32)
+        self.temperature = float(temperature)
+        self.intents = list(intents or INTENTS)
+        self.n_features = weights.shape[0]
+
+    def _logits(self, text: str) -> np.ndarray:
+        indices = extract_features(text, self.n_features)
+        return self.weights[indices].sum(axis=0) / np.sqrt(len(indices))
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """Return calibrated probabilities for every intent"""
+        probs = _softmax(self._logits(text) / self.temperature)
+        return {intent: float(p) for intent, p in zip(self.intents, probs)}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Return the most likely intent and its probability"""
+        probs = _softmax(self._logits(text) / self.temperature)
+        best = int(probs.argmax())
+        return self.intents[best], float(probs[best])
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[str], n_features: int = 2 ** 16, epochs: int = 300,
+              learning_rate: float = 2.0, l2: float = 1e-4, holdout: float = 0.1, seed: int = 0) -> "IntentModel":
+        """Fit the model with full-batch gradient descent, then fit the temperature on a holdout split"""
+        if not texts:
+            raise ValueError("No training examples")
+        label_ids = np.array([INTENTS.index(label) for label in labels])
+
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(texts))
+        n_holdout = int(len(texts) * holdout) if len(texts) >= 50 else 0
+        held, train = order[:n_holdout], order[n_holdout:]
+
+        def encode(rows):
+            rows_features = [extract_features(texts[i], n_features) for i in rows]
+            indptr = np.zeros(len(rows_features) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(f) for f in rows_features])
+            indices = np.concatenate(rows_features)
+            values = np.repeat([1.0 / np.sqrt(len(f)) for f in rows_features], [len(f) for f in rows_features])
+            return indptr, indices, values.astype(np.float32)
+
+        def logits_for(weights, encoded):
+            indptr, indices, values = encoded
+            return np.add.reduceat(weights[indices] * values[:, None], indptr[:-1], axis=0)
+
+        encoded = encode(train)
+        row_of_index = np.repeat(np.arange(len(train)), np.diff(encoded[0]))
+        targets = np.eye(len(INTENTS), dtype=np.float32)[label_ids[train]]
+        weights = np.zeros((n_features, len(INTENTS)), dtype=np.float32)
+
+        for _ in range(epochs):
+            error = (_softmax(logits_for(weights, encoded)) - targets) / len(train)
+            grad = np.zeros_like(weights)
+            np.add.at(grad, encoded[1], encoded[2][:, None] * error[row_of_index])
+            weights -= learning_rate * (grad + l2 * weights)
+
+        temperature = 1.0
+        if n_holdout:
+            held_logits = logits_for(weights, encode(held))
+            held_labels = label_ids[held]
+
+            def nll(t):
+                probs = _softmax(held_logits / t)
+                return -np.log(probs[np.arange(len(held)), held_labels] + 1e-12).mean()
+
+            temperature = float(min(np.geomspace(0.1, 10.0, 100), key=nll))
+
+        return cls(weights, temperature)
+
+    def save(self, path: str):
+        """Save as a compressed .npz with float16 weights"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            weights=self.weights.astype(np.float16),
+            temperature=np.array(self.temperature),
+            intents=np.array(self.intents)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with np.load(path) as data:
+            return cls(data["weights"], float(data["temperature"]), [str(i) for i in data["intents"]])
+
+
+# Loaded models by path, so assistants configured with different model files each get their own
+_models: Dict[str, IntentModel] = {}
+_model_lock = threading.Lock()
+
+
+def get_model(path: str = None) -> Optional[IntentModel]:
+    """Load the model at path (default: DEFAULT_MODEL_PATH) on first use; returns None if the file doesn't exist"""
+    path = path or DEFAULT_MODEL_PATH
+    model = _models.get(path)
+    if model is None:
+        with _model_lock:
+            model = _models.get(path)
+            if model is None:
+                if not os.path.exists(path):
+                    return None
+                model = _models[path] = IntentModel.load(path)
+    return model
+
+
+def load_examples(path: str, min_confidence: float = 0.0) -> Tuple[List[str], List[str]]:
+    """Read labeled JSONL
+
+    Each line needs the request text ("text", "input" or "user_input") and a
+    label ("intent", "intent_category", or a logged "result" object). Logged
+    LLM outputs can be distilled by setting min_confidence to drop low
+    confidence labels.
+    """
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            result = record.get("result") or {}
+            text = record.get("text") or record.get("input") or record.get("user_input")
+            label = record.get("intent") or record.get("intent_category") or result.get("intent_category")
+            confidence = record.get("confidence_score", result.get("confidence_score", 1.0))
+            if not text or label not in INTENTS or (confidence or 0.0) < min_confidence:
+                continue
+            texts.append(text)
+            labels.append(label)
+    return texts, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or query the local intent model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train from labeled JSONL")
+    train_parser.add_argument("data", nargs="+", help="Labeled JSONL files")
+    train_parser.add_argument("-o", "--output", default=DEFAULT_MODEL_PATH)
+    train_parser.add_argument("--features", type=int, default=2 ** 16, help="Hashed feature buckets")
+    train_parser.add_argument("--epochs", type=int, default=300)
+    train_parser.add_argument("--min-confidence", type=float, default=0.0,
+                              help="Skip logged labels below this confidence when distilling")
+
+    predict_parser = subparsers.add_parser("predict", help="Print intent probabilities for a request")
+    predict_parser.add_argument("text")
+    predict_parser.add_argument("-m", "--model", default=DEFAULT_MODEL_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        texts, labels = [], []
+        for path in args.data:
+            file_texts, file_labels = load_examples(path, args.min_confidence)
+            texts += file_texts
+            labels += file_labels
+        model = IntentModel.train(texts, labels, n_features=args.features, epochs=args.epochs)
+        model.save(args.output)
+        print(f"Trained on {len(texts)} examples (temperature {model.temperature:.2f}), saved to {args.output}")
+    else:
+        model = IntentModel.load(args.model)
+        print(json.dumps(model.predict_proba(args.text), indent=2))
+
+
+if __name__ == "__main__":
+    main()
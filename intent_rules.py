@@ -0,0 +1,226 @@
+import re
+import string
+from typing import Dict, Any
+import assistant_pool
+from intent_schema import SCHEMAS
+
+# Keywords for each intent, scored by substring match
+INTENT_KEYWORDS = {
+    "dining": ["restaurant", "dinner", "lunch", "breakfast", "table", "booking", "reservation", "eat", "food", "cuisine", "menu", "dinning"],
+    "travel": ["trip", "travel", "flight", "hotel", "vacation", "visit", "destination", "booking", "tickets"],
+    "gifting": ["gift", "present", "birthday", "anniversary", "occasion", "buy", "shopping"],
+    "cab_booking": ["cab", "taxi", "uber", "lyft", "ride", "pickup", "drop", "airport", "transport"],
+    "other": []
+}
+
+CUISINES = ["italian", "chinese", "indian", "mexican", "french", "japanese", "thai", "american", "mediterranean", "korean", "vietnamese", "greek", "spanish", "turkish", "lebanese", "moroccan"]
+OCCASIONS = ["birthday", "anniversary", "wedding", "graduation", "christmas", "valentine", "mother's day", "father's day"]
+RELATIONSHIPS = ["mom", "mother", "dad", "father", "sister", "brother", "friend", "wife", "husband", "girlfriend", "boyfriend"]
+STOP_WORDS = frozenset(['this', 'that', 'with', 'have', 'will', 'from', 'they', 'been', 'said', 'each', 'which', 'their'])
+
+# Patterns are compiled once at import so repeated calls (and pool workers) skip the regex cache lookup
+NUMBER_RE = re.compile(r'\b\d+\b')
+TIME_RE = re.compile(r'\b\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM)\b')
+DATE_RES = [re.compile(pattern) for pattern in [
+    r'\b\d{1,2}(?:st|nd|rd|th)?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)\s*,?\s*\d{4}\b',
+    r'\b(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(?:st|nd|rd|th)?\s*,?\s*\d{4}\b',
+    r'\b\d{1,2}(?:st|nd|rd|th)?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)\b',
+    r'\b(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(?:st|nd|rd|th)?\b',
+    r'\b\d{1,2}/\d{1,2}/\d{4}\b',
+    r'\b\d{1,2}/\d{1,2}\b',
+    r'\b\d{4}-\d{1,2}-\d{1,2}\b',
+    r'\btoday\b',
+    r'\btomorrow\b',
+    r'\bnext\s+(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
+    r'\bthis\s+(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b'
+]]
+BUDGET_RE = re.compile(r'\b(?:budget|cost|price|spend|around|under|max|maximum)\s*(?:of|is|at)?\s*\$?(\d+)\b')
+PARTY_SIZE_RE = re.compile(r'\b(?:for|party\s+of|table\s+for)\s*(\d+)\s*(?:people?|person|pax|guests?)?\b|\b(\d+)\s*(?:person|people|pax|guests?)\b')
+DESTINATION_RE = re.compile(r'\bto\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\b')
+FROM_RE = re.compile(r'\bfrom\s+([^,]+?)(?:\s+to|\s+at|$)')
+TO_RE = re.compile(r'\bto\s+([^,]+?)(?:\s+at|$)')
+TOPIC_RES = [re.compile(pattern) for pattern in [
+    r'how to\s+(.+?)(?:\?|$)',
+    r'what is\s+(.+?)(?:\?|$)',
+    r'where is\s+(.+?)(?:\?|$)',
+    r'when is\s+(.+?)(?:\?|$)',
+    r'update\s+(.+?)(?:\s+in|\s+on|$)',
+    r'(.+?)\s+(?:procedure|process|steps|method)',
+]]
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+
+def score_intents(user_input_lower: str) -> Dict[str, int]:
+    """Count keyword hits per intent, omitting intents with no hits"""
+    scores = {}
+    for intent, keywords in INTENT_KEYWORDS.items():
+        score = sum(1 for keyword in keywords if keyword in user_input_lower)
+        if score > 0:
+            scores[intent] = score
+    return scores
+
+
+def extract_entities(user_input: str, intent: str) -> Dict[str, Any]:
+    """Extract the entity fields for the given intent using regex patterns"""
+    user_input_lower = user_input.lower()
+
+    # Extract numbers (for party size, budget, etc.)
+    numbers = NUMBER_RE.findall(user_input)
+
+    # Improved time patterns
+    time_patterns = TIME_RE.findall(user_input)
+
+    # Improved date patterns
+    date_patterns = []
+    for pattern in DATE_RES:
+        date_patterns.extend(pattern.findall(user_input_lower))
+
+    # Extract budget patterns
+    budget_patterns = BUDGET_RE.findall(user_input_lower)
+
+    # Extract party size patterns
+    party_size_patterns = PARTY_SIZE_RE.findall(user_input_lower)
+    party_size = None
+    if party_size_patterns:
+        for pattern_groups in party_size_patterns:
+            for group in pattern_groups:
+                if group and group.isdigit():
+                    party_size = group
+                    break
+            if party_size:
+                break
+
+    if not party_size and numbers:
+        for num in numbers:
+            if 1 <= int(num) <= 20:
+                party_size = num
+                break
+
+    date = date_patterns[0] if date_patterns else None
+    budget = budget_patterns[0] if budget_patterns else None
+    schema = SCHEMAS.get(intent, SCHEMAS["other"])
+
+    if intent == "dining":
+        entities = schema.new_record(
+            party_size=party_size,
+            date=date,
+            time=time_patterns[0] if time_patterns else None,
+            budget=budget
+        )
+
+        # Extract cuisine types
+        for cuisine in CUISINES:
+            if cuisine in user_input_lower:
+                entities.cuisine = cuisine.title()
+                break
+
+    elif intent == "travel":
+        entities = schema.new_record(
+            departure_date=date,
+            number_of_travelers=party_size,
+            budget=budget
+        )
+
+        destinations = DESTINATION_RE.findall(user_input)
+        if destinations:
+            entities.destination = destinations[0]
+
+    elif intent == "gifting":
+        entities = schema.new_record(
+            budget=budget_patterns[0] if budget_patterns else (numbers[0] if numbers else None)
+        )
+
+        for occasion in OCCASIONS:
+            if occasion in user_input_lower:
+                entities.occasion = occasion.title()
+                break
+
+        for rel in RELATIONSHIPS:
+            if rel in user_input_lower:
+                entities.recipient = rel.title()
+                entities.relationship = rel
+                break
+
+    elif intent == "cab_booking":
+        entities = schema.new_record(
+            date=date,
+            time=time_patterns[0] if time_patterns else None,
+            number_of_passengers=party_size
+        )
+
+        from_matches = FROM_RE.findall(user_input_lower)
+        to_matches = TO_RE.findall(user_input_lower)
+
+        if from_matches:
+            entities.pickup_location = from_matches[0].strip()
+        if to_matches:
+            entities.destination = to_matches[0].strip()
+
+    else:
+        # For "other" category
+        entities = schema.new_record(query=user_input, specific_request=user_input)
+
+        for pattern in TOPIC_RES:
+            matches = pattern.findall(user_input_lower)
+            if matches:
+                entities.topic = matches[0].strip()
+                entities.keywords = matches[0].strip()
+                break
+
+        if not entities.topic:
+            words = user_input.translate(PUNCTUATION_TABLE).split()
+            key_words = [word for word in words if len(word) > 3 and word.lower() not in STOP_WORDS]
+            if key_words:
+                entities.keywords = " ".join(key_words[:5])
+
+    # Don't clean up entities - keep None values so follow-up questions can be generated
+    # Only remove empty strings, but keep None values for required field detection
+    return entities.to_dict()
+
+
+def fallback_intent_classifier(user_input: str, web_search: bool = True, deadline=None) -> Dict[str, Any]:
+    """Fallback rule-based classifier when AI models fail
+
+    Set web_search=False to skip the web lookup for "other" requests
+    (used by batch classification, where the rule path must stay CPU-only).
+    The web lookup uses whatever is left of deadline, if one is given.
+    """
+    user_input_lower = user_input.lower()
+
+    # Score each intent based on keyword matches
+    scores = score_intents(user_input_lower)
+
+    # Determine best intent
+    if scores:
+        best_intent = max(scores, key=scores.get)
+    else:
+        best_intent = "other"
+
+    entities = extract_entities(user_input, best_intent)
+
+    # For "other" intent, perform web search
+    if best_intent == "other" and web_search:
+        try:
+            search_summary = assistant_pool.web_searcher().get_search_summary(user_input, deadline=deadline)
+
+            # Create a simple response based on search results
+            if "No search results found" not in search_summary:
+                entities["web_search_performed"] = True
+                entities["search_query"] = user_input
+                entities["ai_response"] = f"Based on web search results:\n\n{search_summary}"
+                confidence = 0.75  # Higher confidence with web results
+            else:
+                confidence = 0.3
+        except Exception as e:
+            print(f"Web search failed in fallback classifier: {e}")
+            confidence = 0.3
+    elif scores:
+        confidence = min(scores[best_intent] * 0.15 + 0.3, 0.9)
+    else:
+        confidence = 0.3
+
+    return {
+        "intent_category": best_intent,
+        "entities": entities,
+        "confidence_score": confidence
+    }
@@ -0,0 +1,150 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_FOLLOW_UPS = 4
+
+
+class FieldSpec:
+    """One entity field: its name, value type, whether it is required, and how to ask for it"""
+
+    __slots__ = ("name", "type", "required", "question")
+
+    def __init__(self, name: str, type: str = "text", required: bool = False, question: str = None):
+        self.name = name
+        # One of: text, count, date, time, money, location, cuisine
+        self.type = type
+        self.required = required
+        self.question = question or f"Could you provide details about {name.replace('_', ' ')}?"
+
+
+class EntityRecord:
+    """Base for the per-intent slotted entity records built by IntentSchema"""
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict in field order; None values are kept so missing fields can be asked for"""
+        return {name: value for name in self.__slots__ if (value := getattr(self, name)) != ""}
+
+
+class IntentSchema:
+    __slots__ = ("intent", "fields", "by_name", "required", "optional", "record_type")
+
+    def __init__(self, intent: str, fields: List[FieldSpec]):
+        self.intent = intent
+        self.fields = tuple(fields)
+        self.by_name = {spec.name: spec for spec in fields}
+        self.required = tuple(spec.name for spec in fields if spec.required)
+        self.optional = tuple(spec.name for spec in fields if not spec.required)
+        self.record_type = type(
+            f"{intent.title().replace('_', '')}Entities",
+            (EntityRecord,),
+            {"__slots__": tuple(spec.name for spec in fields)}
+        )
+
+    def new_record(self, **values) -> EntityRecord:
+        return self.record_type(**values)
+
+    def missing(self, entities: Dict[str, Any]) -> List[str]:
+        return [name for name in self.required if not entities.get(name)]
+
+    def follow_ups(self, entities: Dict[str, Any], limit: int = MAX_FOLLOW_UPS) -> Tuple[List[str], List[str]]:
+        """Questions for the missing required fields, and the field each one fills"""
+        fields = self.missing(entities)[:limit]
+        return [self.by_name[name].question for name in fields], fields
+
+    def validate(self, entities: Any) -> Optional[str]:
+        """Why an LLM's entities for this intent look wrong, or None if they look usable"""
+        if not self.required:
+            return None
+        if not entities or not isinstance(entities, dict):
+            return "AI returned malformed entities"
+        if len(entities) == 1 and "entity_type" in entities:
+            return "AI returned generic entity structure"
+        if not any(name in entities for name in self.required):
+            return f"AI missing expected entities for {self.intent.replace('_', ' ')}"
+        return None
+
+
+def _count(name):
+    return FieldSpec(name, "count", True, "How many people will be joining?")
+
+
+SCHEMAS: Dict[str, IntentSchema] = {schema.intent: schema for schema in [
+    IntentSchema("dining", [
+        FieldSpec("cuisine", "cuisine", True, "What type of cuisine are you looking for?"),
+        _count("party_size"),
+        FieldSpec("date", "date", True, "What date are you planning for?"),
+        FieldSpec("time", "time", True, "What time would you prefer?"),
+        FieldSpec("budget", "money"),
+        FieldSpec("location", "location"),
+        FieldSpec("dietary_restrictions"),
+    ]),
+    IntentSchema("travel", [
+        FieldSpec("destination", "location", True, "Where would you like to travel to?"),
+        FieldSpec("departure_date", "date", True, "What date are you planning for?"),
+        FieldSpec("return_date", "date"),
+        _count("number_of_travelers"),
+        FieldSpec("budget", "money"),
+        FieldSpec("accommodation_type"),
+        FieldSpec("transportation"),
+    ]),
+    IntentSchema("gifting", [
+        FieldSpec("recipient", "text", True, "Who is this gift for?"),
+        FieldSpec("occasion", "occasion", True, "What's the occasion?"),
+        FieldSpec("budget", "money", True, "What's your budget range?"),
+        FieldSpec("gift_type"),
+        FieldSpec("relationship"),
+        FieldSpec("interests"),
+    ]),
+    IntentSchema("cab_booking", [
+        FieldSpec("pickup_location", "location", True, "Where should we pick you up?"),
+        FieldSpec("destination", "location", True, "Where would you like to go?"),
+        FieldSpec("date", "date", True, "What date are you planning for?"),
+        FieldSpec("time", "time", True, "What time would you prefer?"),
+        FieldSpec("vehicle_type"),
+        FieldSpec("number_of_passengers", "count"),
+    ]),
+    IntentSchema("other", [
+        FieldSpec("query"),
+        FieldSpec("topic"),
+        FieldSpec("keywords"),
+        FieldSpec("specific_request"),
+    ]),
+]}
+
+# Intents with required fields, i.e. the ones that get follow-up questions
+STRUCTURED_INTENTS = frozenset(intent for intent, schema in SCHEMAS.items() if schema.required)
+
+# Required fields first, then optional ones, across all structured intents
+KNOWN_FIELDS = tuple(dict.fromkeys(
+    [name for schema in SCHEMAS.values() if schema.required for name in schema.required] +
+    [name for schema in SCHEMAS.values() if schema.required for name in schema.optional]
+))
+
+
+def follow_ups(intent: str, entities: Dict[str, Any], limit: int = MAX_FOLLOW_UPS) -> Tuple[List[str], List[str]]:
+    schema = SCHEMAS.get(intent)
+    return schema.follow_ups(entities, limit) if schema else ([], [])
+
+
+def validate(intent: str, entities: Any) -> Optional[str]:
+    schema = SCHEMAS.get(intent)
+    return schema.validate(entities) if schema else None
+
+
+def ai_failed(response) -> Optional[str]:
+    """Why an assistant's classification can't be used and the rules take over, or None if it can"""
+    if (not response.intent_category or not response.confidence_score
+            or (response.intent_category == "other" and not response.entities)):
+        return "AI returned empty result"
+    return validate(response.intent_category, response.entities)
+
+
+def rubric(prefix: str = "   - ") -> str:
+    """Required fields per intent, one line each, for the classification prompts"""
+    return "\n".join(f"{prefix}{schema.intent}: {', '.join(schema.required)}"
+                     for schema in SCHEMAS.values() if schema.required)
@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import intent_schema
+import slot_filling
+from intent_rules import fallback_intent_classifier
+from replay import make_backend, percentile
+
+# A level is the saturation point when the next one adds less than SATURATION_GAIN throughput,
+# or pushes opening-request p95 latency past LATENCY_FACTOR times the lowest level's
+SATURATION_GAIN = 0.10
+LATENCY_FACTOR = 3.0
+
+# Opening requests, vague enough that most of them get follow-up questions
+OPENERS = {
+    "dining": ["Book a table for dinner", "I want to eat Italian food", "Find me a restaurant for tonight"],
+    "travel": ["Plan a trip for me", "I want to travel to Goa", "Book a vacation next month"],
+    "gifting": ["I need a gift", "Find a present for my friend", "Gift ideas please"],
+    "cab_booking": ["Book a cab", "I need a taxi to the airport", "Get me a ride at 6pm"],
+    "other": ["What is the capital of France?", "How do I apply for an Aadhaar card?"],
+}
+
+# Follow-up answers by field name, then by field type
+ANSWERS = {
+    "recipient": ["my mom", "my brother", "a colleague"],
+    "occasion": ["birthday", "anniversary", "farewell"],
+    "pickup_location": ["home", "MG Road", "the office"],
+    "destination": ["the airport", "Goa", "Central Station"],
+}
+TYPE_ANSWERS = {
+    "count": ["4 people", "just me", "two of us", "6"],
+    "date": ["tomorrow", "next Friday", "12/25"],
+    "time": ["8pm", "7:30 pm", "noon"],
+    "money": ["$50", "around 100 dollars", "$50-100"],
+    "location": ["downtown", "near the station"],
+    "cuisine": ["Italian", "Thai", "anything"],
+    "text": ["something nice", "no preference"],
+}
+NON_ANSWER = "not sure"
+
+
+def stub_backend(latency_ms: float, jitter: float) -> Callable[..., Dict[str, Any]]:
+    """Rule classifier plus a blocking sleep standing in for an LLM call"""
+    def run(text, session_id=None):
+        time.sleep(max(0.0, random.gauss(latency_ms, latency_ms * jitter)) / 1000)
+        return dict(fallback_intent_classifier(text, web_search=False), timings={})
+    return run
+
+
+def answer_for(intent: str, field: str, rng: random.Random, non_answer_rate: float) -> str:
+    if rng.random() < non_answer_rate:
+        return NON_ANSWER
+    spec = intent_schema.SCHEMAS[intent].by_name[field]
+    return rng.choice(ANSWERS.get(field) or TYPE_ANSWERS[spec.type])
+
+
+def answer_turn(intent: str, answer: str, field: str, pending: List[str], entities: Dict[str, Any]):
+    """What the app does with a follow-up answer: parse the slots and update the confidence"""
+    filled, reask = slot_filling.fill_slots(intent, answer, field, pending, entities)
+    entities.update(filled)
+    slot_filling.completeness_confidence(intent, entities)
+    return filled, reask
+
+
+async def run_session(session_id: str, backend, executor: ThreadPoolExecutor, turns: List[Dict[str, Any]],
+                      conversations: int, think_ms: float, non_answer_rate: float, max_reasks: int,
+                      rng: random.Random):
+    """One simulated user: an opening request, then an answer to each follow-up question"""
+    loop = asyncio.get_running_loop()
+
+    async def think():
+        if think_ms > 0:
+            await asyncio.sleep(rng.expovariate(1000 / think_ms))
+
+    async def timed(kind: str, fn, *args) -> Any:
+        start = time.perf_counter()
+        try:
+            result, error = await loop.run_in_executor(executor, fn, *args), None
+        except Exception as e:
+            result, error = None, str(e)
+        turns.append({"kind": kind, "latency": time.perf_counter() - start, "error": error})
+        return result, error
+
+    for n in range(conversations):
+        await think()
+        text = rng.choice(OPENERS[rng.choice(list(OPENERS))])
+        result, error = await timed("initial", backend, text, f"{session_id}-{n}")
+        if error:
+            continue
+
+        intent = result["intent_category"]
+        entities = dict(result["entities"] or {})
+        if intent not in intent_schema.STRUCTURED_INTENTS:
+            continue
+        _, fields = intent_schema.follow_ups(intent, entities)
+        reasks = 0
+        while fields:
+            field = fields[0]
+            await think()
+            answer = answer_for(intent, field, rng, non_answer_rate)
+            outcome, error = await timed("followup", answer_turn, intent, answer, field, fields[1:], entities)
+            if error:
+                break
+            filled, reask = outcome
+            if reask and reasks < max_reasks:
+                reasks += 1
+                continue
+            reasks = 0
+            fields = [name for name in fields[1:] if name not in filled]
+
+
+async def run_level(sessions: int, backend, workers: int, conversations: int, think_ms: float,
+                    non_answer_rate: float, max_reasks: int, seed: int) -> Dict[str, Any]:
+    """Run sessions concurrent users to completion and summarize their turns"""
+    turns: List[Dict[str, Any]] = []
+    # The worker pool stands in for the app process: blocking parses queue here once it is full
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load") as executor:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_session(f"load-{sessions}-{i}", backend, executor, turns, conversations, think_ms,
+                        non_answer_rate, max_reasks, random.Random(seed * 100003 + i))
+            for i in range(sessions)
+        ))
+        elapsed = time.perf_counter() - start
+    return summarize(sessions, turns, elapsed)
+
+
+def summarize(sessions: int, turns: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    by_kind = defaultdict(list)
+    for turn in turns:
+        if not turn["error"]:
+            by_kind[turn["kind"]].append(turn["latency"] * 1000)
+    errors = sum(1 for turn in turns if turn["error"])
+    # Only answered turns count: a backend that fails fast must not look like it scales
+    return {
+        "sessions": sessions,
+        "turns": len(turns),
+        "elapsed": round(elapsed, 3),
+        "throughput": (len(turns) - errors) / elapsed if elapsed else 0.0,
+        "error_rate": errors / len(turns) if turns else 0.0,
+        "latency_ms": {
+            kind: {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+            for kind, values in sorted(by_kind.items())
+        },
+    }
+
+
+def saturation_point(levels: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Last level before more sessions stop adding throughput or start queueing; None if never"""
+    def p95(level):
+        return level["latency_ms"].get("initial", {}).get("p95", 0.0)
+
+    # Floored at 1ms so sub-millisecond backends don't trip on scheduling noise
+    baseline = max(p95(levels[0]), 1.0) if levels else 1.0
+    for current, following in zip(levels, levels[1:]):
+        if following["throughput"] < current["throughput"] * (1 + SATURATION_GAIN):
+            return dict(current, reason="throughput plateau")
+        if p95(following) > baseline * LATENCY_FACTOR:
+            return dict(current, reason="latency")
+    return None
+
+
+def markdown_report(levels: List[Dict[str, Any]]) -> str:
+    kinds = sorted({kind for level in levels for kind in level["latency_ms"]})
+    header = ["Sessions", "Turns", "Turns/s", "Errors"] + [f"{kind} p{p} ms" for kind in kinds for p in (50, 95, 99)]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for level in levels:
+        cells = [str(level["sessions"]), str(level["turns"]), f"{level['throughput']:.1f}", f"{level['error_rate']:.1%}"]
+        for kind in kinds:
+            latency = level["latency_ms"].get(kind, {})
+            cells += [f"{latency.get(f'p{p}', 0.0):.0f}" for p in (50, 95, 99)]
+        lines.append("| " + " | ".join(cells) + " |")
+
+    saturated = saturation_point(levels)
+    lines.append("")
+    if saturated:
+        lines.append(f"Saturation: {saturated['sessions']} concurrent sessions at {saturated['throughput']:.1f} turns/s "
+                     f"(next level: {saturated['reason']}).")
+    else:
+        lines.append("Saturation not reached; try more sessions.")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many concurrent chat sessions and find where throughput saturates")
+    parser.add_argument("--backend", choices=["stub", "rules", "local", "ollama", "openai"], default="stub")
+    parser.add_argument("--sessions", default="1,2,4,8,16,32,64", help="Comma-separated concurrency levels to ramp through")
+    parser.add_argument("--conversations", type=int, default=3, help="Conversations per session at each level")
+    parser.add_argument("--workers", type=int, default=8, help="Worker threads, i.e. parses one app instance runs at once")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="Mean user think time between turns (exponential)")
+    parser.add_argument("--non-answer-rate", type=float, default=0.05, help="Share of follow-up answers that say nothing")
+    parser.add_argument("--max-reasks", type=int, default=1, help="Times a question is asked again before moving on")
+    parser.add_argument("--stub-latency-ms", type=float, default=300.0, help="Mean classification latency of the stub backend")
+    parser.add_argument("--stub-jitter", type=float, default=0.3, help="Stub latency standard deviation, as a fraction of the mean")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the per-level results as JSON")
+    args = parser.parse_args()
+
+    try:
+        backend = (stub_backend(args.stub_latency_ms, args.stub_jitter) if args.backend == "stub"
+                   else make_backend(args.backend))
+    except RuntimeError as e:
+        print(e)
+        return
+    levels = []
+    for sessions in [int(n) for n in args.sessions.split(",")]:
+        print(f"Running {sessions} sessions...")
+        levels.append(asyncio.run(run_level(sessions, backend, args.workers, args.conversations, args.think_ms,
+                                            args.non_answer_rate, args.max_reasks, args.seed)))
+
+    print(markdown_report(levels))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"levels": levels, "saturation": saturation_point(levels)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
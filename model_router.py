@@ -0,0 +1,140 @@
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+from intent_rules import score_intents
+
+WH_WORD_RE = re.compile(r"\b(what|why|how|when|where|which|who)\b")
+
+
+class Route:
+    """One Ollama model and the request settings used with it"""
+
+    def __init__(self, name: str, model: str, timeout: float = 30.0, options: Dict[str, Any] = None):
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        # Passed through as Ollama's "options" (num_ctx, num_predict, ...)
+        self.options = options or {}
+
+
+class RouteStats:
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.escalations = 0
+        self.total_latency = 0.0
+        self.total_confidence = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        answered = self.calls - self.failures
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "escalations": self.escalations,
+            "avg_latency": self.total_latency / self.calls if self.calls else 0.0,
+            "avg_confidence": self.total_confidence / answered if answered else 0.0,
+        }
+
+
+class ModelRouter:
+    """Pick a small or large Ollama model from cheap rule-classifier features
+
+    Short inputs whose keywords point clearly at one intent go to the small
+    model. Long, ambiguous or keyword-free ("other") inputs, and all answer
+    generation, go to the large one. A small-model result below
+    escalate_below confidence is redone on the large model, so hard inputs
+    that look easy still get the large model's accuracy.
+    """
+
+    def __init__(self, small: Optional[Route], large: Route, max_small_words: int = 12,
+                 escalate_below: float = 0.5):
+        self.routes = {"large": large}
+        if small is not None:
+            self.routes["small"] = small
+        self.max_small_words = max_small_words
+        self.escalate_below = escalate_below
+        self._lock = threading.Lock()
+        self._stats = {name: RouteStats() for name in self.routes}
+
+    @staticmethod
+    def features(user_input: str) -> Dict[str, Any]:
+        text = user_input.lower()
+        scores = sorted(score_intents(text).values(), reverse=True)
+        return {
+            "words": len(text.split()),
+            "top_hits": scores[0] if scores else 0,
+            # How far the best intent is ahead of the runner-up
+            "margin": scores[0] - scores[1] if len(scores) > 1 else (scores[0] if scores else 0),
+            "question": bool(WH_WORD_RE.search(text)),
+        }
+
+    def choose(self, user_input: str, task: str = "classify") -> Route:
+        with self._lock:
+            small = self.routes.get("small")
+        if task != "classify" or small is None:
+            return self.routes["large"]
+        f = self.features(user_input)
+        simple = f["words"] <= self.max_small_words and f["top_hits"] > 0 and f["margin"] > 0 and not f["question"]
+        return small if simple else self.routes["large"]
+
+    def should_escalate(self, route: Route, result: Optional[Dict[str, Any]]) -> bool:
+        if route.name == "large":
+            return False
+        if not result:
+            return True
+        return (result.get("intent_category") == "other"
+                or float(result.get("confidence_score") or 0.0) < self.escalate_below)
+
+    def disable(self, name: str):
+        """Stop routing to a model, e.g. because it is not pulled"""
+        if name == "large":
+            return
+        with self._lock:
+            disabled = self.routes.pop(name, None)
+        if disabled is not None:
+            print(f"Model route '{name}' disabled; using the large model only")
+
+    def record(self, route: Route, latency: float, result: Optional[Dict[str, Any]] = None):
+        """Record one classification call; result is None if it failed"""
+        with self._lock:
+            stats = self._stats.setdefault(route.name, RouteStats())
+            stats.calls += 1
+            stats.total_latency += latency
+            if result is None:
+                stats.failures += 1
+            else:
+                stats.total_confidence += float(result.get("confidence_score") or 0.0)
+
+    def escalated(self, route: Route):
+        with self._lock:
+            self._stats.setdefault(route.name, RouteStats()).escalations += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+
+def from_env(default_model: str = "llama3.2:3b") -> ModelRouter:
+    """Build a router from NLPARSE_OLLAMA_* variables; routing is off unless a small model is set"""
+    large = Route(
+        "large",
+        os.getenv("NLPARSE_OLLAMA_LARGE_MODEL", default_model),
+        timeout=float(os.getenv("NLPARSE_OLLAMA_LARGE_TIMEOUT", "30")),
+    )
+    small_model = os.getenv("NLPARSE_OLLAMA_SMALL_MODEL")
+    small = None
+    if small_model:
+        small = Route(
+            "small",
+            small_model,
+            timeout=float(os.getenv("NLPARSE_OLLAMA_SMALL_TIMEOUT", "15")),
+            options={"num_ctx": 2048},
+        )
+    return ModelRouter(
+        small,
+        large,
+        max_small_words=int(os.getenv("NLPARSE_ROUTER_MAX_WORDS", "12")),
+        escalate_below=float(os.getenv("NLPARSE_ROUTER_ESCALATE_BELOW", "0.5")),
+    )
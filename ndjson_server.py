@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import calibration
+import intent_schema
+import request_log
+import slot_filling
+from deadline import Deadline
+from intent_rules import fallback_intent_classifier
+
+# Sessions kept for follow-ups; the least recently used are forgotten beyond this
+MAX_SESSIONS = int(os.getenv("NLPARSE_NDJSON_MAX_SESSIONS", "10000"))
+
+
+class Session:
+    """Conversation state for one session id: the current request and the fields still to ask"""
+
+    __slots__ = ("lock", "in_use", "intent", "entities", "confidence", "pending")
+
+    def __init__(self):
+        # Messages of one session are handled in order; different sessions run in parallel
+        self.lock = asyncio.Lock()
+        # Messages holding or waiting for the lock; such a session is never evicted
+        self.in_use = 0
+        self.intent = ""
+        self.entities: Dict[str, Any] = {}
+        self.confidence = 0.0
+        self.pending = []
+
+
+class Parser:
+    """Turns one request message into one result message
+
+    A message is {"id", "text", "session_id"?, "new"?}. With a session id,
+    a message that arrives while the session has open follow-up questions
+    answers the first of them, unless "new" is true. Without one, every
+    message is a one-shot request.
+    """
+
+    def __init__(self, backend: str = "rules", workers: int = 8):
+        self.backend = backend
+        self.assistant = None
+        if backend != "rules":
+            import assistant_pool
+            self.assistant = assistant_pool.get_assistant(backend)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ndjson")
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def _session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session()
+            excess = len(self.sessions) - MAX_SESSIONS
+            if excess > 0:
+                # Least recently used first, skipping sessions with a message in progress: evicting one
+                # would send its next message to a fresh session while the old one is still being updated
+                idle = []
+                for old_id, old in self.sessions.items():
+                    if len(idle) == excess:
+                        break
+                    if old_id != session_id and not old.in_use:
+                        idle.append(old_id)
+                for old_id in idle:
+                    del self.sessions[old_id]
+        else:
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def _classify(self, text: str, session_id: Optional[str]) -> Dict[str, Any]:
+        """Blocking: the configured backend, falling back to the rules like the app does"""
+        deadline = Deadline()
+        start = time.perf_counter()
+        backend, mode, response = self.backend, "ai", None
+        if self.assistant is not None:
+            try:
+                response = self.assistant.process_input(text, session_id=session_id, deadline=deadline)
+                if intent_schema.ai_failed(response):
+                    response = None
+            except Exception as e:
+                print(f"Backend failed, using rules: {e}", file=sys.stderr)
+                response = None
+        if response is None:
+            backend, mode = "rules", "fallback" if self.assistant is not None else "rules"
+            result = fallback_intent_classifier(text, deadline=deadline)
+            raw_confidence = result["confidence_score"]
+            result["confidence_score"] = calibration.calibrate("rules", result["intent_category"], raw_confidence)
+            response = type('Response', (), dict(result, follow_up_questions=[],
+                                                 metadata={"raw_confidence": raw_confidence}))()
+
+        log = request_log.get_log()
+        if log:
+            log.log(request_log.make_record(
+                "request", text, backend, response, {"total": round(time.perf_counter() - start, 4)},
+                session_id=session_id, processing_mode=mode, source="ndjson"
+            ))
+        return {
+            "intent_category": response.intent_category,
+            "entities": dict(response.entities or {}),
+            "confidence_score": response.confidence_score,
+            "processing_mode": mode,
+        }
+
+    async def handle(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        text = message.get("text")
+        session_id = message.get("session_id")
+        if not isinstance(text, str) or not text.strip():
+            return {"id": message.get("id"), "session_id": session_id, "error": "missing text"}
+
+        loop = asyncio.get_running_loop()
+        try:
+            if session_id is None:
+                result = await loop.run_in_executor(self.executor, self._classify, text, None)
+                result["follow_up_questions"] = intent_schema.follow_ups(result["intent_category"], result["entities"])[0]
+            else:
+                session = self._session(str(session_id))
+                session.in_use += 1
+                try:
+                    async with session.lock:
+                        if session.pending and not message.get("new"):
+                            result = self._answer(session, text)
+                        else:
+                            result = await loop.run_in_executor(self.executor, self._classify, text, str(session_id))
+                            session.intent = result["intent_category"]
+                            session.entities = result["entities"]
+                            session.confidence = result["confidence_score"]
+                            session.pending = intent_schema.follow_ups(session.intent, session.entities)[1]
+                            result["follow_up_questions"] = self._questions(session)
+                finally:
+                    session.in_use -= 1
+        except Exception as e:
+            return {"id": message.get("id"), "session_id": session_id, "error": str(e)}
+
+        return {"id": message.get("id"), "session_id": session_id, "result": result,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    def _answer(self, session: Session, text: str) -> Dict[str, Any]:
+        """A follow-up answer: fill slots in place (cheap, so it runs on the event loop)"""
+        asked = session.pending[0]
+        filled, reask = slot_filling.fill_slots(session.intent, text, asked, session.pending[1:], session.entities)
+        session.entities.update(filled)
+        session.pending = [name for name in session.pending if name not in filled]
+        session.confidence = slot_filling.completeness_confidence(session.intent, session.entities, session.confidence)
+        result = {
+            "intent_category": session.intent,
+            "entities": dict(session.entities),
+            "confidence_score": session.confidence,
+            "processing_mode": "followup",
+            "filled": sorted(filled),
+        }
+        if reask:
+            result["reask"] = reask
+        result["follow_up_questions"] = self._questions(session)
+        return result
+
+    @staticmethod
+    def _questions(session: Session):
+        return [intent_schema.SCHEMAS[session.intent].by_name[name].question for name in session.pending]
+
+
+async def serve_stream(parser: Parser, readline, write, max_in_flight: int):
+    """Read NDJSON messages and write results as each one finishes (so possibly out of order)
+
+    At most max_in_flight messages are being handled at once; beyond that
+    reading stops, so a fast producer is held back by the pipe or socket
+    instead of queueing without bound in memory. write is a coroutine, so a
+    slow consumer holds back the results the same way.
+    """
+    slots = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+    sequence = 0
+
+    async def run(message):
+        try:
+            await write(await parser.handle(message))
+        finally:
+            slots.release()
+
+    while True:
+        await slots.acquire()
+        try:
+            line = await readline()
+        except ValueError as e:
+            # A line over the reader's size limit is dropped with an error; the stream goes on
+            sequence += 1
+            await write({"id": None, "line": sequence, "error": f"invalid message: {e}"})
+            slots.release()
+            continue
+        if not line:
+            slots.release()
+            break
+        if not line.strip():
+            slots.release()
+            continue
+        sequence += 1
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise ValueError("message must be a JSON object")
+        except ValueError as e:
+            await write({"id": None, "line": sequence, "error": f"invalid message: {e}"})
+            slots.release()
+            continue
+        message.setdefault("id", sequence)
+        task = asyncio.create_task(run(message))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        # A failed write (e.g. the client went away) must not stop the other results from being written
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _dumps(result: Dict[str, Any]) -> bytes:
+    return (json.dumps(result, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def serve_stdio(parser: Parser, max_in_flight: int):
+    loop = asyncio.get_running_loop()
+    # One dedicated thread blocks on stdin, which works for pipes, files and terminals alike
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ndjson-stdin")
+    # and one on stdout, so a slow consumer stalls the writes (and, through them, reading) but not the loop
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ndjson-stdout")
+    out = sys.stdout.buffer
+
+    def write_line(data: bytes):
+        out.write(data)
+        out.flush()
+
+    async def write(result):
+        await loop.run_in_executor(writer, write_line, _dumps(result))
+
+    try:
+        await serve_stream(parser, lambda: loop.run_in_executor(reader, sys.stdin.buffer.readline),
+                           write, max_in_flight)
+    finally:
+        reader.shutdown(wait=False)
+        writer.shutdown(wait=True)
+
+
+async def _read_line(reader: asyncio.StreamReader) -> bytes:
+    """One line from the socket; ValueError for a line over the reader's limit, which is skipped entirely"""
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    # Discard up to the end of the oversized line, including the part that has not arrived yet
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b"\n")
+            break
+        except asyncio.IncompleteReadError:
+            break
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+    raise ValueError("line too long")
+
+
+async def serve_socket(parser: Parser, path: str, max_in_flight: int):
+    """Unix socket server; each connection is its own stream, sessions are shared by all"""
+
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def write(result):
+            writer.write(_dumps(result))
+            await writer.drain()
+
+        try:
+            await serve_stream(parser, lambda: _read_line(reader), write, max_in_flight)
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle_connection, path=path)
+    print(f"Listening on {path}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Parse newline-delimited JSON requests from stdin or a Unix socket")
+    arg_parser.add_argument("--backend", choices=["rules", "local", "ollama", "openai"], default="rules")
+    arg_parser.add_argument("--socket", default=None, help="Listen on this Unix socket path instead of stdin/stdout")
+    arg_parser.add_argument("--workers", type=int, default=8, help="Threads running backend calls")
+    arg_parser.add_argument("--max-in-flight", type=int, default=64,
+                            help="Messages handled at once per stream before reading pauses")
+    args = arg_parser.parse_args()
+
+    parser = Parser(args.backend, workers=args.workers)
+    try:
+        if args.socket:
+            asyncio.run(serve_socket(parser, args.socket, args.max_in_flight))
+        else:
+            asyncio.run(serve_stdio(parser, args.max_in_flight))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Index file: magic, header, JSON metadata (files), then fixed-width uint64 tables (term offsets,
+# per term postings offset and document frequency, per passage file/offset/length/tokens), the sorted
+# term bytes, uint32 postings (doc id, term frequency pairs) and UTF-8 passage text. Only the small
+# per-file metadata is parsed on open; terms are found by binary search in the mapped tables.
+MAGIC = b"NLPIDX02"
+HEADER = struct.Struct("<QQQQQ")  # meta bytes, terms, term bytes, passages, postings bytes (text runs to the end)
+PASSAGE_FIELDS = 4
+DEFAULT_INDEX_PATH = os.getenv("NLPARSE_SEARCH_INDEX", "")
+INDEXED_EXTENSIONS = (".txt", ".md", ".html", ".htm")
+# The index file is checked for a rebuild at most this often; searches needn't stat it every time
+CHECK_SECONDS = float(os.getenv("NLPARSE_SEARCH_INDEX_CHECK_SECONDS", "5"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+TAG_RE = re.compile(r"<[^>]+>")
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SEARCH_STOP_WORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "the", "to", "what", "when", "where", "which", "who", "why", "with"
+])
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+PASSAGE_WORDS = 120
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in SEARCH_STOP_WORDS]
+
+
+def split_passages(text: str) -> List[str]:
+    """Group paragraphs into passages of roughly PASSAGE_WORDS words"""
+    passages, current, words = [], [], 0
+    for paragraph in PARAGRAPH_RE.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        current.append(paragraph)
+        words += paragraph.count(" ") + 1
+        if words >= PASSAGE_WORDS:
+            passages.append(" ".join(current))
+            current, words = [], 0
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def read_document(path: str) -> Tuple[str, List[str]]:
+    """Return (title, passages) for a source file"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if path.lower().endswith((".html", ".htm")):
+        title_match = re.search(r"<title>(.*?)</title>", text, re.IGNORECASE | re.DOTALL)
+        text = TAG_RE.sub(" ", re.sub(r"(?is)<(script|style).*?</\1>", " ", text))
+        title = " ".join(title_match.group(1).split()) if title_match else ""
+    else:
+        first_line = next((line for line in text.splitlines() if line.strip()), "")
+        title = first_line.strip().lstrip("#").strip()
+    return title or os.path.basename(path), split_passages(text)
+
+
+class SearchIndex:
+    """Read-only BM25 index over a memory-mapped index file
+
+    The term dictionary, passage table, postings and text all stay in the
+    mapping, so opening an index costs the same whatever its vocabulary.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a search index (or was built by an older version)")
+        meta_len, self._terms, term_bytes_len, passage_count, postings_len = HEADER.unpack_from(self._mm, len(MAGIC))
+        meta_start = len(MAGIC) + HEADER.size
+        meta = json.loads(self._mm[meta_start:meta_start + meta_len].decode("utf-8"))
+        if meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was built on a {meta['byteorder']}-endian machine")
+
+        self.files: Dict[str, Dict] = meta["files"]
+        self._paths: List[str] = meta["paths"]
+        self.avg_length = meta["avg_length"] or 1.0
+
+        self._views = []
+        offset = _aligned(meta_start + meta_len, 8)
+        # Term i's bytes are term_bytes[term_offsets[i]:term_offsets[i + 1]]
+        self._term_offsets, offset = self._table(offset, self._terms + 1, "Q")
+        # Per term: postings offset (in uint32s), document frequency
+        self._term_postings, offset = self._table(offset, 2 * self._terms, "Q")
+        # Per passage: file index, text offset, text length, token count
+        self._passages, offset = self._table(offset, PASSAGE_FIELDS * passage_count, "Q")
+        self._term_bytes_start = offset
+        offset = _aligned(offset + term_bytes_len, 4)
+        self.postings, offset = self._table(offset, postings_len // 4, "I")
+        self._text_start = offset
+
+    def _table(self, offset: int, count: int, fmt: str):
+        view = memoryview(self._mm)[offset:offset + count * struct.calcsize(fmt)]
+        self._views.append(view)
+        table = view.cast(fmt)
+        self._views.append(table)
+        return table, offset + len(view)
+
+    def __len__(self):
+        return len(self._passages) // PASSAGE_FIELDS
+
+    def passage(self, passage_id: int) -> Tuple[str, int, int, int]:
+        """(file path, text offset, text length, token count)"""
+        base = passage_id * PASSAGE_FIELDS
+        file_id, offset, length, tokens = self._passages[base:base + PASSAGE_FIELDS]
+        return self._paths[file_id], offset, length, tokens
+
+    def passage_text(self, passage_id: int) -> str:
+        _, offset, length, _ = self.passage(passage_id)
+        start = self._text_start + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _term(self, i: int) -> bytes:
+        start = self._term_bytes_start
+        return self._mm[start + self._term_offsets[i]:start + self._term_offsets[i + 1]]
+
+    def terms(self):
+        for i in range(self._terms):
+            yield self._term(i).decode("utf-8")
+
+    def lookup(self, term: str) -> Optional[Tuple[int, int]]:
+        """(postings offset, document frequency) for term, by binary search; None if it isn't indexed"""
+        key = term.encode("utf-8")
+        lo, hi = 0, self._terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._terms and self._term(lo) == key:
+            return self._term_postings[2 * lo], self._term_postings[2 * lo + 1]
+        return None
+
+    def iter_postings(self, term: str):
+        offset, df = self.lookup(term) or (0, 0)
+        postings = self.postings
+        for i in range(offset, offset + 2 * df, 2):
+            yield postings[i], postings[i + 1]
+
+    def search(self, query: str, max_results: int = 3) -> List[Tuple[int, float]]:
+        """Top passages for query as (passage id, BM25 score), best first"""
+        n = len(self)
+        passages = self._passages
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            entry = self.lookup(term)
+            if not entry:
+                continue
+            df = entry[1]
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for passage_id, tf in self.iter_postings(term):
+                length = passages[passage_id * PASSAGE_FIELDS + 3]
+                scores[passage_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / self.avg_length))
+        return heapq.nlargest(max_results, scores.items(), key=lambda item: item[1])
+
+    def search_results(self, query: str, max_results: int = 3) -> List[Dict[str, str]]:
+        """Search results in the WebSearcher format (title, snippet, url)"""
+        results = []
+        for passage_id, _ in self.search(query, max_results):
+            path = self.passage(passage_id)[0]
+            results.append({
+                'title': self.files[path]["title"],
+                'snippet': self.passage_text(passage_id),
+                'url': "file://" + path
+            })
+        return results
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mm.close()
+
+
+def _aligned(offset: int, alignment: int) -> int:
+    return (offset + alignment - 1) & ~(alignment - 1)
+
+
+def build_index(source_dir: str, index_path: str) -> Dict[str, int]:
+    """Index every supported file under source_dir into index_path
+
+    If index_path already exists, files whose mtime and size are unchanged
+    keep their postings and text from the old index and are not re-read.
+    Returns counts of reused, (re)indexed and removed files. Paths are
+    stored absolute, so results don't depend on the working directory.
+    """
+    source_dir = os.path.abspath(source_dir)
+    old = None
+    if os.path.exists(index_path):
+        try:
+            old = SearchIndex(index_path)
+        except ValueError as e:
+            print(f"Rebuilding index from scratch: {e}")
+
+    current = {}
+    for root, _, names in os.walk(source_dir):
+        for name in sorted(names):
+            if name.lower().endswith(INDEXED_EXTENSIONS):
+                path = os.path.join(root, name)  # absolute, as source_dir is
+                stat = os.stat(path)
+                current[path] = {"mtime": stat.st_mtime, "size": stat.st_size}
+
+    files: Dict[str, Dict] = {}
+    passages: List[list] = []
+    texts: List[bytes] = []
+    text_offset = 0
+    postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    stats = {"reused": 0, "indexed": 0, "removed": 0}
+
+    def add_passage(path: str, text: str) -> int:
+        nonlocal text_offset
+        encoded = text.encode("utf-8")
+        passage_id = len(passages)
+        passages.append([path, text_offset, len(encoded), 0])
+        texts.append(encoded)
+        text_offset += len(encoded)
+        return passage_id
+
+    # Carry over unchanged files: copy their text and remap their postings to new passage ids
+    if old is not None:
+        remap = {}
+        for old_id in range(len(old)):
+            path, _, _, length = old.passage(old_id)
+            info = old.files.get(path)
+            if path in current and info and info["mtime"] == current[path]["mtime"] and info["size"] == current[path]["size"]:
+                new_id = add_passage(path, old.passage_text(old_id))
+                passages[new_id][3] = length
+                remap[old_id] = new_id
+                files[path] = info
+        for term in old.terms():
+            for old_id, tf in old.iter_postings(term):
+                if old_id in remap:
+                    postings[term].append((remap[old_id], tf))
+        stats["reused"] = len(files)
+        stats["removed"] = sum(1 for path in old.files if path not in current)
+        old.close()
+
+    for path, info in current.items():
+        if path in files:
+            continue
+        title, file_passages = read_document(path)
+        files[path] = dict(info, title=title)
+        for text in file_passages:
+            passage_id = add_passage(path, text)
+            counts = Counter(tokenize(text))
+            passages[passage_id][3] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((passage_id, tf))
+        stats["indexed"] += 1
+
+    # Lay postings out contiguously per term, sorted by passage id; terms sorted by their UTF-8 bytes
+    flat = array("I")
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    term_offsets, term_postings, term_bytes = array("Q", [0]), array("Q"), bytearray()
+    for term in terms:
+        entries = sorted(postings[term])
+        term_postings.extend((len(flat), len(entries)))
+        for passage_id, tf in entries:
+            flat.extend((passage_id, tf))
+        term_bytes += term.encode("utf-8")
+        term_offsets.append(len(term_bytes))
+
+    paths = sorted(files)
+    file_ids = {path: i for i, path in enumerate(paths)}
+    passage_table = array("Q")
+    for path, offset, length, tokens in passages:
+        passage_table.extend((file_ids[path], offset, length, tokens))
+
+    total_tokens = sum(p[3] for p in passages)
+    meta = json.dumps({
+        "byteorder": sys.byteorder,
+        "built": time.time(),
+        "files": files,
+        "paths": paths,
+        "avg_length": total_tokens / len(passages) if passages else 0.0
+    }, separators=(",", ":")).encode("utf-8")
+
+    tmp_path = index_path + ".tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        def pad(alignment: int):
+            f.write(b"\0" * (_aligned(f.tell(), alignment) - f.tell()))
+
+        f.write(MAGIC)
+        f.write(HEADER.pack(len(meta), len(terms), len(term_bytes), len(passages), len(flat) * flat.itemsize))
+        f.write(meta)
+        pad(8)
+        f.write(term_offsets.tobytes())
+        f.write(term_postings.tobytes())
+        f.write(passage_table.tobytes())
+        f.write(term_bytes)
+        pad(4)
+        f.write(flat.tobytes())
+        for encoded in texts:
+            f.write(encoded)
+    # Readers holding the old file keep their mapping; new opens see the new index
+    os.replace(tmp_path, index_path)
+    return stats
+
+
+_indexes: Dict[str, SearchIndex] = {}
+_checked: Dict[str, float] = {}  # path -> time.monotonic() of its last check
+_indexes_lock = threading.Lock()
+
+
+def get_index(path: str = DEFAULT_INDEX_PATH) -> Optional[SearchIndex]:
+    """Shared index for path, reopened when the file is rebuilt; None if there is no index"""
+    if not path:
+        return None
+    now = time.monotonic()
+    checked = _checked.get(path)
+    if checked is not None and now - checked < CHECK_SECONDS:
+        return _indexes.get(path)
+    with _indexes_lock:
+        _checked[path] = now
+        if not os.path.exists(path):
+            _indexes.pop(path, None)
+            return None
+        mtime = os.path.getmtime(path)
+        index = _indexes.get(path)
+        if index is None or index.mtime != mtime:
+            index = _indexes[path] = SearchIndex(path)
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline search index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Index a directory of documents (incremental)")
+    build_parser.add_argument("source", help="Directory of .txt, .md or .html files")
+    build_parser.add_argument("-o", "--output", default=DEFAULT_INDEX_PATH or "search_index.bin")
+
+    search_parser = subparsers.add_parser("search", help="Query an index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-i", "--index", default=DEFAULT_INDEX_PATH or "search_index.bin")
+    search_parser.add_argument("-n", "--max-results", type=int, default=3)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        stats = build_index(args.source, args.output)
+        print(f"Indexed {stats['indexed']} files, reused {stats['reused']}, removed {stats['removed']} "
+              f"in {time.perf_counter() - start:.2f}s -> {args.output}")
+    else:
+        index = SearchIndex(args.index)
+        start = time.perf_counter()
+        results = index.search_results(args.query, args.max_results)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(json.dumps(results, indent=2))
+        print(f"{len(results)} results from {len(index)} passages in {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from rate_limiter import estimate_tokens
+import intent_schema
+
+# Hard cap on prompt size; context, then search results, then the request itself are cut to fit
+PROMPT_TOKEN_CAP = int(os.getenv("NLPARSE_PROMPT_TOKEN_CAP", "1200"))
+MAX_VALUE_CHARS = 80
+
+# Entity keys outside the intent schemas are the first to be dropped
+KNOWN_FIELDS = intent_schema.KNOWN_FIELDS
+
+# Bookkeeping keys the assistants add to entities; never useful to the model
+INTERNAL_KEYS = frozenset(["web_search_performed", "search_query", "ai_response"])
+
+CONTEXT_BLOCK = "\nPrevious context: {entities}\n(Increase confidence based on accumulated information)"
+
+TEMPLATES = {
+    "openai_classify": """Classify this request into one of these categories:
+- dining (restaurants, food)
+- travel (trips, hotels)
+- gifting (gifts, presents)
+- cab_booking (rides, taxis)
+- other (everything else)
+
+Extract relevant entities like dates, times, numbers, locations.
+
+Request: "{user_input}"{context}
+
+Calculate confidence_score (0.0-1.0) based on:
+1. Intent clarity (0.2-0.5): How clearly the request matches a category
+   - Multiple matching keywords = higher score
+   - Ambiguous request = lower score
+2. Entity completeness (0.0-0.4): How many required entities are found
+{rubric}
+3. Quality bonus (0.0-0.1): Well-formatted dates/times, specific details
+
+Example scores:
+- "Book Italian restaurant" = 0.4 (clear intent, missing details)
+- "Book Italian restaurant for 4 tomorrow 8pm" = 0.9 (clear + complete)
+- "I need something" = 0.1 (vague intent, no entities)
+
+Return JSON with intent_category, entities dict, and confidence_score.""",
+
+    "ollama_classify": """Classify this request and extract entities:
+
+Categories: dining, travel, gifting, cab_booking, other
+
+Request: "{user_input}"{context}
+
+Calculate confidence_score (0.0-1.0) based on:
+1. Intent clarity (0.2-0.5): How clearly the request matches a category
+2. Entity completeness (0.0-0.4): How many required entities are found
+{rubric}
+3. Quality bonus (0.0-0.1): Well-formatted data, specific details
+
+Examples:
+- "Book Italian restaurant" = 0.4
+- "Book Italian restaurant for 4 tomorrow 8pm" = 0.9
+- "I need something" = 0.1
+
+Return JSON with intent_category, entities dict, confidence_score.""",
+
+    "classify_frames": """This message may contain several separate requests. Split it into requests and classify each one:
+
+Categories: dining, travel, gifting, cab_booking, other
+
+Message: "{user_input}"
+
+For each request give:
+- text: the part of the message it covers
+- intent_category
+- entities dict (required entities per category below)
+{rubric}
+- confidence_score (0.0-1.0): clear intent with all required entities = 0.9, clear intent without details = 0.4, vague = 0.1
+
+Example: "Book a cab to the airport at 6am and find a gift for mom" has two requests (cab_booking, gifting).
+
+Return JSON: {{"frames": [{{"text": ..., "intent_category": ..., "entities": {{...}}, "confidence_score": ...}}]}}""",
+
+    "openai_web_answer": """Based on the following web search results, provide a helpful and informative response to the user's query.
+
+User Query: {user_input}
+
+Web Search Results:
+{search_results}
+
+Instructions:
+1. Synthesize the information from the search results
+2. Provide a clear, concise, and helpful answer
+3. If the search results contain specific steps or procedures, include them
+4. Mention the sources when providing specific information
+5. Be conversational and helpful
+6. If the search results don't fully answer the question, acknowledge this
+
+Response:""",
+
+    "ollama_web_answer": """Based on web search results, provide a helpful response.
+
+User Query: {user_input}
+
+Web Search Results:
+{search_results}
+
+Provide a clear, informative answer that synthesizes the search results. Include specific steps if found. Be helpful and conversational.""",
+}
+
+# Required fields per intent, as listed in the classification prompts
+RUBRIC = intent_schema.rubric()
+
+# Changes whenever a template or the schemas' required fields change, so logged results can be grouped by prompt
+PROMPT_VERSION = hashlib.sha1(json.dumps([TEMPLATES, RUBRIC], sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+# Prompts built during the current process_input call; see collect()
+_current_calls = contextvars.ContextVar("prompt_calls", default=None)
+_totals_lock = threading.Lock()
+_totals = {"prompts": 0, "prompt_tokens": 0, "max_prompt_tokens": 0, "capped": 0}
+
+
+def prune_entities(entities: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """Drop empty and internal keys and shorten long values; known intent fields come first
+
+    Returns the kept entities (in the order they should survive trimming)
+    and the names of the keys that were dropped.
+    """
+    kept, dropped = {}, []
+    for key, value in (entities or {}).items():
+        if key in INTERNAL_KEYS or value is None or value == "" or value == [] or value == {}:
+            dropped.append(key)
+            continue
+        if isinstance(value, str) and len(value) > MAX_VALUE_CHARS:
+            value = value[:MAX_VALUE_CHARS] + "..."
+        kept[key] = value
+    ordered = {key: kept[key] for key in KNOWN_FIELDS if key in kept}
+    ordered.update((key, value) for key, value in kept.items() if key not in ordered)
+    return ordered, dropped
+
+
+def _trim(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rsplit(" ", 1)[0] + "..."
+
+
+def build(template: str, user_input: str, entities: Optional[Dict[str, Any]] = None,
+          search_results: str = "", cap: int = PROMPT_TOKEN_CAP) -> str:
+    """Render a template with pruned context, cut down to at most cap tokens"""
+    kept, dropped = prune_entities(entities)
+    values = {"user_input": user_input, "search_results": search_results}
+
+    def render():
+        context = CONTEXT_BLOCK.format(entities=json.dumps(kept)) if kept else ""
+        return TEMPLATES[template].format(context=context, rubric=RUBRIC, **values)
+
+    prompt = render()
+    capped = estimate_tokens(prompt) > cap
+    # Over the cap: shed context entries (unknown keys go first), then search results, then the request
+    while estimate_tokens(prompt) > cap and kept:
+        dropped.append(kept.popitem()[0])
+        prompt = render()
+    for field in ("search_results", "user_input"):
+        excess = estimate_tokens(prompt) - cap
+        if excess > 0 and values[field]:
+            values[field] = _trim(values[field], estimate_tokens(values[field]) - excess)
+            prompt = render()
+
+    _record({
+        "template": template,
+        "prompt_tokens": estimate_tokens(prompt),
+        "context_fields": len(kept),
+        "dropped_fields": dropped,
+        "capped": capped,
+    })
+    return prompt
+
+
+def _record(call: Dict[str, Any]):
+    with _totals_lock:
+        _totals["prompts"] += 1
+        _totals["prompt_tokens"] += call["prompt_tokens"]
+        _totals["max_prompt_tokens"] = max(_totals["max_prompt_tokens"], call["prompt_tokens"])
+        _totals["capped"] += int(call["capped"])
+    calls = _current_calls.get()
+    if calls is not None:
+        calls.append(call)
+
+
+@contextlib.contextmanager
+def collect():
+    """Gather the stats of every prompt built inside the block (in this thread or context)"""
+    calls = []
+    token = _current_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _current_calls.reset(token)
+
+
+def stats() -> Dict[str, int]:
+    """Process-wide prompt counters"""
+    with _totals_lock:
+        return dict(_totals)
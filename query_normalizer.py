@@ -0,0 +1,46 @@
+import re
+from functools import lru_cache
+
+# Common misspellings, mapped word for word before keys are compared
+SPELLING = {
+    "aadhar": "aadhaar",
+    "adhaar": "aadhaar",
+    "adhar": "aadhaar",
+    "dinning": "dining",
+    "resturant": "restaurant",
+    "restaraunt": "restaurant",
+    "restuarant": "restaurant",
+    "resturants": "restaurants",
+    "reservaton": "reservation",
+    "tommorow": "tomorrow",
+    "tomorow": "tomorrow",
+    "tommorrow": "tomorrow",
+    "birthdy": "birthday",
+    "anniversery": "anniversary",
+    "taxy": "taxi",
+    "hotal": "hotel",
+    "vacaton": "vacation",
+}
+
+# Words that never change what is being asked; prepositions like "to"/"from"/"for" stay, they carry entities
+STOPWORDS = frozenset([
+    "a", "an", "the", "please", "pls", "plz", "kindly", "hey", "hi", "hello",
+    "can", "could", "would", "you", "will", "just", "me", "i", "um", "uh",
+])
+
+# Punctuation that isn't inside a token ("5:30", "12/25", "mom's" keep theirs); "$" is kept as it marks money
+PUNCT_RE = re.compile(r"(?<!\w)[^\w\s$]+|[^\w\s$]+(?!\w)")
+
+
+@lru_cache(maxsize=4096)
+def normalize(text: str) -> str:
+    """Cache key for a request or search query: lowercased, punctuation, stopwords and misspellings removed
+
+    Queries that differ only in those ("How do I apply for Aadhar card?"
+    vs "how do i apply for aadhaar card") share a key. Falls back to the
+    lowercased text when every word is a stopword, so "hi" and "hello"
+    stay distinct.
+    """
+    words = PUNCT_RE.sub(" ", text.lower()).split()
+    kept = [SPELLING.get(word, word) for word in words if word not in STOPWORDS]
+    return " ".join(kept or words)
@@ -0,0 +1,221 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+# Session the current call is billed to; set by the assistant for the duration of process_input
+current_session = contextvars.ContextVar("current_session", default=None)
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a request cannot be admitted before its deadline"""
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a session has spent its token allowance"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English)"""
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable_error(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError")
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read Retry-After from the error's HTTP response, if there is one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float):
+        rate = self.per_minute * scale / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, scale: float) -> float:
+        """Seconds until amount is available (0 if it is available now)"""
+        # Requests larger than the bucket only wait for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / (self.per_minute * scale / 60.0))
+
+
+class RateLimiter:
+    """Client-side limiter for requests per minute and tokens per minute
+
+    Callers are admitted in FIFO order. Each one reserves one request and its
+    estimated tokens; settle() corrects the token bucket once the real usage
+    is known. On a 429 the effective rate drops by a quarter (down to 10% of
+    the configured limits) and creeps back up with each success.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.scale = 1.0
+        self.blocked_until = 0.0
+        self._cond = threading.Condition()
+        self._waiters = deque()
+
+    def acquire(self, tokens: int, deadline: Optional[float] = None):
+        """Block until the request is admitted; deadline is a time.monotonic() value"""
+        waiter = object()
+        with self._cond:
+            self._waiters.append(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._waiters[0] is waiter:
+                        self.requests.refill(now, self.scale)
+                        self.tokens.refill(now, self.scale)
+                        wait = max(
+                            self.blocked_until - now,
+                            self.requests.wait_time(1, self.scale),
+                            self.tokens.wait_time(tokens, self.scale)
+                        )
+                        if wait <= 0:
+                            self.requests.level -= 1
+                            self.tokens.level -= tokens
+                            return
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0 or (wait is not None and wait > remaining):
+                            raise RateLimitTimeout("Request could not be admitted before its deadline")
+                        wait = remaining if wait is None else wait
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+
+    def settle(self, estimated: int, actual: int):
+        """Return over-reserved tokens (or charge the shortfall) once usage is known"""
+        with self._cond:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+            self._cond.notify_all()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        with self._cond:
+            self.scale = max(0.1, self.scale * 0.75)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        with self._cond:
+            self.scale = min(1.0, self.scale + 0.02)
+
+
+class SpendTracker:
+    """Thread-safe request and token counters, globally and per session"""
+
+    FIELDS = ("requests", "prompt_tokens", "completion_tokens", "total_tokens", "rate_limited", "retries", "failures")
+
+    def __init__(self, max_session_tokens: Optional[int] = None):
+        self.max_session_tokens = max_session_tokens
+        self._lock = threading.Lock()
+        self._global = dict.fromkeys(self.FIELDS, 0)
+        self._sessions: Dict[str, Dict[str, int]] = {}
+
+    def _add(self, session_id, **counts):
+        with self._lock:
+            targets = [self._global]
+            if session_id is not None:
+                targets.append(self._sessions.setdefault(session_id, dict.fromkeys(self.FIELDS, 0)))
+            for target in targets:
+                for key, value in counts.items():
+                    target[key] += value
+
+    def record_usage(self, usage, session_id=None):
+        self._add(
+            session_id,
+            requests=1,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            total_tokens=getattr(usage, "total_tokens", 0) or 0
+        )
+
+    def record_event(self, name: str, session_id=None):
+        self._add(session_id, **{name: 1})
+
+    def check_budget(self, session_id=None):
+        if self.max_session_tokens is None or session_id is None:
+            return
+        with self._lock:
+            spent = self._sessions.get(session_id, {}).get("total_tokens", 0)
+        if spent >= self.max_session_tokens:
+            raise TokenBudgetExceeded(f"Session {session_id} spent {spent} tokens (limit {self.max_session_tokens})")
+
+    def totals(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._global)
+
+    def session(self, session_id) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._sessions.get(session_id, dict.fromkeys(self.FIELDS, 0)))
+
+
+def call_with_retry(fn: Callable[[], Any], limiter: RateLimiter, estimated_tokens: int,
+                    spend: SpendTracker = None, deadline: Optional[float] = None,
+                    max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 20.0) -> Any:
+    """Run fn under the limiter, retrying 429s and server errors with full-jitter backoff"""
+    session_id = current_session.get()
+    if spend:
+        spend.check_budget(session_id)
+
+    attempt = 0
+    while True:
+        limiter.acquire(estimated_tokens, deadline)
+        try:
+            result = fn()
+        except Exception as e:
+            # Nothing was spent on a failed call
+            limiter.settle(estimated_tokens, 0)
+            if is_rate_limit_error(e):
+                limiter.on_rate_limited(retry_after_seconds(e))
+                if spend:
+                    spend.record_event("rate_limited", session_id)
+            if not is_retryable_error(e) or attempt >= max_retries:
+                if spend:
+                    spend.record_event("failures", session_id)
+                raise
+
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                if spend:
+                    spend.record_event("failures", session_id)
+                raise
+            attempt += 1
+            if spend:
+                spend.record_event("retries", session_id)
+            time.sleep(delay)
+            continue
+
+        limiter.on_success()
+        usage = getattr(result, "usage", None)
+        if usage is not None:
+            limiter.settle(estimated_tokens, getattr(usage, "total_tokens", estimated_tokens) or estimated_tokens)
+            if spend:
+                spend.record_usage(usage, session_id)
+        return result
@@ -0,0 +1,159 @@
+import argparse
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from intent_rules import fallback_intent_classifier
+import assistant_pool
+import calibration
+from request_log import read_records
+
+
+def make_backend(name: str) -> Callable[[str], Dict[str, Any]]:
+    """Return a function mapping an input (and optional session id) to {intent_category, entities, confidence_score, raw_confidence, timings}
+
+    Raises RuntimeError if the backend is not available (no model, no API
+    key, server down). The function raises too when the assistant answers
+    with its 0.0-confidence failure fallback, so failures count as errors
+    rather than as "other" predictions.
+    """
+    if name == "rules":
+        def run_rules(text, session_id=None):
+            result = fallback_intent_classifier(text, web_search=False)
+            raw_confidence = result["confidence_score"]
+            result["confidence_score"] = calibration.calibrate("rules", result["intent_category"], raw_confidence)
+            return dict(result, raw_confidence=raw_confidence, timings={})
+        return run_rules
+
+    assistant = assistant_pool.get_assistant(name)
+    available, status = assistant.is_available()
+    if not available:
+        raise RuntimeError(f"{name} backend not available: {status}")
+
+    def run(text, session_id=None):
+        response = assistant.process_input(text, session_id=session_id)
+        if response.metadata.get("raw_confidence", response.confidence_score) == 0.0 and response.intent_category == "other":
+            raise RuntimeError(f"{name} returned its fallback response")
+        return {
+            "intent_category": response.intent_category,
+            "entities": response.entities,
+            "confidence_score": response.confidence_score,
+            "raw_confidence": response.metadata.get("raw_confidence", response.confidence_score),
+            "timings": response.metadata.get("timings", {})
+        }
+    return run
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def replay(records: List[Dict[str, Any]], backend: Callable[[str], Dict[str, Any]],
+           rate: float = 5.0, concurrency: int = 8) -> List[Dict[str, Any]]:
+    """Re-run logged requests at a fixed arrival rate (open loop) and collect the outcomes"""
+
+    def run_one(record, arrival):
+        # Latency counts from the scheduled arrival, so time spent queued for a worker is included
+        started = time.perf_counter()
+        try:
+            result, error = backend(record["input"]), None
+        except Exception as e:
+            result, error = None, str(e)
+        finished = time.perf_counter()
+        logged = record.get("result", {})
+        return {
+            "input": record["input"],
+            "logged_backend": record.get("backend"),
+            "logged_intent": logged.get("intent_category"),
+            "intent": result and result["intent_category"],
+            "confidence": result and result["confidence_score"],
+            "agrees": bool(result) and result["intent_category"] == logged.get("intent_category"),
+            "latency": finished - arrival,
+            "service_time": finished - started,
+            "timings": result["timings"] if result else {},
+            "error": error
+        }
+
+    futures = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, record in enumerate(records):
+            # Arrivals follow the schedule even when the backend falls behind
+            arrival = start + i / rate
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(run_one, record, arrival))
+    return [future.result() for future in futures]
+
+
+def summarize(outcomes: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    latencies = [o["latency"] for o in outcomes if not o["error"]]
+    service_times = [o["service_time"] for o in outcomes if not o["error"]]
+    by_backend = defaultdict(lambda: [0, 0])
+    stage_totals = defaultdict(list)
+    for o in outcomes:
+        by_backend[o["logged_backend"]][0] += o["agrees"]
+        by_backend[o["logged_backend"]][1] += 1
+        for stage, seconds in o["timings"].items():
+            stage_totals[stage].append(seconds)
+    return {
+        "requests": len(outcomes),
+        "errors": sum(1 for o in outcomes if o["error"]),
+        "throughput": len(outcomes) / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p90": percentile(latencies, 90),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies, default=0.0),
+        "service_p50": percentile(service_times, 50),
+        "service_p90": percentile(service_times, 90),
+        "service_p99": percentile(service_times, 99),
+        "agreement": sum(o["agrees"] for o in outcomes) / len(outcomes) if outcomes else 0.0,
+        "agreement_by_logged_backend": {str(k): agree / total for k, (agree, total) in by_backend.items()},
+        "stage_means": {stage: sum(v) / len(v) for stage, v in stage_totals.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged requests against a backend")
+    parser.add_argument("log", help="Request log written via NLPARSE_REQUEST_LOG (rotated files are included)")
+    parser.add_argument("--backend", choices=["rules", "local", "ollama", "openai"], default="rules")
+    parser.add_argument("--rate", type=float, default=5.0, help="Requests per second")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many requests")
+    parser.add_argument("--only-backend", default=None, help="Only replay requests originally served by this backend")
+    parser.add_argument("-o", "--output", default=None, help="Write per-request outcomes as JSONL")
+    args = parser.parse_args()
+
+    records = [r for r in read_records(args.log)
+               if r.get("kind") == "request" and r.get("input")
+               and (args.only_backend is None or r.get("backend") == args.only_backend)]
+    records = records[:args.limit] if args.limit else records
+    if not records:
+        print("No requests to replay")
+        return
+
+    try:
+        backend = make_backend(args.backend)
+    except RuntimeError as e:
+        print(e)
+        return
+    start = time.perf_counter()
+    outcomes = replay(records, backend, rate=args.rate, concurrency=args.concurrency)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for outcome in outcomes:
+                f.write(json.dumps(outcome, default=str) + "\n")
+
+    print(json.dumps(summarize(outcomes, elapsed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# Stage timings for the current process_input call; see collect_timings()
+_current_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextlib.contextmanager
+def collect_timings():
+    """Gather the duration of every stage() run inside the block"""
+    timings: Dict[str, float] = {}
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the current request (seconds, summed if repeated)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current_timings.get()
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + time.perf_counter() - start, 4)
+
+
+class RequestLog:
+    """Append-only JSONL log written by a background thread
+
+    log() only serializes and enqueues the record (so callers may keep
+    mutating their dicts); the writer thread batches lines to disk every
+    flush_interval seconds. When the file grows past max_bytes
+    it is rotated to path.1, path.2, ... keeping at most backups old files.
+    Records are dropped (and counted) rather than blocking when the queue
+    is full.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 5,
+                 flush_interval: float = 1.0, max_queue: int = 10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="request-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, record: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[str]:
+        lines = []
+        while True:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                return lines
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self._write(self._drain())
+        self._write(self._drain())
+
+    def _write(self, lines: List[str]):
+        if not lines:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                size = f.tell()
+            if size >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            print(f"Request log write failed: {e}")
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread"""
+        if not self._closed.is_set():
+            self._closed.set()
+            self._thread.join()
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield records from a log, oldest rotated file first"""
+    count = 0
+    while os.path.exists(f"{path}.{count + 1}"):
+        count += 1
+    files = [f"{path}.{i}" for i in range(count, 0, -1)]
+    if os.path.exists(path):
+        files.append(path)
+    for file_path in files:
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+
+def make_record(kind: str, user_input: str, backend: str, response, timings: Dict[str, float],
+                session_id: str = None, **extra) -> Dict[str, Any]:
+    """One log record; response is anything with intent_category, entities and confidence_score"""
+    metadata = getattr(response, "metadata", None) or {}
+    return dict({
+        "timestamp": datetime.now().isoformat(),
+        "kind": kind,
+        "session_id": session_id,
+        "input": user_input,
+        "backend": backend,
+        "prompt_version": metadata.get("prompt_version"),
+        "raw_confidence": metadata.get("raw_confidence", response.confidence_score),
+        "result": {
+            "intent_category": response.intent_category,
+            "entities": response.entities,
+            "confidence_score": response.confidence_score,
+        },
+        "timings": dict(metadata.get("timings", {}), **timings),
+    }, **extra)
+
+
+_log: Optional[RequestLog] = None
+_log_lock = threading.Lock()
+
+
+def get_log() -> Optional[RequestLog]:
+    """Process-wide log at NLPARSE_REQUEST_LOG; None when logging is off"""
+    global _log
+    path = os.getenv("NLPARSE_REQUEST_LOG")
+    if not path:
+        return None
+    with _log_lock:
+        if _log is None:
+            _log = RequestLog(
+                path,
+                max_bytes=int(os.getenv("NLPARSE_REQUEST_LOG_MAX_MB", "50")) * 1024 * 1024,
+                backups=int(os.getenv("NLPARSE_REQUEST_LOG_BACKUPS", "5"))
+            )
+        return _log
@@ -80,18 +80,24 @@ exit /b 1
 :start_with_py
 echo 🌐 App will be available at: http://localhost:8505
 echo 🛑 Press Ctrl+C to stop the server
+REM Load the Ollama models while Streamlit starts
+start "" /b py warmup.py >nul 2>&1
 py -m streamlit run chat_app.py --server.port 8505
 goto :end
 
 :start_with_python
 echo 🌐 App will be available at: http://localhost:8505
 echo 🛑 Press Ctrl+C to stop the server
+REM Load the Ollama models while Streamlit starts
+start "" /b python warmup.py >nul 2>&1
 python -m streamlit run chat_app.py --server.port 8505
 goto :end
 
 :start_with_python3
 echo 🌐 App will be available at: http://localhost:8505
 echo 🛑 Press Ctrl+C to stop the server
+REM Load the Ollama models while Streamlit starts
+start "" /b python3 warmup.py >nul 2>&1
 python3 -m streamlit run chat_app.py --server.port 8505
 goto :end
 
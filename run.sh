@@ -49,6 +49,8 @@ start_app() {
     echo "Using $version_name with streamlit"
     echo "App will be available at: http://localhost:8505"
     echo "Press Ctrl+C to stop the server"
+    # Load the Ollama models while Streamlit starts, so the app's own warm-up finds them resident
+    $python_cmd warmup.py >/dev/null 2>&1 &
     $python_cmd -m streamlit run chat_app.py --server.port 8505
 }
 
@@ -0,0 +1,78 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Optional
+
+from intent_rules import score_intents
+from model_router import WH_WORD_RE
+
+# Start the web search for likely "other" requests while classification is still running
+PREFETCH_ENABLED = os.getenv("NLPARSE_SEARCH_PREFETCH", "1").lower() in ("1", "true", "yes")
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("NLPARSE_PREFETCH_WORKERS", "4")),
+                               thread_name_prefix="search-prefetch")
+_stats_lock = threading.Lock()
+_stats = {"started": 0, "used": 0, "dropped": 0, "failed": 0}
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def likely_other(text: str) -> bool:
+    """Cheap guess that a request is a general question: no intent keywords, or a wh-word"""
+    lower = text.lower()
+    return not score_intents(lower) or bool(WH_WORD_RE.search(lower))
+
+
+class Prefetch:
+    """A web search summary being fetched in the background
+
+    take() waits for it (within the deadline) and returns it, or None if it
+    failed so the caller can search again itself. drop() discards it when
+    the request turned out not to need a search.
+    """
+
+    def __init__(self, searcher, query: str, deadline=None):
+        self.query = query
+        self._done = False
+        self._future = _executor.submit(searcher.get_search_summary, query, deadline=deadline)
+        _count("started")
+
+    def take(self, deadline=None) -> Optional[str]:
+        if self._done:
+            return None
+        self._done = True
+        timeout = deadline.remaining() if deadline is not None else None
+        try:
+            summary = self._future.result(timeout=timeout)
+        except FutureTimeout:
+            _count("failed")
+            return None
+        except Exception as e:
+            print(f"Search prefetch failed: {e}")
+            _count("failed")
+            return None
+        _count("used")
+        return summary
+
+    def drop(self):
+        if self._done:
+            return
+        self._done = True
+        self._future.cancel()
+        _count("dropped")
+
+
+def start(searcher, query: str, deadline=None) -> Optional[Prefetch]:
+    """Prefetch the search for query if it looks like an "other" request"""
+    if not PREFETCH_ENABLED or not likely_other(query):
+        return None
+    return Prefetch(searcher, query, deadline)
+
+
+def stats() -> Dict[str, int]:
+    """Process-wide prefetch counters; "dropped" searches were wasted work"""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,92 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Set
+
+from offline_index import tokenize
+from rate_limiter import estimate_tokens
+
+# Token budget for the search summary handed to the LLM
+SUMMARY_TOKEN_BUDGET = int(os.getenv("NLPARSE_SEARCH_SUMMARY_TOKENS", "400"))
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+WINDOW_SENTENCES = 2
+DUPLICATE_OVERLAP = 0.8
+
+
+def relevance(query_terms: Set[str], text: str) -> float:
+    """Query-term coverage of text, with diminishing credit for repeats"""
+    counts = Counter(t for t in tokenize(text) if t in query_terms)
+    return sum(1 + math.log(tf) for tf in counts.values())
+
+
+def best_window(query_terms: Set[str], text: str, sentences: int = WINDOW_SENTENCES) -> str:
+    """The run of consecutive sentences covering the most query terms (earliest wins ties)"""
+    parts = [p for p in SENTENCE_RE.split(" ".join(text.split())) if p]
+    if len(parts) <= sentences:
+        return " ".join(parts)
+    best_start, best_score = 0, -1.0
+    for start in range(len(parts) - sentences + 1):
+        score = relevance(query_terms, " ".join(parts[start:start + sentences]))
+        if score > best_score:
+            best_start, best_score = start, score
+    return " ".join(parts[best_start:best_start + sentences])
+
+
+def _is_duplicate(tokens: Set[str], seen: List[Set[str]]) -> bool:
+    for other in seen:
+        union = tokens | other
+        if union and len(tokens & other) / len(union) >= DUPLICATE_OVERLAP:
+            return True
+    return False
+
+
+def rank_results(query: str, results: List[Dict[str, str]], max_results: int = 3) -> List[Dict[str, str]]:
+    """Rank results from all providers against query, drop duplicates, and cut snippets to the relevant sentences"""
+    query_terms = set(tokenize(query))
+    scored = []
+    for position, result in enumerate(results):
+        snippet = best_window(query_terms, result.get('snippet', ''))
+        # Title matches count double; position keeps provider order among equal scores
+        score = relevance(query_terms, snippet) + 2 * relevance(query_terms, result.get('title', ''))
+        scored.append((-score, position, dict(result, snippet=snippet)))
+    scored.sort(key=lambda item: item[:2])
+    # Results that share no terms with the query only fill in when nothing matches
+    if scored and scored[0][0] < 0:
+        scored = [item for item in scored if item[0] < 0]
+
+    ranked, seen_urls, seen_tokens = [], set(), []
+    for _, _, result in scored:
+        url = result.get('url', '').rstrip('/').lower()
+        tokens = set(tokenize(result['snippet']))
+        if (url and url in seen_urls) or _is_duplicate(tokens, seen_tokens):
+            continue
+        if url:
+            seen_urls.add(url)
+        seen_tokens.append(tokens)
+        ranked.append(result)
+        if len(ranked) >= max_results:
+            break
+    return ranked
+
+
+def build_summary(query: str, results: List[Dict[str, str]], token_budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Format results for the LLM, stopping (or trimming the last snippet) at token_budget"""
+    parts = [f"Web search results for '{query}':\n\n"]
+    used = estimate_tokens(parts[0])
+    for i, result in enumerate(results, 1):
+        source = f"   Source: {result['url']}\n" if result.get('url') else ""
+        head = f"{i}. {result['title']}\n"
+        overhead = estimate_tokens(head + source) + 2
+        remaining = token_budget - used - overhead
+        if remaining <= 0:
+            break
+        snippet = result['snippet']
+        if estimate_tokens(snippet) > remaining:
+            # Trim to the budget on a word boundary
+            snippet = snippet[:remaining * 4].rsplit(" ", 1)[0] + "..."
+        entry = f"{head}   {snippet}\n{source}\n"
+        parts.append(entry)
+        used += estimate_tokens(entry)
+    return "".join(parts)
@@ -0,0 +1,142 @@
+import contextvars
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import intent_schema
+from intent_rules import fallback_intent_classifier, score_intents
+from intent_schema import SCHEMAS
+
+# Clause boundaries: semicolons, sentence breaks and joining words
+SPLIT_RE = re.compile(r"\s*(?:;|\.\s+|,?\s+(?:and then|and also|as well as|and|also|then|plus)\s+)", re.IGNORECASE)
+
+# Clauses are classified concurrently (LLM and web-search calls are I/O bound)
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("NLPARSE_SEGMENT_WORKERS", "4")),
+                               thread_name_prefix="segment")
+
+
+def _best_intent(text: str):
+    scores = score_intents(text.lower())
+    return max(scores, key=scores.get) if scores else None
+
+
+def split_clauses(text: str) -> List[str]:
+    """Split a compound request into independent clauses
+
+    A piece only becomes its own clause if it has intent keywords of its
+    own and its best intent differs from the clause before it, so
+    "dinner for me and my wife" or "a table at 8 and make it Italian"
+    stay whole.
+    """
+    spans, start = [], 0
+    for match in SPLIT_RE.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+
+    clauses = []  # [start, end, best intent]
+    for span_start, span_end in spans:
+        if not text[span_start:span_end].strip(" ,."):
+            continue
+        intent = _best_intent(text[span_start:span_end])
+        if clauses and (intent is None or clauses[-1][2] is None or intent == clauses[-1][2]):
+            clauses[-1][1] = span_end
+            clauses[-1][2] = clauses[-1][2] or intent
+        else:
+            clauses.append([span_start, span_end, intent])
+    return [text[clause_start:clause_end].strip(" ,.;") for clause_start, clause_end, _ in clauses] or [text]
+
+
+def classify_clauses(clauses: List[str], classify: Callable[[str], Any]) -> List[Any]:
+    """Run classify on every clause concurrently; results are in clause order
+
+    Each call runs in a copy of the caller's context, so the request's
+    session, stage timings and prompt collection carry over to the workers.
+    """
+    if len(clauses) == 1:
+        return [classify(clauses[0])]
+    contexts = [contextvars.copy_context() for _ in clauses]
+    return list(_executor.map(lambda context, clause: context.run(classify, clause), contexts, clauses))
+
+
+def parse_frames(text: str) -> List[Dict[str, Any]]:
+    """Read the frames of a multi-request LLM answer ({"frames": [...]}) into classification dicts"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    data = json.loads(match.group() if match else text)
+    frames = data.get("frames") if isinstance(data, dict) else data
+    if not isinstance(frames, list) or not frames:
+        raise ValueError("No frames in LLM response")
+
+    parsed = []
+    for frame in frames:
+        if not isinstance(frame, dict):
+            continue
+        intent = frame.get("intent_category")
+        entities = frame.get("entities")
+        try:
+            confidence = float(frame.get("confidence_score") or 0.0)
+        except (TypeError, ValueError):
+            confidence = 0.0
+        parsed.append({
+            "text": str(frame.get("text") or ""),
+            "intent_category": intent if intent in SCHEMAS else "other",
+            "entities": entities if isinstance(entities, dict) else {},
+            "confidence_score": confidence
+        })
+    if not parsed:
+        raise ValueError("No usable frames in LLM response")
+    return parsed
+
+
+def _usable(response) -> bool:
+    """Same acceptance test chat_app applies to a single AI classification"""
+    return intent_schema.ai_failed(response) is None
+
+
+def _rule_response(clause: str, deadline=None):
+    from assistant_openai import AssistantResponse
+    result = fallback_intent_classifier(clause, deadline=deadline)
+    return AssistantResponse(
+        intent_category=result["intent_category"],
+        entities=result["entities"],
+        confidence_score=result["confidence_score"],
+        metadata={"segment": clause, "processing_mode": "fallback"}
+    )
+
+
+def classify_frames(user_input: str, clauses: List[str], assistant=None, session_id=None, deadline=None) -> List[Any]:
+    """One response per request in a compound input, in the order they were made
+
+    Assistants with process_frames get the whole input in a single LLM
+    call; others classify each clause in parallel. Frames the AI could not
+    classify (or with no assistant at all) fall back to the rule
+    classifier, again one clause per worker. Each response's metadata
+    carries its "segment" text and "processing_mode".
+    """
+    frames = None
+    if assistant is not None:
+        try:
+            if hasattr(assistant, "process_frames"):
+                frames = assistant.process_frames(user_input, session_id=session_id, deadline=deadline)
+            else:
+                frames = classify_clauses(clauses, lambda clause: assistant.process_input(
+                    clause, None, session_id=session_id, deadline=deadline))
+                for clause, response in zip(clauses, frames):
+                    response.metadata["segment"] = clause
+        except Exception as e:
+            print(f"Multi-request classification failed: {e}")
+            frames = None
+
+    if not frames:
+        return classify_clauses(clauses, lambda clause: _rule_response(clause, deadline))
+
+    retry = [i for i, response in enumerate(frames) if not _usable(response)]
+    if retry:
+        texts = [frames[i].metadata.get("segment") or user_input for i in retry]
+        for i, response in zip(retry, classify_clauses(texts, lambda text: _rule_response(text, deadline))):
+            frames[i] = response
+    for response in frames:
+        response.metadata.setdefault("processing_mode", "ai")
+    return frames
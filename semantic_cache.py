@@ -0,0 +1,207 @@
+import os
+import random
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import requests
+
+from deadline import Deadline, stage_timeout
+from intent_model import extract_features
+from intent_rules import extract_entities
+import query_normalizer
+
+
+class OllamaEmbedder:
+    """Embed text with a local Ollama embedding model"""
+
+    def __init__(self, model: str = "nomic-embed-text", url: str = os.getenv("OLLAMA_URL", "http://localhost:11434")):
+        self.model = model
+        self.url = url
+        self.session = requests.Session()
+
+    def embed(self, text: str, deadline: Optional[Deadline] = None) -> np.ndarray:
+        if deadline is not None:
+            deadline.check("embedding")
+        response = self.session.post(
+            f"{self.url}/api/embeddings",
+            json={"model": self.model, "prompt": text},
+            timeout=stage_timeout(deadline, 10)
+        )
+        response.raise_for_status()
+        return np.asarray(response.json()["embedding"], dtype=np.float32)
+
+
+class HashingEmbedder:
+    """Deterministic local embedder for tests and offline use
+
+    Projects the same hashed word/character n-grams the local intent model
+    uses into a fixed-size vector. Catches reordered and lightly reworded
+    paraphrases, not synonyms.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed(self, text: str, deadline: Optional[Deadline] = None) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        vector[extract_features(text, self.dim)[1:]] = 1.0
+        return vector
+
+
+class CacheHit:
+    def __init__(self, value: Any, similarity: float, key: str):
+        self.value = value
+        self.similarity = similarity
+        self.key = key
+
+
+class SemanticCache:
+    """Nearest-neighbour cache over normalized embeddings
+
+    Vectors live in one preallocated NumPy matrix, so a lookup is a single
+    matrix-vector product (exact search; at the few-thousand-entry capacity
+    this is faster than building an ANN structure). Entries above
+    threshold cosine similarity are hits. When full, the least recently used
+    entry is overwritten.
+
+    A fraction audit_rate of hits should be recomputed by the caller and
+    reported with audit(); those feed the false-hit rate in stats().
+    """
+
+    def __init__(self, embedder, capacity: int = 2048, threshold: float = 0.92, audit_rate: float = 0.0):
+        self.embedder = embedder
+        self.capacity = capacity
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self._vectors = None
+        self._keys = [None] * capacity
+        self._values = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "inserts": 0, "evictions": 0,
+                       "audited": 0, "false_hits": 0, "embed_errors": 0}
+
+    def _embed(self, text: str, deadline: Optional[Deadline] = None) -> Optional[np.ndarray]:
+        try:
+            # Spelling, case and filler words shouldn't move a request away from its cached paraphrases
+            vector = self.embedder.embed(query_normalizer.normalize(text), deadline)
+        except Exception as e:
+            print(f"Semantic cache embedding failed: {e}")
+            with self._lock:
+                self._stats["embed_errors"] += 1
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, text: str, deadline: Optional[Deadline] = None) -> Optional[CacheHit]:
+        """Return the closest cached entry above the threshold, or None"""
+        vector = self._embed(text, deadline)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if vector is None or self._size == 0:
+                self._stats["misses"] += 1
+                return None
+            similarities = self._vectors[:self._size] @ vector
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                self._stats["misses"] += 1
+                return None
+            self._tick += 1
+            self._last_used[best] = self._tick
+            self._stats["hits"] += 1
+            return CacheHit(self._values[best], float(similarities[best]), self._keys[best])
+
+    def put(self, text: str, value: Any, deadline: Optional[Deadline] = None):
+        vector = self._embed(text, deadline)
+        if vector is None:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(self._last_used.argmin())
+                self._stats["evictions"] += 1
+            self._tick += 1
+            self._vectors[slot] = vector
+            self._keys[slot] = text
+            self._values[slot] = value
+            self._last_used[slot] = self._tick
+            self._stats["inserts"] += 1
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def audit(self, hit: CacheHit, fresh_value: Any, same: Callable[[Any, Any], bool] = None):
+        """Record whether a hit agreed with a freshly computed value"""
+        matched = same(hit.value, fresh_value) if same else hit.value == fresh_value
+        with self._lock:
+            self._stats["audited"] += 1
+            if not matched:
+                self._stats["false_hits"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["false_hit_rate"] = stats["false_hits"] / stats["audited"] if stats["audited"] else 0.0
+        return stats
+
+
+def cached_classification(hit: CacheHit, user_input: str) -> Dict[str, Any]:
+    """Rebuild a classification result for user_input from a cached paraphrase
+
+    The intent and confidence are reused. A cached entity value is kept only
+    if it also appears in the new input, so "for 4" never inherits "for 2"
+    from the cached request; the rule extractors fill the rest.
+    """
+    intent = hit.value["intent_category"]
+    entities = extract_entities(user_input, intent)
+    text = user_input.lower()
+    for field, value in (hit.value.get("entities") or {}).items():
+        if isinstance(value, str) and value and value.lower() in text:
+            entities[field] = value
+    return {
+        "intent_category": intent,
+        "entities": entities,
+        "confidence_score": hit.value["confidence_score"]
+    }
+
+
+def same_intent(cached: Dict[str, Any], fresh: Dict[str, Any]) -> bool:
+    return cached.get("intent_category") == fresh.get("intent_category")
+
+
+def similar_text(cached: str, fresh: str, min_overlap: float = 0.5) -> bool:
+    """Word-set Jaccard overlap, used to audit cached free-text answers"""
+    a, b = set(cached.lower().split()), set(fresh.lower().split())
+    return bool(a | b) and len(a & b) / len(a | b) >= min_overlap
+
+
+def from_env(kind: str) -> Optional[SemanticCache]:
+    """Build a cache from NLPARSE_SEMANTIC_CACHE ("ollama" or "hashing"); None when unset
+
+    kind selects the threshold: "classify" needs a tighter match than
+    "response", since a near miss there returns the wrong intent.
+    """
+    embedder_name = os.getenv("NLPARSE_SEMANTIC_CACHE", "").lower()
+    if embedder_name == "ollama":
+        embedder = OllamaEmbedder(os.getenv("NLPARSE_EMBED_MODEL", "nomic-embed-text"))
+    elif embedder_name == "hashing":
+        embedder = HashingEmbedder()
+    else:
+        return None
+
+    default_threshold = "0.9" if kind == "classify" else "0.85"
+    return SemanticCache(
+        embedder,
+        capacity=int(os.getenv("NLPARSE_SEMANTIC_CAPACITY", "2048")),
+        threshold=float(os.getenv(f"NLPARSE_SEMANTIC_THRESHOLD_{kind.upper()}", default_threshold)),
+        audit_rate=float(os.getenv("NLPARSE_SEMANTIC_AUDIT_RATE", "0.02"))
+    )
@@ -0,0 +1,60 @@
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive a deep copy of its result (or its
+    exception). Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "executions": 0, "shared": 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["shared"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Followers get their own copy so callers can mutate results freely
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._calls[key]
+                shared = call.waiters > 0
+            call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        # Keep the shared result pristine while followers copy it
+        return copy.deepcopy(call.result) if shared else call.result
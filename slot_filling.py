@@ -0,0 +1,359 @@
+import re
+import sys
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from intent_rules import CUISINES, DATE_RES
+from intent_schema import SCHEMAS
+from query_normalizer import STOPWORDS
+
+# A parser gets the answer (already-used spans blanked out) and whether its field
+# is the one that was asked. It returns (normalized value, (start, end)), or None.
+# Parsers for fields that were not asked only accept unambiguous forms. Typed
+# parsers see the answer lowercased; free-text ones (FREE_TEXT_TYPES) see it as
+# typed, so "Paris" or "my Mom" are kept as written.
+Parser = Callable[[str, bool], Optional[Tuple[str, Tuple[int, int]]]]
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "a couple": 2, "couple": 2,
+}
+NUMBER = r"\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True))
+MAX_COUNT = 50
+
+COUNT_RE = re.compile(rf"\b({NUMBER})\s*(?:of us|people|persons?|pax|guests?|adults?|passengers?|travell?ers?)\b")
+# A number that is part of a time, date, amount, decimal or duration is not a count
+NOT_COUNT = r"(?![:/.,]\d|\s*(?:am|pm|a\.m\.|p\.m\.|k|hours?|hrs?|days?|nights?|weeks?|months?|years?|dollars|bucks)\b)"
+# A bare number, only when the count was asked; it may sit among other slots ("for 2 on friday at 7:30pm")
+BARE_COUNT_RE = re.compile(rf"(?:\b(?:about|around|maybe|we are|we're|there are|there will be|party of|table for|for)\s+)?"
+                           rf"(?<![\d:/.,$])\b({NUMBER})\b{NOT_COUNT}(?:\s+of us\b)?")
+# "for 4" or "party of 6" also fills a pending count while another field is asked ("I want italian for 4")
+FOR_COUNT_RE = re.compile(rf"\b(?:party of|for)\s+({NUMBER})\b{NOT_COUNT}")
+SOLO_RE = re.compile(r"\b(?:just me|only me|myself|alone|solo|by myself)\b")
+
+TIME_RE = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)")
+CLOCK_RE = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)\b")
+NAMED_TIMES = {"noon": "12pm", "midday": "12pm", "midnight": "12am"}
+NAMED_TIME_RE = re.compile(r"\b(noon|midday|midnight)\b")
+BARE_HOUR_RE = re.compile(r"^\s*(?:at|around|about|by|maybe)?\s*(\d{1,2})(?::(\d{2}))?\s*(?:o'?clock)?\s*(morning|in the morning|evening|in the evening|tonight|at night)?\s*$")
+MORNING_RE = re.compile(r"\bmorning\b")
+
+WEEKDAYS = "monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+EXTRA_DATE_RES = [re.compile(pattern) for pattern in [
+    r"\bday after tomorrow\b",
+    r"\btonight\b",
+    r"\bthis weekend\b",
+    r"\bnext week\b",
+    rf"\b(?:on\s+)?({WEEKDAYS})\b",
+]]
+NUMERIC_DATE_RE = re.compile(r"^(\d{1,2})/(\d{1,2})(?:/(\d{4}))?$")
+
+MONEY_RE = re.compile(r"(?:\$|rs\.?\s*|₹|€|£)\s*(\d+(?:\.\d+)?)\s*(k)?|(\d+(?:\.\d+)?)\s*(k)?\s*(?:dollars|bucks|usd|rupees|inr|euros?)\b")
+MONEY_RANGE_RE = re.compile(r"\$?\s*(\d+)\s*(?:-|to|and)\s*\$?\s*(\d+)")
+BUDGET_WORD_RE = re.compile(r"\b(?:under|below|less than|up to|upto|max(?:imum)?|budget(?: is| of)?)\s*\$?\s*(\d+(?:\.\d+)?)\s*(k)?\b")
+BARE_MONEY_RE = re.compile(r"^\s*(?:around|about|roughly)?\s*\$?\s*(\d+(?:\.\d+)?)\s*(k)?\s*$")
+
+CUISINE_SYNONYMS = {
+    "pizza": "Italian", "pasta": "Italian", "sushi": "Japanese", "ramen": "Japanese", "tacos": "Mexican",
+    "curry": "Indian", "biryani": "Indian", "dim sum": "Chinese", "noodles": "Chinese", "bbq": "American",
+    "burgers": "American", "pho": "Vietnamese", "kebab": "Turkish",
+}
+OCCASIONS = [
+    "birthday", "anniversary", "wedding", "engagement", "graduation", "farewell", "retirement", "promotion",
+    "housewarming", "baby shower", "christmas", "diwali", "eid", "new year", "valentine's day", "valentines day",
+    "mother's day", "mothers day", "father's day", "fathers day", "thank you", "get well soon",
+]
+# A possessive goes with the occasion, so "mom's birthday" leaves "mom" for the recipient
+OCCASION_RE = re.compile(r"(?:'s)?\s*\b(" + "|".join(sorted(OCCASIONS, key=len, reverse=True)) + r")\b")
+
+CUISINE_RE = re.compile(r"\b(" + "|".join(sorted(CUISINES + list(CUISINE_SYNONYMS), key=len, reverse=True)) + r")\b")
+FREE_CUISINE_RE = re.compile(r"^\s*([a-z][a-z\- ]{2,30}?)\s*(?:food|cuisine|restaurant)?\s*$")
+ANY_RE = re.compile(r"^\s*(?:any|anything|no preference|don't care|dont care|whatever|surprise me)\s*$")
+
+ROUTE_RE = re.compile(r"\bfrom\s+(.+?)\s+to\s+(.+?)\s*$", re.IGNORECASE)
+LOCATION_PREFIX_RE = re.compile(r"^\s*(?:from|to|at|in|near|pick me up (?:at|from)|going to)\s+", re.IGNORECASE)
+
+# Left dangling once other slots are cut out of an answer ("airport at" from "airport at 6am")
+TRAILING_WORD_RE = re.compile(r"(?:\s+(?:at|on|for|and|by|around|with|,))+\s*$", re.IGNORECASE)
+
+# Answers that never fill a slot
+NON_ANSWERS = frozenset(["", "yes", "no", "ok", "okay", "idk", "i don't know", "not sure", "?", "skip"])
+
+# Leftovers made only of these say nothing ("for" once "4 people" is cut out of "for 4 people")
+FILLER_WORDS = STOPWORDS | frozenset([
+    "at", "on", "for", "and", "by", "around", "with", "to", "from", "in", "of", "or", "about",
+    "maybe", "we", "us", "it", "is", "are", "be", "people",
+])
+
+# Field types whose value is the answer text itself, so parsed with its original case
+FREE_TEXT_TYPES = ("location", "occasion", "text")
+
+HINTS = {
+    "count": "a number of people, like 4",
+    "date": "a date, like tomorrow, next Friday or 12/25",
+    "time": "a time, like 7:30pm",
+    "money": "an amount, like $50 or $50-100",
+    "location": "a place",
+    "cuisine": "a cuisine, like Italian or Thai",
+    "occasion": "an occasion, like a birthday or an anniversary",
+    "text": "an answer",
+}
+
+# Multi-slot answers are parsed most specific type first, so "4 people at 8pm" gives 8pm to the time
+PARSE_ORDER = ("money", "date", "time", "count", "cuisine", "occasion", "location", "text")
+
+
+def _number(word: str) -> int:
+    return int(word) if word.isdigit() else NUMBER_WORDS[word]
+
+
+def parse_count(text: str, asked: bool):
+    match = COUNT_RE.search(text) or (BARE_COUNT_RE if asked else FOR_COUNT_RE).search(text)
+    if match:
+        value = _number(match.group(1))
+        return (str(value), match.span()) if 1 <= value <= MAX_COUNT else None
+    match = SOLO_RE.search(text)
+    return ("1", match.span()) if match else None
+
+
+def _hour_value(hour: int, minutes: Optional[str], suffix: str) -> Optional[str]:
+    if not 1 <= hour <= 12:
+        return None
+    return f"{hour}:{minutes}{suffix}" if minutes and minutes != "00" else f"{hour}{suffix}"
+
+
+def parse_time(text: str, asked: bool):
+    match = TIME_RE.search(text)
+    if match:
+        hour, minutes, suffix = int(match.group(1)), match.group(2), match.group(3).replace(".", "")
+        value = _hour_value(hour, minutes, suffix)
+        return (value, match.span()) if value else None
+    match = CLOCK_RE.search(text)
+    if match:
+        hour, minutes = int(match.group(1)), match.group(2)
+        # "8:30" reads like "8": afternoon/evening unless the morning is mentioned; "08:30" is 24-hour
+        morning = match.group(1).startswith("0") or MORNING_RE.search(text)
+        suffix = "am" if hour < 12 and morning else "pm"
+        return _hour_value(hour % 12 or 12, minutes, suffix), match.span()
+    match = NAMED_TIME_RE.search(text)
+    if match:
+        return NAMED_TIMES[match.group(1)], match.span()
+    match = BARE_HOUR_RE.search(text) if asked else None
+    if match:
+        # "around 8": afternoon/evening unless the morning is mentioned
+        suffix = "am" if match.group(3) and MORNING_RE.search(match.group(3)) else "pm"
+        value = _hour_value(int(match.group(1)), match.group(2), suffix)
+        return (value, match.span()) if value else None
+    return None
+
+
+def parse_date(text: str, asked: bool):
+    for pattern in DATE_RES + EXTRA_DATE_RES:
+        match = pattern.search(text)
+        if not match:
+            continue
+        value = " ".join(match.group(0).split())
+        if value.startswith("on "):
+            value = value[3:]
+        elif value == "tonight":
+            value = "today"
+        numeric = NUMERIC_DATE_RE.match(value)
+        if numeric and not (1 <= int(numeric.group(1)) <= 12 and 1 <= int(numeric.group(2)) <= 31):
+            return None
+        return value, match.span()
+    return None
+
+
+def _amount(number: str, thousands: Optional[str]) -> str:
+    value = float(number) * (1000 if thousands else 1)
+    return f"${value:,.0f}" if value == int(value) else f"${value:,.2f}"
+
+
+def parse_money(text: str, asked: bool):
+    match = MONEY_RANGE_RE.search(text)
+    if match and (asked or "$" in match.group(0)) and int(match.group(1)) < int(match.group(2)):
+        return f"{_amount(match.group(1), None)}-{_amount(match.group(2), None)}", match.span()
+    match = BUDGET_WORD_RE.search(text) or (BARE_MONEY_RE.search(text) if asked else None)
+    if match:
+        return _amount(match.group(1), match.group(2)), match.span()
+    match = MONEY_RE.search(text)
+    if match:
+        number, thousands = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+        return _amount(number, thousands), match.span()
+    return None
+
+
+def parse_cuisine(text: str, asked: bool):
+    match = CUISINE_RE.search(text)
+    if match:
+        word = match.group(1)
+        return CUISINE_SYNONYMS.get(word, word.title()), match.span()
+    if not asked:
+        return None
+    if ANY_RE.search(text):
+        return "Any", (0, len(text))
+    # An unlisted cuisine ("ethiopian food") is fine, as long as it looks like one and says something
+    value = _free_text(text)
+    match = FREE_CUISINE_RE.search(value) if value else None
+    if match and len(match.group(1).split()) <= 3:
+        return match.group(1).strip().title(), (0, len(text))
+    return None
+
+
+def parse_occasion(text: str, asked: bool):
+    match = OCCASION_RE.search(text.lower())
+    if match:
+        return match.group(1), match.span()
+    # Anything else that says something is taken as the occasion when it was asked ("her new job")
+    return parse_text(text, asked)
+
+
+def _free_text(text: str) -> Optional[str]:
+    """What is left of an answer once dangling words are dropped; None if that says nothing"""
+    value = TRAILING_WORD_RE.sub("", " ".join(text.split())).strip(" .,!;")
+    words = re.findall(r"[a-z0-9']+", value.lower())
+    if value.lower() in NON_ANSWERS or not words or all(word in FILLER_WORDS for word in words):
+        return None
+    return value
+
+
+def parse_location(text: str, asked: bool):
+    if not asked:
+        return None
+    value = _free_text(LOCATION_PREFIX_RE.sub("", text))
+    if not value or not re.search(r"[a-z]", value, re.IGNORECASE) or len(value) > 80:
+        return None
+    return value, (0, len(text))
+
+
+def parse_text(text: str, asked: bool):
+    value = _free_text(text) if asked else None
+    return (value, (0, len(text))) if value else None
+
+
+PARSERS: Dict[str, Parser] = {
+    "count": parse_count,
+    "date": parse_date,
+    "time": parse_time,
+    "money": parse_money,
+    "location": parse_location,
+    "cuisine": parse_cuisine,
+    "occasion": parse_occasion,
+    "text": parse_text,
+}
+
+
+def _route(text: str, fields: List[str], entities: Dict[str, Any]) -> Dict[str, str]:
+    """"from home to the airport" answers both ends of a cab ride at once"""
+    if "pickup_location" not in fields or "destination" not in fields:
+        return {}
+    match = ROUTE_RE.search(text)
+    if not match:
+        return {}
+    return {"pickup_location": match.group(1).strip(), "destination": match.group(2).strip(" .")}
+
+
+def fill_slots(intent: str, answer: str, asked: str, pending: List[str] = (),
+               entities: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, str], Optional[str]]:
+    """Parse a follow-up answer into normalized slot values
+
+    asked is the field the question was about; pending are fields still
+    to be asked, which the same answer may also fill ("4 people at 8pm").
+    Empty optional fields with a specific type (e.g. budget) are picked up
+    too. Returns the filled values and, if asked could not be parsed, the
+    question to ask again.
+    """
+    schema = SCHEMAS.get(intent)
+    if schema is None or asked not in schema.by_name:
+        value = _free_text(answer)
+        return ({asked: answer.strip()}, None) if value else ({}, f"Sorry, I didn't catch that. Could you tell me {asked.replace('_', ' ')}?")
+
+    entities = entities or {}
+    candidates = [asked] + [name for name in pending if name != asked and name in schema.by_name]
+    candidates += [name for name in schema.optional
+                   if name not in candidates and not entities.get(name)
+                   and schema.by_name[name].type not in ("text", "location")]
+
+    # Typed parsers match on the lowercased copy, free text is cut from the original; both are blanked
+    # together, which needs lower() to keep the length (it doesn't for a few characters, like "İ")
+    text = answer.lower()
+    original = answer if len(answer) == len(text) else text
+    filled = _route(original, candidates, entities)
+    if filled:
+        text = original = ""
+
+    # Most specific type first; each match blanks out its span so it is not read twice
+    for field_type in PARSE_ORDER:
+        for name in candidates:
+            if name in filled or schema.by_name[name].type != field_type:
+                continue
+            result = PARSERS[field_type](original if field_type in FREE_TEXT_TYPES else text, name == asked)
+            if result is None:
+                continue
+            value, (start, end) = result
+            filled[name] = value
+            text = text[:start] + " " * (end - start) + text[end:]
+            original = original[:start] + " " * (end - start) + original[end:]
+            if not text.strip():
+                break
+
+    if asked in filled:
+        return filled, None
+    spec = schema.by_name[asked]
+    return filled, f"Sorry, I didn't catch that. {spec.question} (Please give {HINTS[spec.type]}.)"
+
+
+def completeness_confidence(intent: str, entities: Dict[str, Any], current: float = 0.0) -> float:
+    """Confidence once follow-ups are filled: a clear intent (0.5) plus up to 0.4 for required fields"""
+    schema = SCHEMAS.get(intent)
+    if schema is None or not schema.required:
+        return current
+    filled = sum(1 for name in schema.required if entities.get(name))
+    return max(current, round(0.5 + 0.4 * filled / len(schema.required), 2))
+
+
+# Answers that used to be misread: (intent, answer, asked, pending, expected fills, re-asked?)
+REGRESSION_CASES = [
+    ("dining", "for 4 people", "cuisine", ["party_size"], {"party_size": "4"}, True),
+    ("dining", "not sure", "cuisine", [], {}, True),
+    ("dining", "ethiopian food", "cuisine", [], {"cuisine": "Ethiopian"}, False),
+    ("dining", "for 2 on friday at 7:30pm", "party_size", ["date", "time"],
+     {"party_size": "2", "date": "friday", "time": "7:30pm"}, False),
+    ("dining", "4 of us at 8pm tomorrow, italian", "party_size", ["time", "date", "cuisine"],
+     {"party_size": "4", "time": "8pm", "date": "tomorrow", "cuisine": "Italian"}, False),
+    ("travel", "Paris", "destination", [], {"destination": "Paris"}, False),
+    ("gifting", "my Mom", "recipient", [], {"recipient": "my Mom"}, False),
+    ("gifting", "not sure", "recipient", [], {}, True),
+    ("cab_booking", "from Home to MG Road", "pickup_location", ["destination"],
+     {"pickup_location": "Home", "destination": "MG Road"}, False),
+    ("cab_booking", "MG Road at 6am", "pickup_location", ["time"],
+     {"pickup_location": "MG Road", "time": "6am"}, False),
+    ("dining", "8:30", "time", [], {"time": "8:30pm"}, False),
+    ("dining", "08:30", "time", [], {"time": "8:30am"}, False),
+    ("dining", "I want italian for 4", "cuisine", ["party_size"], {"cuisine": "Italian", "party_size": "4"}, False),
+    ("gifting", "mom's birthday, around $40", "recipient", ["occasion", "budget"],
+     {"recipient": "mom", "occasion": "birthday", "budget": "$40"}, False),
+]
+
+
+def check() -> List[str]:
+    """Run REGRESSION_CASES; returns a description of each case that fails"""
+    failures = []
+    for intent, answer, asked, pending, expected, reasked in REGRESSION_CASES:
+        filled, reask = fill_slots(intent, answer, asked, pending)
+        if filled != expected or bool(reask) != reasked:
+            failures.append(f"{intent} {asked} {answer!r}: got {filled}, re-ask {bool(reask)}; "
+                            f"expected {expected}, re-ask {reasked}")
+    return failures
+
+
+def main():
+    failures = check()
+    for failure in failures:
+        print(failure)
+    print(f"{len(REGRESSION_CASES) - len(failures)}/{len(REGRESSION_CASES)} slot-filling cases pass")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
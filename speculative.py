@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+from intent_rules import fallback_intent_classifier
+
+# Latency budget for the LLM before the rule result is used (seconds)
+DEFAULT_LLM_BUDGET = float(os.getenv("NLPARSE_LLM_BUDGET", "3.0"))
+
+# LLM calls outlive the request that started them, so they run on a shared pool
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("NLPARSE_SPECULATIVE_WORKERS", "8")),
+                               thread_name_prefix="speculative-llm")
+
+
+class SpeculativeOutcome:
+    def __init__(self, rule_result: Dict[str, Any], ai_response=None, pending: Optional[Future] = None, error: Exception = None):
+        self.rule_result = rule_result
+        self.ai_response = ai_response
+        # Still-running LLM call whose result should be reconciled later
+        self.pending = pending
+        self.error = error
+
+
+def classify_speculatively(assistant, user_input: str, existing_entities: Dict[str, Any] = None,
+                           session_id: str = None, budget: float = DEFAULT_LLM_BUDGET,
+                           on_provisional: Callable[[Dict[str, Any]], None] = None,
+                           deadline=None, rule_result: Optional[Dict[str, Any]] = None) -> SpeculativeOutcome:
+    """Start the LLM call, run the rule classifier meanwhile, and wait at most budget seconds for the LLM
+
+    on_provisional receives the rule result as soon as it is ready, before the
+    LLM has answered, so the UI can show it. A rule_result the caller already
+    has is used instead of classifying again.
+    """
+    ai_future = _executor.submit(assistant.process_input, user_input, existing_entities,
+                                 session_id=session_id, deadline=deadline)
+    if deadline is not None:
+        budget = min(budget, deadline.remaining())
+
+    # The rule path is CPU-only here; a web search for "other" only runs if its result is actually used
+    if rule_result is None:
+        rule_result = fallback_intent_classifier(user_input, web_search=False)
+    if on_provisional:
+        on_provisional(rule_result)
+
+    try:
+        return SpeculativeOutcome(rule_result, ai_response=ai_future.result(timeout=budget))
+    except TimeoutError:
+        return SpeculativeOutcome(rule_result, pending=ai_future)
+    except Exception as e:
+        return SpeculativeOutcome(rule_result, error=e)
+
+
+def reconcile_entities(current: Dict[str, Any], late_entities: Dict[str, Any]) -> List[str]:
+    """Fill empty fields in current from a late LLM result; values already present win
+
+    Returns the names of the fields that were filled.
+    """
+    filled = []
+    for field, value in (late_entities or {}).items():
+        if value and not current.get(field):
+            current[field] = value
+            filled.append(field)
+    return filled
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+import assistant_pool
+import calibration
+import intent_model
+import offline_index
+import search_prefetch
+import segmentation
+import slot_filling
+from intent_rules import fallback_intent_classifier
+
+# Loading a large model from disk can take a while; only the boot waits on this
+WARMUP_TIMEOUT = float(os.getenv("NLPARSE_WARMUP_TIMEOUT", "120"))
+
+# Run through the rule, segmentation and slot paths once so their lazy state is built before the first user
+SAMPLE_INPUTS = [
+    "Book a table for 4 at an Italian restaurant tomorrow at 8pm",
+    "Book a cab from home to the airport at 6am and find a birthday gift for mom under $50",
+    "How do I apply for an Aadhaar card?",
+]
+
+
+def prime_local():
+    """Build the in-process state the first request would otherwise pay for"""
+    for text in SAMPLE_INPUTS:
+        fallback_intent_classifier(text, web_search=False)
+        segmentation.split_clauses(text)
+        search_prefetch.likely_other(text)
+    slot_filling.fill_slots("dining", "4 of us at 8pm tomorrow, italian", "party_size", ["time", "date", "cuisine"])
+    intent_model.get_model()
+    offline_index.get_index()
+    calibration.get_calibrator()
+
+
+def ollama_models() -> List[str]:
+    """Every model the Ollama backend may call: the routed chat models and the embedding model"""
+    import model_router
+    models = [route.model for route in model_router.from_env().routes.values()]
+    if os.getenv("NLPARSE_SEMANTIC_CACHE", "").lower() == "ollama":
+        models.append(os.getenv("NLPARSE_EMBED_MODEL", "nomic-embed-text"))
+    return models
+
+
+def preload_ollama(models: Optional[List[str]] = None, session: Optional[requests.Session] = None):
+    """Load the models into Ollama's memory and keep them there (an empty generate with keep_alive)
+
+    Uses the pooled Ollama assistant's session, so the connections opened
+    here are the ones its first requests reuse.
+    """
+    from assistant_ollama import OLLAMA_KEEP_ALIVE, OLLAMA_URL
+    session = session or assistant_pool.get_assistant("ollama").session
+    for model in models or ollama_models():
+        response = session.post(f"{OLLAMA_URL}/api/generate",
+                                json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE},
+                                timeout=WARMUP_TIMEOUT)
+        if response.status_code == 400 and "embed" in response.text.lower():
+            # Embedding-only models reject generate; an embedding request loads them instead
+            response = session.post(f"{OLLAMA_URL}/api/embeddings",
+                                    json={"model": model, "prompt": "warm up", "keep_alive": OLLAMA_KEEP_ALIVE},
+                                    timeout=WARMUP_TIMEOUT)
+        response.raise_for_status()
+
+
+def load_openai():
+    """Import the OpenAI SDK now; the import is most of the cost of the first client"""
+    import openai  # noqa: F401
+
+
+def warm_up(provider: Optional[str] = None) -> Dict[str, Any]:
+    """Warm everything provider needs, in parallel; returns per-step seconds and any errors
+
+    A failed step doesn't fail the warm-up: the request path still works,
+    it just pays that cost on first use.
+    """
+    steps: Dict[str, Callable[[], None]] = {"local": prime_local}
+    if provider == "ollama":
+        steps["ollama_models"] = preload_ollama
+    elif provider == "openai":
+        steps["openai_sdk"] = load_openai
+
+    timings, errors = {}, {}
+
+    def run(name: str):
+        start = time.perf_counter()
+        try:
+            steps[name]()
+        except Exception as e:
+            errors[name] = str(e)
+        timings[name] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="warmup") as executor:
+        list(executor.map(run, steps))
+    return {
+        "provider": provider,
+        "seconds": round(time.perf_counter() - start, 4),
+        "steps": timings,
+        "errors": errors,
+    }
+
+
+def open_connections(assistant, background: bool = True) -> Optional[threading.Thread]:
+    """Open the assistant's pooled HTTP connections (TCP + TLS) before its first request"""
+    calls = []
+    if hasattr(assistant, "client"):
+        calls.append(lambda: assistant.client.with_options(timeout=10).models.list())
+    elif hasattr(assistant, "session") and hasattr(assistant, "url"):
+        calls.append(lambda: assistant.session.get(f"{assistant.url}/api/tags", timeout=5))
+    searcher = getattr(assistant, "web_searcher", None)
+    if searcher is not None:
+        from web_search import DUCKDUCKGO_URL
+        calls.append(lambda: searcher.session.head(DUCKDUCKGO_URL, timeout=5))
+
+    def run():
+        for call in calls:
+            try:
+                call()
+            except Exception as e:
+                print(f"Connection warm-up failed: {e}")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warmup-connections", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preload models and prime caches before the first request")
+    parser.add_argument("--provider", choices=["openai", "ollama", "local"], default=None,
+                        help="Backend to warm (default: OpenAI if a key is set, else Ollama if running)")
+    args = parser.parse_args()
+
+    provider = args.provider
+    if provider is None and os.getenv("OPENAI_API_KEY"):
+        provider = "openai"
+    elif provider is None:
+        from assistant_ollama import OllamaPersonalAssistant
+        provider = "ollama" if OllamaPersonalAssistant.is_available()[0] else None
+    print(json.dumps(warm_up(provider), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,158 @@
+import os
 import requests
 import json
 import urllib.parse
 import ssl
 import certifi
-from typing import List, Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Dict, Optional, Tuple
+from single_flight import SingleFlight
+from deadline import Deadline, stage_timeout
+import offline_index
+import query_normalizer
+from search_ranking import build_summary, rank_results
+
+# Shared by every WebSearcher so concurrent sessions asking the same thing share one lookup
+_search_flight = SingleFlight()
+
+# Found results are kept for SEARCH_TTL seconds; misses only for NEGATIVE_TTL, so a query that
+# starts returning results (or a provider that comes back) is picked up again soon
+SEARCH_TTL = float(os.getenv("NLPARSE_SEARCH_TTL", "600"))
+NEGATIVE_TTL = float(os.getenv("NLPARSE_SEARCH_NEGATIVE_TTL", "60"))
+SEARCH_CACHE_SIZE = int(os.getenv("NLPARSE_SEARCH_CACHE_SIZE", "1024"))
+
+DUCKDUCKGO_URL = os.getenv("NLPARSE_DDG_URL", "https://api.duckduckgo.com/")
+
+# Candidates gathered per requested result before ranking
+CANDIDATE_FACTOR = 3
+
+class ResultCache:
+    """LRU cache of ranked results per normalized query, each entry with its own expiry"""
+
+    def __init__(self, capacity: int = SEARCH_CACHE_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+
+    def get(self, key: Tuple[str, int]) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits" if entry[1] else "negative_hits"] += 1
+            return [dict(result) for result in entry[1]]
+
+    def put(self, key: Tuple[str, int], results: List[Dict[str, str]], ttl: float):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, [dict(result) for result in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+# Shared by every WebSearcher
+_result_cache = ResultCache()
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Process-wide search cache counters; negative_hits are provider round-trips skipped for known misses"""
+    return _result_cache.stats()
+
 
 class WebSearcher:
     """Web search utility with multiple fallback providers"""
     
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, session: Optional[requests.Session] = None):
+        # Pass a shared session (see assistant_pool) to reuse its connection pool
+        self.session = session or requests.Session()
         # Handle SSL certificate issues
         self.session.verify = certifi.where()
         
-    def search(self, query: str, max_results: int = 3) -> List[Dict[str, str]]:
+    def search(self, query: str, max_results: int = 3, deadline: Optional[Deadline] = None) -> List[Dict[str, str]]:
         """
         Search the web and return results
         Returns list of dicts with 'title', 'snippet', and 'url' keys
+        Network providers are skipped once the request deadline has passed
         """
+        key = (query_normalizer.normalize(query), max_results)
+        results = _result_cache.get(key)
+        if results is None:
+            results = _search_flight.do(key, self._search_providers, key, query, max_results, deadline)
+        
+        # Fallback with mock data, only when nothing was found and there is no offline index
+        if not results and offline_index.get_index() is None:
+            results = rank_results(query, self._search_mock(query, max_results, deadline), max_results)
+        return results
+
+    def _search_providers(self, key: Tuple[str, int], query: str, max_results: int,
+                          deadline: Optional[Deadline] = None) -> List[Dict[str, str]]:
+        """Gather candidates from the providers in turn, then rank, deduplicate and cache them
+
+        A provider returns None when it is not configured, a list when it
+        answered, and raises when it could not be asked or failed.
+        """
+        wanted = max_results * CANDIDATE_FACTOR
+        candidates = []
+        answered = skipped = False
         # Try multiple search providers in order
         providers = [
+            self._search_offline,  # Local index first when one is configured
             self._search_duckduckgo,
-            self._search_google_custom,
-            self._search_mock  # Fallback with mock data
+            self._search_google_custom
         ]
         
         for provider in providers:
+            if deadline is not None and deadline.expired() and provider != self._search_offline:
+                skipped = True
+                continue
             try:
-                results = provider(query, max_results)
-                if results:
-                    return results
+                found = provider(query, wanted, deadline)
             except Exception as e:
                 print(f"Search provider failed: {e}")
+                skipped = True
+                continue
+            if found is None:
                 continue
+            answered = True
+            candidates.extend(found)
+            # Later (slower) providers are only asked when earlier ones came up short
+            if len(candidates) >= max_results:
+                break
         
-        return []
+        results = rank_results(query, candidates, max_results)
+        if results:
+            _result_cache.put(key, results, SEARCH_TTL)
+        elif answered and not skipped:
+            # Every provider answered and none had anything: skip their round trips on repeats for a while
+            # (a failure or timeout may be transient, so it is never cached)
+            _result_cache.put(key, results, NEGATIVE_TTL)
+        return results
     
-    def _search_duckduckgo(self, query: str, max_results: int) -> List[Dict[str, str]]:
+    def _search_offline(self, query: str, max_results: int, deadline: Optional[Deadline] = None) -> Optional[List[Dict[str, str]]]:
+        """Search the local BM25 index (NLPARSE_SEARCH_INDEX), if there is one"""
+        index = offline_index.get_index()
+        if index is None:
+            return None
+        return index.search_results(query, max_results)
+    
+    def _search_duckduckgo(self, query: str, max_results: int, deadline: Optional[Deadline] = None) -> List[Dict[str, str]]:
         """Search using DuckDuckGo Instant Answer API"""
         try:
             # Use DuckDuckGo's API endpoint
-            url = "https://api.duckduckgo.com/"
+            url = DUCKDUCKGO_URL
             params = {
                 'q': query,
                 'format': 'json',
@@ -49,7 +161,7 @@ class WebSearcher:
             }
             
             # Disable SSL verification as a workaround for certificate issues
-            response = self.session.get(url, params=params, timeout=10, verify=False)
+            response = self.session.get(url, params=params, timeout=stage_timeout(deadline, 10), verify=False)
             
             if response.status_code == 200:
                 data = response.json()
@@ -59,7 +171,7 @@ class WebSearcher:
                 if data.get('Abstract'):
                     results.append({
                         'title': data.get('Heading', 'DuckDuckGo Result'),
-                        'snippet': data['Abstract'][:200] + '...' if len(data['Abstract']) > 200 else data['Abstract'],
+                        'snippet': data['Abstract'],
                         'url': data.get('AbstractURL', '')
                     })
                 
@@ -67,7 +179,7 @@ class WebSearcher:
                 for topic in data.get('RelatedTopics', [])[:max_results-len(results)]:
                     if isinstance(topic, dict) and topic.get('Text'):
                         results.append({
-                            'title': topic.get('Text', '')[:50] + '...' if len(topic.get('Text', '')) > 50 else topic.get('Text', ''),
+                            'title': topic['Text'].split(' - ')[0],
                             'snippet': topic.get('Text', ''),
                             'url': topic.get('FirstURL', '')
                         })
@@ -76,15 +188,15 @@ class WebSearcher:
         except Exception as e:
             raise Exception(f"DuckDuckGo search failed: {e}")
         
-        return []
+        raise Exception(f"DuckDuckGo search failed: HTTP {response.status_code}")
     
-    def _search_google_custom(self, query: str, max_results: int) -> List[Dict[str, str]]:
+    def _search_google_custom(self, query: str, max_results: int, deadline: Optional[Deadline] = None) -> Optional[List[Dict[str, str]]]:
         """Search using Google Custom Search API (requires API key)"""
         # This would require Google API key and Custom Search Engine ID
-        # Skipping implementation for now
-        raise Exception("Google Custom Search not configured")
+        # Skipping implementation for now: not configured
+        return None
     
-    def _search_mock(self, query: str, max_results: int) -> List[Dict[str, str]]:
+    def _search_mock(self, query: str, max_results: int, deadline: Optional[Deadline] = None) -> List[Dict[str, str]]:
         """Fallback mock search for testing when APIs fail"""
         # Provide some generic helpful responses based on common queries
         query_lower = query.lower()
@@ -115,22 +227,14 @@ class WebSearcher:
                 'url': 'https://example.com/info'
             }]
     
-    def get_search_summary(self, query: str) -> str:
+    def get_search_summary(self, query: str, deadline: Optional[Deadline] = None) -> str:
         """Get a summary of search results formatted for AI processing"""
-        results = self.search(query, max_results=3)
+        results = self.search(query, max_results=3, deadline=deadline)
         
         if not results:
             return f"No search results found for: {query}"
         
-        summary = f"Web search results for '{query}':\n\n"
-        for i, result in enumerate(results, 1):
-            summary += f"{i}. {result['title']}\n"
-            summary += f"   {result['snippet']}\n"
-            if result.get('url'):
-                summary += f"   Source: {result['url']}\n"
-            summary += "\n"
-        
-        return summary
+        return build_summary(query, results)
 
 # Disable SSL warnings when verification is disabled
 import urllib3